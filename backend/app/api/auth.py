@@ -1,61 +1,158 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from datetime import timedelta
-from jose import JWTError, jwt
+from jose import JWTError
+from typing import Optional
+import os
 
-from ..database import get_db
+from ..database import run_db
 from ..models import models
 from .. import schemas
 from ..services import auth
+from ..services.rate_limit import RateLimiter, retry_after_header
+from ..services.user_cache import user_cache
+from ..services.worker_pool import WorkerPoolBusy
 
 router = APIRouter(tags=["auth"])
 
+# Login/registration attempts per minute per client address, and failed logins per account
+# from one client address; 0 disables
+LOGIN_RATE_PER_MINUTE = float(os.getenv("LOGIN_RATE_PER_MINUTE", "10"))
+LOGIN_RATE_BURST = int(os.getenv("LOGIN_RATE_BURST", "5"))
+
+client_limiter = RateLimiter(LOGIN_RATE_PER_MINUTE / 60, LOGIN_RATE_BURST)
+account_limiter = RateLimiter(LOGIN_RATE_PER_MINUTE / 60, LOGIN_RATE_BURST)
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Sessions for these run through run_db, off the event loop
+def _find_user(db: Session, email):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def _load_user(db: Session, token_data: schemas.TokenData):
+    if token_data.user_id is None:
+        row = _find_user(db, token_data.email)
+    else:
+        row = db.get(models.User, token_data.user_id)
+    return user_cache.put(row) if row is not None else None
+
+def _create_user(db: Session, email, hashed_password):
+    new_user = models.User(email=email, hashed_password=hashed_password)
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return schemas.User.model_validate(new_user)
+
+def _set_password_hash(db: Session, user_id, hashed_password):
+    db.get(models.User, user_id).hashed_password = hashed_password
+    db.commit()
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> schemas.User:
+    # Token claims and users are memoised, so most requests neither verify a signature
+    # nor open a DB session here
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        payload = auth.decode_access_token(token)
+        subject: str = payload.get("sub")
+        if subject is None:
             raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        if subject.isdigit():
+            token_data = schemas.TokenData(user_id=int(subject), email=payload.get("email"))
+        else:
+            # Tokens issued before they carried the user id
+            token_data = schemas.TokenData(email=subject)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+
+    user = user_cache.get(token_data.user_id) if token_data.user_id is not None else None
+    if user is None:
+        user = await run_db(_load_user, token_data)
     if user is None:
         raise credentials_exception
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Inactive user")
     return user
 
+def _websocket_token(websocket: WebSocket, token: Optional[str] = None) -> str:
+    # Browsers can't set headers on a WebSocket handshake, so ?token= is accepted too
+    authorization = websocket.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:]
+    return token or ""
+
+async def get_websocket_user(token: str = Depends(_websocket_token)) -> schemas.User:
+    try:
+        return await get_current_user(token)
+    except HTTPException as e:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=e.detail)
+
+def _check_rate(limiter, key):
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please retry later",
+            headers=retry_after_header(retry_after),
+        )
+
+def _hashing_busy():
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many logins in progress, please retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
 @router.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register_user(request: Request, user: schemas.UserCreate):
+    _check_rate(client_limiter, f"register:{request.client.host if request.client else ''}")
+    db_user = await run_db(_find_user, user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = auth.get_password_hash(user.password)
-    new_user = models.User(email=user.email, hashed_password=hashed_password)
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    try:
+        hashed_password = await auth.hash_password(user.password)
+    except WorkerPoolBusy:
+        raise _hashing_busy()
+    return await run_db(_create_user, user.email, hashed_password)
 
 @router.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+async def login_for_access_token(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+):
+    # Limit per client address, and failed attempts per account from that address, so neither
+    # a storm nor a targeted guess gets through, and nobody else's guessing locks the owner out
+    client = request.client.host if request.client else ""
+    _check_rate(client_limiter, f"login:{client}")
+    account_key = (form_data.username.lower(), client)
+    # Taken up front so concurrent guesses can't all get through; a successful login gives it back
+    _check_rate(account_limiter, account_key)
+    user = await run_db(_find_user, form_data.username)
+    valid, new_hash = False, None
+    if user:
+        try:
+            valid, new_hash = await auth.verify_and_update_password(form_data.password, user.hashed_password)
+        except WorkerPoolBusy:
+            # Not a failed attempt: the password was never checked
+            account_limiter.refund(account_key)
+            raise _hashing_busy()
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    account_limiter.refund(account_key)
+    if new_hash:
+        # Stored with an old bcrypt cost: upgrade it now that we know the password
+        await run_db(_set_password_hash, user.id, new_hash)
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
+        data={"sub": str(user.id), "email": user.email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
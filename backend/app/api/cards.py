@@ -1,33 +1,178 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.websockets import WebSocketState
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import Session
-from ..database import get_db
-from ..services.recognition import RecognitionService
+from typing import Optional
+from ..database import SessionLocal, get_db, run_db
+from ..services import card_import, collection_stats, job_queue
+from ..services.cascade import recognition_cascade
+from ..services.live_scan import LiveScanSession
+from ..services.card_cache import card_cache
+from ..services.scan_cache import scan_cache
+from ..services.recognition import batch_item
+from ..services.worker_pool import WorkerPoolBusy
 from .. import schemas
 from ..models import models
-from .auth import get_current_user
+from .auth import get_current_user, get_websocket_user
+
+import asyncio
+import base64
+import datetime
+import json
+import os
+import tempfile
+import time
 
 router = APIRouter(prefix="/cards", tags=["cards"])
 
-@router.post("/scan", response_model=schemas.ScanResponse)
+CARDS_PAGE_SIZE = int(os.getenv("CARDS_PAGE_SIZE", "100"))
+CARDS_MAX_PAGE_SIZE = int(os.getenv("CARDS_MAX_PAGE_SIZE", "1000"))
+# Photos accepted by one POST /cards/scan/batch
+SCAN_BATCH_MAX_IMAGES = int(os.getenv("SCAN_BATCH_MAX_IMAGES", "20"))
+# Longest a GET /cards/jobs/{id}?wait= request is held open, and how often it re-checks the job
+SCAN_JOB_MAX_WAIT = 30
+SCAN_JOB_WAIT_POLL_SECONDS = 0.2
+# Rows fetched from the server-side cursor per chunk of the NDJSON export
+EXPORT_BATCH_SIZE = 1000
+BULK_IMPORT_MAX_BYTES = int(os.getenv("BULK_IMPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+BULK_IMPORT_SPOOL_BYTES = 1024 * 1024
+
+_SUMMARY_COLUMNS = [getattr(models.Card, field) for field in schemas.CardSummary.model_fields]
+
+def _accepted(job_id):
+    return JSONResponse(
+        status_code=202,
+        content=schemas.JobAccepted(job_id=job_id, status=models.JobStatus.QUEUED.value).model_dump(),
+        headers={"Location": f"/cards/jobs/{job_id}"},
+    )
+
+@router.post("/scan", response_model=schemas.ScanResponse, responses={202: {"model": schemas.JobAccepted}})
 async def scan_card(
+    request: Request,
     file: UploadFile = File(...), 
+    defer: bool = False,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
-    service = RecognitionService(db)
     contents = await file.read()
-    result = await service.scan_card(contents)
+    if defer:
+        # Queued for a scan worker process; the client polls GET /cards/jobs/{id}
+        return _accepted(await run_db(job_queue.enqueue, current_user.id, "scan", [contents]))
+
+    service = request.app.state.services.recognition(db)
+    try:
+        result = await service.scan_card(contents, owner_id=current_user.id)
+    except WorkerPoolBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Scanner is busy, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
     
     if "error" in result:
         raise HTTPException(status_code=400, detail=result["error"])
         
     return result
 
+@router.post("/scan/batch", responses={202: {"model": schemas.JobAccepted}})
+async def scan_batch(
+    request: Request,
+    files: list[UploadFile] = File(...),
+    segment: bool = False,
+    defer: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # Streams one NDJSON line per card as it finishes, then a summary line.
+    # With segment=true each file is a binder-page photo that may hold several cards.
+    if len(files) > SCAN_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail=f"At most {SCAN_BATCH_MAX_IMAGES} images per batch")
+    images = [await file.read() for file in files]
+    if defer:
+        return _accepted(await run_db(job_queue.enqueue, current_user.id, "batch", images, segment=segment))
+
+    services = request.app.state.services
+
+    async def results():
+        db = SessionLocal()
+        try:
+            service = services.recognition(db)
+            count = 0
+            async for index, position, result in service.scan_batch(images, segment=segment):
+                count += 1
+                yield json.dumps(batch_item(index, position, result)) + "\n"
+            yield json.dumps({"done": True, "cards": count, "lookups_deduped": service.lookups_deduped}) + "\n"
+        finally:
+            db.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@router.websocket("/scan/live")
+async def scan_live(websocket: WebSocket, current_user: schemas.User = Depends(get_websocket_user)):
+    # Binary messages are camera frames (JPEG); the server answers each one it looks at with
+    # {"type": "frame", ...} and pushes {"type": "result", ...} once it has read the card.
+    # Authenticate with ?token= or an Authorization header on the handshake.
+    await websocket.accept()
+    services = websocket.app.state.services
+
+    async def recognize(warped, frame):
+        # A session per recognition, so an idle connection holds none
+        db = SessionLocal()
+        try:
+            return await services.recognition(db).recognize_card(warped, frame)
+        finally:
+            db.close()
+
+    async def receive():
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return None
+        return message.get("bytes") if message.get("bytes") is not None else message.get("text")
+
+    session = LiveScanSession(services.cv, recognize)
+    try:
+        await session.serve(receive, websocket.send_json)
+    except WebSocketDisconnect:
+        return
+    if websocket.client_state == WebSocketState.CONNECTED:
+        # Closed by the server, after LIVE_SCAN_IDLE_SECONDS without a frame
+        await websocket.close()
+
+@router.get("/jobs/{job_id}", response_model=schemas.ScanJob)
+async def get_scan_job(
+    job_id: str,
+    wait: float = Query(0, ge=0, le=SCAN_JOB_MAX_WAIT),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # wait > 0 long-polls: the response is held until the job finishes or the time is up
+    # Each check uses a short-lived session, so no connection is held while waiting
+    user_id = current_user.id
+    job = await run_db(job_queue.get, job_id, user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    deadline = time.monotonic() + wait
+    while job.status in (models.JobStatus.QUEUED.value, models.JobStatus.RUNNING.value) \
+            and time.monotonic() < deadline:
+        await asyncio.sleep(SCAN_JOB_WAIT_POLL_SECONDS)
+        job = await run_db(job_queue.get, job_id, user_id)
+
+    return schemas.ScanJob(
+        id=job.id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        result=json.loads(job.result) if job.result else None,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+    )
+
 @router.post("/", response_model=schemas.Card)
 def create_card(
     card: schemas.CardCreate, 
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
     db_card = models.Card(**card.dict())
     db_card.owner_id = current_user.id
@@ -36,15 +181,108 @@ def create_card(
     db.refresh(db_card)
     return db_card
 
-@router.get("/", response_model=list[schemas.Card])
+@router.post("/bulk", response_model=schemas.BulkImportResult)
+async def bulk_import_cards(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|csv)$"),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # Body is a JSON array of cards or a CSV with a header row (format, or else the Content-Type,
+    # says which). Bad rows are reported in "errors" and skipped; the others are imported.
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "json")
+    # Spooled to disk past BULK_IMPORT_SPOOL_BYTES, then parsed as a stream
+    body = tempfile.SpooledTemporaryFile(max_size=BULK_IMPORT_SPOOL_BYTES)
+    try:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > BULK_IMPORT_MAX_BYTES:
+                raise HTTPException(status_code=413, detail=f"At most {BULK_IMPORT_MAX_BYTES} bytes per import")
+            body.write(chunk)
+        body.seek(0)
+        return await run_db(card_import.import_cards, current_user.id, body, fmt)
+    finally:
+        body.close()
+
+def _encode_cursor(created_at, card_id):
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{card_id}".encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        created_at, card_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.datetime.fromisoformat(created_at), int(card_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@router.get("/", response_model=list[schemas.CardSummary])
 def get_cards(
+    response: Response,
+    limit: int = Query(CARDS_PAGE_SIZE, ge=1, le=CARDS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    current_user: schemas.User = Depends(get_current_user)
 ):
-    return db.query(models.Card).filter(models.Card.owner_id == current_user.id).all()
+    # Newest first, keyset-paginated on (created_at, id); the next page's cursor is in X-Next-Cursor
+    query = db.query(*_SUMMARY_COLUMNS).filter(models.Card.owner_id == current_user.id)
+    if cursor:
+        query = query.filter(tuple_(models.Card.created_at, models.Card.id) < _decode_cursor(cursor))
+    rows = query.order_by(models.Card.created_at.desc(), models.Card.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows
+
+@router.get("/stats", response_model=schemas.CollectionStats)
+def get_collection_stats(
+    top: int = Query(10, ge=0, le=100),
+    limit: int = Query(collection_stats.CARD_STATS_BREAKDOWN_LIMIT, ge=1, le=1000),
+    live: bool = False,
+    db: Session = Depends(get_db),
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # Value of the collection, per game/set/rarity (most valuable `limit` of each) and its `top` cards.
+    # Read from the per-user rollups unless disabled or ?live=true, which aggregates the cards table.
+    return collection_stats.collection_stats(
+        db, current_user.id, _SUMMARY_COLUMNS, top=top, limit=limit,
+        rollups=collection_stats.CARD_STATS_ROLLUPS and not live,
+    )
+
+def _export_rows(user_id):
+    # The request's session is closed before a streamed body is sent, so the stream opens its own
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(models.Card.__table__)
+            .where(models.Card.owner_id == user_id)
+            .order_by(models.Card.created_at, models.Card.id)
+            .execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE)
+        )
+        for partition in result.mappings().partitions():
+            yield "".join(json.dumps(dict(row), default=str) + "\n" for row in partition)
+    finally:
+        db.close()
+
+@router.get("/export")
+def export_cards(current_user: schemas.User = Depends(get_current_user)):
+    # One JSON object per line, streamed from a server-side cursor in constant memory
+    return StreamingResponse(
+        _export_rows(current_user.id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="cards.ndjson"'},
+    )
+
+@router.get("/cache-stats")
+def get_cache_stats(current_user: schemas.User = Depends(get_current_user)):
+    # Hit/miss counters of this worker's external card details and scan result caches
+    return {"card_details": card_cache.stats(), "scan_results": scan_cache.stats()}
+
+@router.get("/scan-stats")
+def get_scan_stats(current_user: schemas.User = Depends(get_current_user)):
+    # Runs, hits and average time of each recognition stage in this worker
+    return recognition_cascade.stats()
 
 @router.post("/train-ml")
-async def train_ml_model(current_user: models.User = Depends(get_current_user)):
+async def train_ml_model(current_user: schemas.User = Depends(get_current_user)):
     # Placeholder for ML training trigger
     # In a real app, this would start a background task
     return {"status": "Training started", "message": f"ML model training initiated for user {current_user.email}."}
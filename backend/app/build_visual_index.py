@@ -0,0 +1,71 @@
+"""Build the perceptual-hash index used for OCR-free card matching.
+
+Reference artwork is read from a directory of card scans named after their
+code, e.g. ``LOB-001.jpg`` or ``SV1-025.png``, and matched to ``CardReference``
+rows by normalised set code and card number (case and whitespace don't matter)::
+
+    poetry run python -m backend.app.build_visual_index ./artwork
+
+The server loads the resulting file (VISUAL_INDEX_PATH) at startup.
+"""
+import argparse
+import logging
+from pathlib import Path
+
+import cv2
+
+from .cv.hashing import dhash, phash
+from .cv.processor import CARD_HEIGHT, CARD_WIDTH
+from .cv.visual_index import VISUAL_INDEX_PATH, VisualIndex
+from .database import SessionLocal
+from .models import models
+from .services.reference_cache import normalize_code
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def build_visual_index(images_dir, out_path=VISUAL_INDEX_PATH):
+    db = SessionLocal()
+    try:
+        references = {
+            (set_code, card_number): ref_id
+            for ref_id, set_code, card_number in db.query(
+                models.CardReference.id, models.CardReference.set_code_norm, models.CardReference.card_number_norm
+            )
+        }
+    finally:
+        db.close()
+
+    ids, phashes, dhashes = [], [], []
+    skipped = 0
+    for path in sorted(Path(images_dir).iterdir()):
+        if path.suffix.lower() not in IMAGE_SUFFIXES or "-" not in path.stem:
+            continue
+        set_code, card_number = path.stem.rsplit("-", 1)
+        ref_id = references.get((normalize_code(set_code), normalize_code(card_number)))
+        img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if ref_id is None or img is None:
+            skipped += 1
+            continue
+
+        # Reference scans are already flat and upright; bring them to the size scans are warped to
+        card = cv2.resize(img, (CARD_WIDTH, CARD_HEIGHT), interpolation=cv2.INTER_AREA)
+        ids.append(ref_id)
+        phashes.append(phash(card))
+        dhashes.append(dhash(card))
+
+    index = VisualIndex(ids, phashes, dhashes)
+    index.save(out_path)
+    return len(index), skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images_dir")
+    parser.add_argument("--out", default=VISUAL_INDEX_PATH)
+    args = parser.parse_args()
+
+    indexed, skipped = build_visual_index(args.images_dir, args.out)
+    print(f"Indexed {indexed} reference images into {args.out} ({skipped} skipped).")
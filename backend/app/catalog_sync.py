@@ -0,0 +1,241 @@
+"""Bulk-load CardReference from full catalog dumps.
+
+Supported inputs are local files in the shape of the public APIs:
+
+* ``ygoprodeck`` - a ``cardinfo.php`` response, ``{"data": [card, ...]}``;
+  one reference per set printing in ``card_sets``.
+* ``pokemontcg`` - a ``/v2/cards`` response or a bare JSON array of cards
+  (as in the pokemon-tcg-data per-set files).
+
+Files are stream-parsed and upserted in batches. Progress is committed with
+each batch, so an interrupted sync resumes where it stopped, and a file whose
+checksum has not changed since its last completed sync is skipped::
+
+    poetry run python -m backend.app.catalog_sync ygoprodeck ./dumps/cardinfo.json
+    poetry run python -m backend.app.catalog_sync pokemontcg ./dumps/sets/*.json
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .database import SessionLocal
+from .migrations import migrate
+from .models import models
+from .services.reference_cache import normalize_code, reference_cache
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+_READ_CHUNK = 1 << 20
+
+
+def iter_json_array(fp, key="data"):
+    """Yield the elements of a JSON array one at a time without loading the whole file.
+
+    The array is either the top-level value or the value of ``key`` in a top-level object
+    (the first occurrence of ``"key"`` is assumed to be the top-level one).
+    """
+    decoder = json.JSONDecoder()
+    buf = fp.read(_READ_CHUNK)
+    pos = 0
+
+    def fill():
+        nonlocal buf, pos
+        chunk = fp.read(_READ_CHUNK)
+        buf = buf[pos:] + chunk
+        pos = 0
+        return bool(chunk)
+
+    # Locate the opening bracket of the array
+    while True:
+        stripped = buf.lstrip()
+        if stripped.startswith("["):
+            pos = len(buf) - len(stripped) + 1
+            break
+        marker = buf.find(f'"{key}"')
+        bracket = buf.find("[", marker) if marker != -1 else -1
+        if bracket != -1:
+            pos = bracket + 1
+            break
+        if not fill():
+            return
+
+    while True:
+        # Skip separators between elements
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buf) or not fill():
+                break
+        if pos >= len(buf) or buf[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if not fill():
+                raise
+            continue
+        pos = end
+        yield item
+        if pos > _READ_CHUNK:
+            buf, pos = buf[pos:], 0
+
+
+def _row_checksum(row):
+    return hashlib.sha1(f"{row['name']}\x1f{row['rarity']}".encode()).hexdigest()
+
+
+def ygoprodeck_rows(card):
+    for printing in card.get("card_sets") or []:
+        code = (printing.get("set_code") or "").upper()
+        if "-" not in code:
+            continue
+        set_code, card_number = code.split("-", 1)
+        yield {
+            "game": "Yu-Gi-Oh!",
+            "set_code": set_code,
+            "card_number": card_number,
+            "name": card.get("name"),
+            "rarity": printing.get("set_rarity"),
+        }
+
+
+def pokemontcg_rows(card):
+    set_id = (card.get("set") or {}).get("id") or card.get("id", "").rsplit("-", 1)[0]
+    if not set_id or not card.get("number"):
+        return
+    yield {
+        "game": "Pokemon",
+        "set_code": set_id.upper(),
+        "card_number": card["number"].upper(),
+        "name": card.get("name"),
+        "rarity": card.get("rarity"),
+    }
+
+
+SOURCES = {
+    "ygoprodeck": ygoprodeck_rows,
+    "pokemontcg": pokemontcg_rows,
+}
+
+
+def upsert_references(db: Session, rows):
+    """Insert or update CardReference rows by game and normalised code; returns rows written.
+
+    One executemany per call. Rows whose checksum is unchanged are left untouched.
+    Committing a write invalidates this process's reference cache.
+    """
+    unique = {}
+    for row in rows:
+        row = {
+            **row,
+            "set_code_norm": normalize_code(row["set_code"]),
+            "card_number_norm": normalize_code(row["card_number"]),
+            "checksum": _row_checksum(row),
+        }
+        # Postgres rejects one statement touching the same row twice
+        unique[(row["game"], row["set_code_norm"], row["card_number_norm"])] = row
+    if not unique:
+        return 0
+
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    table = models.CardReference.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["set_code_norm", "card_number_norm", "game"],
+        set_={"name": stmt.excluded.name, "rarity": stmt.excluded.rarity, "checksum": stmt.excluded.checksum},
+        where=table.c.checksum.is_distinct_from(stmt.excluded.checksum),
+    )
+    result = db.execute(stmt, list(unique.values()))
+    written = max(result.rowcount, 0)
+    if written:
+        # Only once the rows are visible to the session that reloads the cache
+        event.listen(db, "after_commit", lambda session: reference_cache.invalidate(), once=True)
+    return written
+
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_READ_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sync_file(db: Session, source, path, batch_size=BATCH_SIZE, force=False):
+    """Sync one dump file; returns ``(items_read, rows_written)``, or None if it was unchanged."""
+    to_rows = SOURCES[source]
+    key = f"{source}:{os.path.abspath(path)}"
+    checksum = file_checksum(path)
+
+    state = db.get(models.CatalogSyncState, key)
+    if state is None:
+        state = models.CatalogSyncState(source=key, items_done=0, rows_upserted=0)
+        db.add(state)
+    elif state.file_checksum == checksum and state.completed_at and not force:
+        return None
+    if state.file_checksum != checksum or force:
+        # New or changed file: start over (unchanged rows are skipped by their checksum)
+        state.file_checksum, state.items_done, state.rows_upserted, state.completed_at = checksum, 0, 0, None
+    db.commit()
+
+    resume_from = state.items_done
+    items, written, batch = 0, 0, []
+
+    def flush():
+        nonlocal written, batch
+        count = upsert_references(db, batch)
+        written += count
+        state.rows_upserted += count
+        state.items_done = items
+        state.updated_at = datetime.datetime.utcnow()
+        # Rows and progress commit together, so a crash can't skip or double-count a batch
+        db.commit()
+        batch = []
+
+    with open(path, "r", encoding="utf-8") as f:
+        for card in iter_json_array(f):
+            items += 1
+            if items <= resume_from:
+                continue
+            batch.extend(to_rows(card))
+            if len(batch) >= batch_size:
+                flush()
+    flush()
+
+    state.completed_at = datetime.datetime.utcnow()
+    db.commit()
+    return items, written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", choices=sorted(SOURCES))
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--force", action="store_true", help="re-read files even if unchanged")
+    args = parser.parse_args()
+
+    migrate()
+    db = SessionLocal()
+    try:
+        for path in args.paths:
+            start = time.perf_counter()
+            result = sync_file(db, args.source, path, args.batch_size, args.force)
+            if result is None:
+                print(f"{path}: unchanged since last sync, skipped.")
+                continue
+            items, written = result
+            elapsed = time.perf_counter() - start
+            print(f"{path}: {items} entries, {written} references written in {elapsed:.1f}s")
+    finally:
+        db.close()
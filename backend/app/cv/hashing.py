@@ -0,0 +1,33 @@
+import cv2
+import numpy as np
+
+
+def _gray(img):
+    return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+
+
+def _pack(bits):
+    # 64 booleans -> one unsigned 64-bit int, first bit most significant
+    return int(np.packbits(bits.astype(np.uint8)).view(">u8")[0])
+
+
+def phash(img):
+    """64-bit DCT perceptual hash: low frequencies above/below their median."""
+    small = cv2.resize(_gray(img), (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    # The DC term only encodes overall brightness, so it is left out of the median
+    return _pack(low > np.median(low[1:]))
+
+
+def dhash(img):
+    """64-bit difference hash: is each pixel brighter than its right neighbour."""
+    small = cv2.resize(_gray(img), (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def frame_hashes(image_bytes):
+    """(pHash, dHash) of a whole photo, decoded at 1/8 scale; None if undecodable."""
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is None:
+        return None
+    return phash(img), dhash(img)
@@ -0,0 +1,44 @@
+"""Text band positions on a canonical, upright card.
+
+Coordinates are fractions of the card's width/height so they work for any
+warp size. Bands are deliberately a little generous to absorb imperfect
+corner detection.
+"""
+
+
+class Band:
+    def __init__(self, x0, y0, x1, y1, psm=7):
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        # 7 = treat the crop as a single line of text
+        self.psm = psm
+
+    def crop(self, img):
+        h, w = img.shape[:2]
+        return img[int(h * self.y0):int(h * self.y1), int(w * self.x0):int(w * self.x1)]
+
+
+class CardLayout:
+    def __init__(self, game, name_band, code_bands):
+        self.game = game
+        self.name_band = name_band
+        self.code_bands = code_bands
+
+    @property
+    def bands(self):
+        return [self.name_band, *self.code_bands]
+
+
+LAYOUTS = {
+    # Name across the top, set number (e.g. LOB-EN001) right-aligned under the art box
+    "Yu-Gi-Oh!": CardLayout(
+        "Yu-Gi-Oh!",
+        name_band=Band(0.05, 0.035, 0.82, 0.115),
+        code_bands=[Band(0.58, 0.715, 0.95, 0.77)],
+    ),
+    # Name top-left; collector number bottom-left on modern cards, bottom-right on older ones
+    "Pokemon": CardLayout(
+        "Pokemon",
+        name_band=Band(0.06, 0.025, 0.68, 0.10),
+        code_bands=[Band(0.03, 0.90, 0.45, 0.97), Band(0.62, 0.90, 0.97, 0.97)],
+    ),
+}
@@ -1,76 +1,376 @@
 import cv2
 import numpy as np
 import pytesseract
-from PIL import Image
-import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .. import metrics
+from .hashing import dhash, phash
+from .layouts import LAYOUTS
+from .visual_index import get_visual_index
+
+try:
+    import tesserocr
+except ImportError:  # Optional, pytesseract (CLI) is used instead
+    tesserocr = None
+
+logger = logging.getLogger(__name__)
+
+# "auto" prefers the in-process engine when tesserocr and the language data are available
+OCR_BACKEND = os.getenv("OCR_BACKEND", "auto")
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Bands of one scan OCR'd in parallel; 1 keeps them sequential on the calling worker
+OCR_BAND_THREADS = int(os.getenv("OCR_BAND_THREADS", "1"))
+
+
+class OCRBackend:
+    name = "base"
+
+    def image_to_string(self, img, psm=3):
+        """OCR a grayscale/binary numpy image with the given Tesseract page segmentation mode."""
+        raise NotImplementedError
+
+    def __reduce__(self):
+        # Engines hold native handles; a worker process gets its own instance instead
+        return (get_ocr_backend, (self.name,))
+
+
+class PytesseractBackend(OCRBackend):
+    """Spawns the tesseract binary per call. Slow, but needs nothing beyond the CLI."""
+    name = "pytesseract"
+
+    def image_to_string(self, img, psm=3):
+        config = f"--psm {psm}" if psm != 3 else ""
+        return pytesseract.image_to_string(img, lang=OCR_LANG, config=config)
+
+
+class TesserocrBackend(OCRBackend):
+    """Persistent libtesseract engine, one per thread since TessBaseAPI is not thread-safe."""
+    name = "tesserocr"
+
+    def __init__(self, lang=OCR_LANG):
+        self.lang = lang
+        self._local = threading.local()
+
+    def _api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            # Loads the language model once for this worker thread
+            api = tesserocr.PyTessBaseAPI(lang=self.lang)
+            self._local.api = api
+        return api
+
+    def image_to_string(self, img, psm=3):
+        api = self._api()
+        api.SetPageSegMode(psm)
+        img = np.ascontiguousarray(img)
+        h, w = img.shape[:2]
+        channels = 1 if img.ndim == 2 else img.shape[2]
+        api.SetImageBytes(img.tobytes(), w, h, channels, w * channels)
+        return api.GetUTF8Text()
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def _tesserocr_available(lang):
+    if tesserocr is None:
+        return False
+    try:
+        _, languages = tesserocr.get_languages()
+    except RuntimeError:
+        return False
+    return lang in languages
+
+
+def get_ocr_backend(name=OCR_BACKEND):
+    """Process-wide OCR backend singleton for ``name`` ("auto", "tesserocr" or "pytesseract")."""
+    if name == "auto":
+        name = "tesserocr" if _tesserocr_available(OCR_LANG) else "pytesseract"
+
+    with _backends_lock:
+        backend = _backends.get(name)
+        if backend is None:
+            if name == "tesserocr":
+                if tesserocr is None:
+                    raise RuntimeError("OCR_BACKEND=tesserocr but tesserocr is not installed")
+                backend = TesserocrBackend()
+            elif name == "pytesseract":
+                backend = PytesseractBackend()
+            else:
+                raise ValueError(f"Unknown OCR backend: {name}")
+            logger.info(f"Using OCR backend: {name}")
+            _backends[name] = backend
+    return backend
+
+# Every detected card is warped to this size (63:88, the physical card ratio) so later stages
+# see a small, constant-size image regardless of the camera resolution
+CARD_WIDTH, CARD_HEIGHT = 630, 880
+# Contours are searched on a pyramid level no larger than this
+CARD_DETECT_MAX_SIDE = int(os.getenv("CARD_DETECT_MAX_SIDE", "800"))
+# Quads smaller than this fraction of the frame are not considered a card
+CARD_MIN_AREA = 0.1
+# On a binder page each card is much smaller; up to about 4x4 pockets per photo
+PAGE_MIN_CARD_AREA = 0.01
+# Short/long side ratio a quad needs to be taken for a card on a page (63:88 is about 0.72)
+CARD_RATIO_RANGE = (0.6, 0.85)
+
+_band_executor = None
+_band_executor_lock = threading.Lock()
+
+
+def _get_band_executor():
+    global _band_executor
+    if _band_executor is None:
+        with _band_executor_lock:
+            if _band_executor is None:
+                _band_executor = ThreadPoolExecutor(
+                    max_workers=OCR_BAND_THREADS, thread_name_prefix="ocr-band"
+                )
+    return _band_executor
+
+
+def sharpness(img):
+    """Variance of the Laplacian: high for crisp edges, low for motion blur or bad focus."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
 
 class CVProcessor:
-    def __init__(self):
-        # Tesseract configuration could be set here
-        pass
-
-    def process_image(self, image_bytes):
-        # Convert bytes to opencv image
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-        
+    def __init__(self, ocr=None):
+        self.ocr = ocr or get_ocr_backend()
+
+    def _ocr(self, img, psm=3):
+        with metrics.timer("ocr_seconds", backend=self.ocr.name):
+            return self.ocr.image_to_string(img, psm=psm)
+
+    @metrics.timed("cv_stage_seconds", stage="decode")
+    def _decode(self, image_bytes):
+        return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+    def detect_card(self, image_bytes):
+        """Decode a photo and return the card warped to CARD_WIDTH x CARD_HEIGHT, or None if undecodable."""
+        img = self._decode(image_bytes)
+
         if img is None:
             return None
-            
-        # 1. Card Detection & Perspective Correction
+
         warped = self._get_card_perspective(img)
         if warped is None:
-            warped = img # Fallback to original if warp fails
-            
-        processed_img = self._preprocess_for_ocr(warped)
-        
-        # 2. OCR
-        text = pytesseract.image_to_string(processed_img)
-        
-        return {
-            "text": text,
-            "image": warped
-        }
+            # Fallback: assume the user framed the card, but still shrink to the canonical size
+            warped = cv2.resize(img, (CARD_WIDTH, CARD_HEIGHT), interpolation=cv2.INTER_AREA)
+        return warped
+
+    @metrics.timed("cv_stage_seconds", stage="segment")
+    def segment_cards(self, image_bytes):
+        """Every card on a binder-page photo, warped and in reading order; None if undecodable.
+
+        A photo with no separable cards is treated as a single framed card.
+        """
+        img = self._decode(image_bytes)
+        if img is None:
+            return None
+
+        small = img
+        while max(small.shape[:2]) > CARD_DETECT_MAX_SIDE:
+            small = cv2.pyrDown(small)
+        scale = img.shape[1] / small.shape[1]
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        edged = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 75, 200)
+        # Close small breaks in the outlines of sleeved cards
+        edged = cv2.dilate(edged, None)
+        cnts, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
+        min_area = PAGE_MIN_CARD_AREA * small.shape[0] * small.shape[1]
+
+        quads = []
+        for c in sorted(cnts, key=cv2.contourArea, reverse=True):
+            area = cv2.contourArea(c)
+            if area < min_area:
+                break
+            approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+            if len(approx) != 4 or not cv2.isContourConvex(approx):
+                continue
+            w, h = cv2.minAreaRect(approx)[1]
+            if not CARD_RATIO_RANGE[0] <= min(w, h) / max(w, h) <= CARD_RATIO_RANGE[1]:
+                continue
+            quads.append((area, approx.reshape(4, 2).astype(np.float32)))
+
+        def contains(quad, point):
+            return cv2.pointPolygonTest(quad, (float(point[0]), float(point[1])), False) >= 0
+
+        kept = []
+        for area, quad in quads:
+            # A pocket sheet or the page itself surrounds several cards; skip it
+            inner = sum(1 for a, q in quads if a < area / 2 and contains(quad, q.mean(axis=0)))
+            if inner >= 2:
+                continue
+            # Inner outline of a card that is already kept (sleeve, printed border)
+            if any(contains(k, quad.mean(axis=0)) for k in kept):
+                continue
+            kept.append(quad)
+
+        if not kept:
+            warped = self._get_card_perspective(img)
+            if warped is None:
+                warped = cv2.resize(img, (CARD_WIDTH, CARD_HEIGHT), interpolation=cv2.INTER_AREA)
+            return [warped]
+
+        # Reading order: rows top to bottom (a row starts within half a card height), then left to right
+        half_card = np.median([np.ptp(q[:, 1]) for q in kept]) / 2
+        kept.sort(key=lambda q: q[:, 1].min())
+        rows = []
+        for quad in kept:
+            if rows and quad[:, 1].min() - rows[-1][0][:, 1].min() <= half_card:
+                rows[-1].append(quad)
+            else:
+                rows.append([quad])
+        ordered = [quad for row in rows for quad in sorted(row, key=lambda q: q[:, 0].min())]
+        return [self._four_point_transform(img, quad * scale) for quad in ordered]
+
+    @metrics.timed("cv_stage_seconds", stage="visual_match")
+    def match_visual(self, card_img):
+        """Look the warped card up in the perceptual-hash index: {"reference_id", "distance"} or None."""
+        index = get_visual_index()
+        if not len(index):
+            return None
+        hit = index.query(phash(card_img), dhash(card_img))
+        if hit is None:
+            return None
+        reference_id, distance = hit
+        return {"reference_id": reference_id, "distance": distance}
+
+    def read_code(self, img, accept, games=None):
+        """OCR code bands one at a time, stopping at the first whose text ``accept`` takes.
+
+        ``games`` orders the layouts tried (all of them by default). Returns ``{"game", "text",
+        "ocr_calls"}``; ``game`` is None when no band was accepted, ``text`` then holds all that was read.
+        """
+        layouts = [LAYOUTS[game] for game in games] if games else list(LAYOUTS.values())
+        texts = []
+        for layout in layouts:
+            for band in layout.code_bands:
+                text = self._ocr(self._preprocess_band(band.crop(img)), psm=band.psm).strip()
+                texts.append(text)
+                if accept(text):
+                    return {"game": layout.game, "text": text, "ocr_calls": len(texts)}
+        return {"game": None, "text": "\n".join(filter(None, texts)), "ocr_calls": len(texts)}
+
+    def read_names(self, img, games=None):
+        """OCR the name band of each layout (or just those of ``games``): {game: name}."""
+        layouts = [LAYOUTS[game] for game in games] if games else list(LAYOUTS.values())
+
+        def ocr(layout):
+            band = layout.name_band
+            return self._ocr(self._preprocess_band(band.crop(img)), psm=band.psm).strip()
+
+        if OCR_BAND_THREADS > 1 and len(layouts) > 1:
+            names = list(_get_band_executor().map(ocr, layouts))
+        else:
+            names = [ocr(layout) for layout in layouts]
+        return {layout.game: name for layout, name in zip(layouts, names)}
+
+    def read_full(self, img):
+        """OCR the whole card: slow, the last resort when no band could be read."""
+        return self._ocr(self._preprocess_for_ocr(img))
+
+    @metrics.timed("cv_stage_seconds", stage="preprocess")
+    def _preprocess_band(self, crop):
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY)
+        # Tesseract reads best with glyphs around 30px tall; small bands are upscaled first
+        if gray.shape[0] < 64:
+            gray = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+        return cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
 
     def _get_card_perspective(self, img):
-        # Find card contour and warp
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        corners = self._find_card_quad(img)
+        if corners is None:
+            return None
+        return self._four_point_transform(img, corners)
+
+    @metrics.timed("cv_stage_seconds", stage="detect")
+    def _find_card_quad(self, img):
+        # Find card contour on a downscaled pyramid level; corners are in full-resolution pixels
+        small = img
+        while max(small.shape[:2]) > CARD_DETECT_MAX_SIDE:
+            small = cv2.pyrDown(small)
+        scale = img.shape[1] / small.shape[1]
+
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
         blur = cv2.GaussianBlur(gray, (5, 5), 0)
         edged = cv2.Canny(blur, 75, 200)
         
-        cnts, _ = cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        cnts, _ = cv2.findContours(edged, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         cnts = sorted(cnts, key=cv2.contourArea, reverse=True)[:5]
+        min_area = CARD_MIN_AREA * small.shape[0] * small.shape[1]
         
         for c in cnts:
+            if cv2.contourArea(c) < min_area:
+                break
             peri = cv2.arcLength(c, True)
             approx = cv2.approxPolyDP(c, 0.02 * peri, True)
             
             if len(approx) == 4:
-                # Warp logic would go here (simplified)
-                return self._four_point_transform(img, approx.reshape(4, 2))
+                return approx.reshape(4, 2).astype(np.float32) * scale
         return None
 
+    def inspect_frame(self, image_bytes):
+        """Cheap per-frame check for live scanning: where the card is and how sharp it is.
+
+        Returns None if the frame is undecodable or shows no card, else ``{"warped", "corners",
+        "sharpness"}``: corners in reading order as fractions of the frame size, sharpness the
+        variance of the Laplacian of the card (higher is sharper).
+        """
+        img = self._decode(image_bytes)
+        if img is None:
+            return None
+        corners = self._find_card_quad(img)
+        if corners is None:
+            return None
+        warped = self._four_point_transform(img, corners)
+        h, w = img.shape[:2]
+        return {
+            "warped": warped,
+            "corners": self._order_points(corners) / np.array([w, h], dtype=np.float32),
+            "sharpness": sharpness(warped),
+        }
+
+    @metrics.timed("cv_stage_seconds", stage="warp")
     def _four_point_transform(self, image, pts):
-        # Simplified placeholder for perspective transform
-        # In a real app, use cv2.getPerspectiveTransform and cv2.warpPerspective
-        return image 
+        rect = self._order_points(pts)
+        tl, tr, br, bl = rect
+        width = max(np.linalg.norm(br - bl), np.linalg.norm(tr - tl))
+        height = max(np.linalg.norm(tr - br), np.linalg.norm(tl - bl))
+        if width > height:
+            # Card lies sideways: rotate the corner order so it comes out portrait
+            rect = np.array([tr, br, bl, tl], dtype=np.float32)
+
+        dst = np.array([
+            [0, 0],
+            [CARD_WIDTH - 1, 0],
+            [CARD_WIDTH - 1, CARD_HEIGHT - 1],
+            [0, CARD_HEIGHT - 1],
+        ], dtype=np.float32)
+        M = cv2.getPerspectiveTransform(rect, dst)
+        return cv2.warpPerspective(image, M, (CARD_WIDTH, CARD_HEIGHT))
 
+    def _order_points(self, pts):
+        # top-left has the smallest x+y, bottom-right the largest; top-right the smallest y-x
+        rect = np.zeros((4, 2), dtype=np.float32)
+        s = pts.sum(axis=1)
+        diff = np.diff(pts, axis=1).ravel()
+        rect[0] = pts[np.argmin(s)]
+        rect[2] = pts[np.argmax(s)]
+        rect[1] = pts[np.argmin(diff)]
+        rect[3] = pts[np.argmax(diff)]
+        return rect
+
+    @metrics.timed("cv_stage_seconds", stage="preprocess")
     def _preprocess_for_ocr(self, img):
         gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
         # Thresholding, noise reduction, etc.
         thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
         return thresh
-
-    def extract_card_code(self, img):
-        # Failsafe path: Focus on typical card code locations (bottom/corners)
-        h, w = img.shape[:2]
-        # Heuristic: Card codes are often in the bottom 20%
-        bottom_region = img[int(h*0.80):h, 0:w]
-        
-        gray = cv2.cvtColor(bottom_region, cv2.COLOR_BGR2GRAY)
-        # Binarize for better OCR
-        thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-        
-        text = pytesseract.image_to_string(thresh, config='--psm 6') # Assume sparse text
-        
-        return text
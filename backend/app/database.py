@@ -1,17 +1,64 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+import asyncio
 import os
 
+from . import metrics
+
 SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
-# Only use check_same_thread for SQLite
-connect_args = {"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+# Connection pool (Postgres etc.; file-based SQLite uses the same QueuePool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds before a pooled connection is replaced, below typical server/proxy idle cut-offs
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# SQLite: WAL lets readers run alongside the single writer; 0 keeps the rollback journal.
+# The journal mode is set once by a migration, the rest of the pragmas on every connection
+SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# How long a writer waits for the lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "15"))
+# Serve run_db() through an async engine (needs aiosqlite / asyncpg installed)
+DATABASE_ASYNC = os.getenv("DATABASE_ASYNC", "0") == "1"
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        # synchronous=NORMAL is durable across crashes in WAL mode
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args=connect_args
-)
+def make_engine(url=SQLALCHEMY_DATABASE_URL, **kwargs):
+    """Engine with this deployment's pool settings, plus the SQLite pragmas for SQLite URLs."""
+    if url.startswith("sqlite"):
+        # Only use check_same_thread for SQLite
+        options = {"connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT}}
+    else:
+        options = {"pool_pre_ping": True}
+    if ":memory:" not in url:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    options.update(kwargs)
+    new_engine = create_engine(url, **options)
+    if url.startswith("sqlite"):
+        event.listen(new_engine, "connect", _set_sqlite_pragmas)
+    if metrics.METRICS_ENABLED or metrics.SERVER_TIMING:
+        metrics.instrument_engine(new_engine)
+    return new_engine
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -22,3 +69,50 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def _async_url(url):
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith(("postgresql:", "postgres:")):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+
+AsyncSessionLocal = None
+if DATABASE_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    async_engine = create_async_engine(
+        _async_url(SQLALCHEMY_DATABASE_URL),
+        **({"connect_args": {"timeout": SQLITE_BUSY_TIMEOUT}} if SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+           else {"pool_pre_ping": True}),
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+    if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    if metrics.METRICS_ENABLED or metrics.SERVER_TIMING:
+        metrics.instrument_engine(async_engine.sync_engine)
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def run_db(fn, *args, **kwargs):
+    """Run ``fn(session, *args)`` from async code without blocking the event loop.
+
+    With DATABASE_ASYNC the call runs on an AsyncSession (``run_sync``), otherwise on a
+    worker thread with a regular session. The session is closed afterwards, so return
+    plain values or objects whose attributes are already loaded.
+    """
+    with metrics.timer("db_session_seconds", fn=fn.__name__):
+        if AsyncSessionLocal is not None:
+            async with AsyncSessionLocal() as session:
+                return await session.run_sync(lambda sync_session: fn(sync_session, *args, **kwargs))
+
+        def call():
+            with SessionLocal() as session:
+                return fn(session, *args, **kwargs)
+
+        return await asyncio.to_thread(call)
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
-from .database import SessionLocal, engine
-from .models import models
+from .catalog_sync import upsert_references
+from .migrations import migrate
+from .database import SessionLocal
 
 def load_reference_data():
     db = SessionLocal()
@@ -22,21 +23,13 @@ def load_reference_data():
         }
     ]
     
-    for card_data in sample_cards:
-        # Check if already exists
-        exists = db.query(models.CardReference).filter(
-            models.CardReference.set_code == card_data["set_code"],
-            models.CardReference.card_number == card_data["card_number"]
-        ).first()
-        
-        if not exists:
-            card = models.CardReference(**card_data)
-            db.add(card)
+    # Same set-based upsert the catalog sync uses, instead of one SELECT per row
+    upsert_references(db, sample_cards)
     
     db.commit()
     db.close()
 
 if __name__ == "__main__":
-    models.Base.metadata.create_all(bind=engine)
+    migrate()
     load_reference_data()
     print("Sample reference data loaded.")
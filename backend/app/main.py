@@ -1,12 +1,30 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .database import engine
-from .models import models
+from fastapi.responses import PlainTextResponse
+from . import metrics
+from .database import SessionLocal
 from .api import cards, auth
+from .migrations import prepare_database
+from .services.auth import password_pool
+from .services.container import ServiceContainer
+from .services.worker_pool import cv_pool
 
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare_database()
+    # Engines, clients and indexes are built once here and shared by every request
+    db = SessionLocal()
+    try:
+        app.state.services = ServiceContainer().warm_up(db)
+    finally:
+        db.close()
+    yield
+    cv_pool.shutdown()
+    password_pool.shutdown()
+    await app.state.services.aclose()
 
-app = FastAPI(title="CardScope API")
+app = FastAPI(title="CardScope API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -14,11 +32,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+if metrics.METRICS_ENABLED or metrics.SERVER_TIMING:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 app.include_router(auth.router)
 app.include_router(cards.router)
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to CardScope API"}
+
+if metrics.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def read_metrics():
+        # Prometheus text format, for scraping
+        return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,266 @@
+"""Counters and latency histograms, exported in the Prometheus text format on ``/metrics``.
+
+Code under measurement uses ``timer(name, **labels)`` (a context manager), the ``timed``
+decorator, ``observe`` or ``inc``. With METRICS_ENABLED=0 and no Server-Timing request in
+progress these return before touching a lock or the clock.
+
+With SERVER_TIMING=1 every response carries a ``Server-Timing`` header summing the timers
+that ran for that request (``decode;dur=4.1, ocr_tesserocr;dur=38.0, ...``), so browser
+dev tools show where a scan's time went. Timers run on the CV thread pool and in
+``run_db`` count towards the request; with CV_EXECUTOR=process the CV internals happen in
+other processes and only the pool job as a whole is seen.
+
+Each API process keeps its own registry, like the caches' ``stats()``.
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Upper bounds in seconds: sub-millisecond lookups up to multi-second scans
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_request_seconds": "HTTP request latency by route and status",
+    "cv_stage_seconds": "Time in each CV step (decode, detect, warp, preprocess, visual_match, segment)",
+    "ocr_seconds": "Time per OCR engine call",
+    "recognition_seconds": "Time to recognise a card, by the cascade stage that settled it",
+    "recognition_stage_seconds": "Time in each recognition cascade stage",
+    "recognition_stage_total": "Recognition stage runs by outcome (hit, weak, miss, error)",
+    "external_api_seconds": "Upstream card API requests by upstream and status",
+    "s3_seconds": "S3 requests by operation",
+    "s3_uploads_total": "Background S3 uploads by outcome",
+    "db_query_seconds": "SQL statement execution time by statement type",
+    "db_session_seconds": "Time of run_db calls, by function",
+    "worker_pool_job_seconds": "Worker pool jobs from submission to completion",
+    "worker_pool_rejected_total": "Jobs turned away by a saturated worker pool",
+}
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class _Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> _Histogram
+        self._counters = {}  # (name, labels) -> float
+
+    def observe(self, name, value, labels):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount, labels):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        for kind, series in (("histogram", histograms), ("counter", counters)):
+            for name in sorted({name for name, _ in series}):
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for (metric, labels), value in sorted(series.items()):
+                    if metric != name:
+                        continue
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(labels)} {value:g}")
+                        continue
+                    counts, total, buckets = value
+                    cumulative = 0
+                    for bound, count in zip((*buckets, "+Inf"), counts):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+registry = Registry()
+
+
+class _RequestTimings:
+    # Per-request totals for the Server-Timing header; timers may run on worker threads
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {}
+
+    def add(self, key, seconds):
+        with self._lock:
+            self.totals[key] = self.totals.get(key, 0.0) + seconds
+
+    def header(self, total):
+        with self._lock:
+            items = sorted(self.totals.items(), key=lambda item: -item[1])
+        return ", ".join(f"{key};dur={seconds * 1000:.1f}" for key, seconds in [*items, ("total", total)])
+
+
+def active():
+    """True when measurements are kept, globally or for the current request's Server-Timing."""
+    return METRICS_ENABLED or _request_timings.get() is not None
+
+
+def observe(name, seconds, **labels):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add("_".join([name.removesuffix("_seconds"), *map(str, labels.values())]), seconds)
+    if METRICS_ENABLED:
+        registry.observe(name, seconds, tuple(sorted(labels.items())))
+
+
+def inc(name, amount=1, **labels):
+    if METRICS_ENABLED:
+        registry.inc(name, amount, tuple(sorted(labels.items())))
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_TIMER = _NoTimer()
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+def timer(name, **labels):
+    """``with timer("ocr_seconds", backend="tesserocr"):`` observes the block's duration."""
+    if not active():
+        return _NO_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator form of ``timer`` for plain and async functions."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(name, **labels):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def instrument_engine(engine):
+    """Time every SQL statement run through ``engine``, labelled by its verb (select, insert, ...)."""
+    from sqlalchemy import event
+
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start"].pop()
+        if active():
+            verb = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else "other"
+            observe("db_query_seconds", time.perf_counter() - start, statement=verb)
+
+    event.listen(engine, "before_cursor_execute", before)
+    event.listen(engine, "after_cursor_execute", after)
+
+    def failed(context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get("query_start"):
+            context.connection.info["query_start"].pop()
+
+    event.listen(engine, "handle_error", failed)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each HTTP request by route, and adding Server-Timing when enabled."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        timings = _RequestTimings() if SERVER_TIMING else None
+        token = _request_timings.set(timings) if timings is not None else None
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timings is not None:
+                    header = timings.header(time.perf_counter() - start).encode()
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                _request_timings.reset(token)
+            if METRICS_ENABLED:
+                route = scope.get("route")
+                # Route templates, not raw paths, so IDs don't explode the label set
+                path = getattr(route, "path", None) or "unmatched"
+                registry.observe("http_request_seconds", time.perf_counter() - start,
+                                 (("method", scope["method"]), ("route", path), ("status", str(status))))
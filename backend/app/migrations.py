@@ -0,0 +1,308 @@
+"""Schema migrations, applied in order and recorded in ``schema_migrations``.
+
+Run them as a deploy step, before starting the API and scan workers::
+
+    poetry run python -m backend.app.migrations
+    poetry run python -m backend.app.migrations --status
+
+With ``DB_AUTO_MIGRATE=1`` (the default, convenient for the local SQLite setup) the
+API and scan workers apply pending migrations themselves on startup. Set it to 0 in
+production so several processes never race to migrate; they then refuse to start
+against an out-of-date schema.
+
+Each step carries its own DDL rather than reading ``models``, so a database built from
+scratch ends up exactly like one upgraded step by step. Changing the models therefore
+always means appending a step.
+"""
+import argparse
+import datetime
+import logging
+import os
+
+from sqlalchemy import (
+    Column, DateTime, Float, ForeignKey, Index, Integer, LargeBinary, MetaData, String, Table, Text, bindparam,
+    column, inspect, select, table, text,
+)
+
+from .database import SQLITE_WAL, engine
+from .services import collection_stats
+from .services.prices import DEFAULT_CURRENCY, to_cents
+from .services.reference_cache import normalize_code
+
+logger = logging.getLogger(__name__)
+
+DB_AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "1") == "1"
+
+_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations", _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# The tables of migration 1, as they were at the first versioned release
+_v1 = MetaData()
+Table(
+    "users", _v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, unique=True, index=True),
+    Column("hashed_password", String),
+    Column("is_active", Integer),
+)
+Table(
+    "cards", _v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("name", String),
+    Column("game", String),
+    Column("set_code", String),
+    Column("card_number", String),
+    Column("rarity", String),
+    Column("price", String),
+    Column("description", String),
+    Column("image_url", String),
+    Column("image_path", String),
+    Column("confidence", Float),
+    Column("created_at", DateTime),
+    Index("ix_cards_owner_created", "owner_id", "created_at"),
+)
+Table(
+    "card_reference", _v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("game", String),
+    Column("set_code", String),
+    Column("card_number", String),
+    Column("name", String),
+    Column("rarity", String),
+    Column("set_code_norm", String),
+    Column("card_number_norm", String),
+    Column("checksum", String),
+    Index("ux_card_reference_code", "game", "set_code", "card_number", unique=True),
+    Index("ix_card_reference_code_norm", "set_code_norm", "card_number_norm"),
+)
+Table(
+    "catalog_sync_state", _v1,
+    Column("source", String, primary_key=True),
+    Column("file_checksum", String),
+    Column("items_done", Integer),
+    Column("rows_upserted", Integer),
+    Column("completed_at", DateTime, nullable=True),
+    Column("updated_at", DateTime),
+)
+Table(
+    "scan_jobs", _v1,
+    Column("id", String, primary_key=True),
+    Column("owner_id", Integer, ForeignKey("users.id")),
+    Column("kind", String),
+    Column("segment", Integer),
+    Column("status", String),
+    Column("attempts", Integer),
+    Column("locked_by", String, nullable=True),
+    Column("locked_until", DateTime, nullable=True),
+    Column("result", Text, nullable=True),
+    Column("error", String, nullable=True),
+    Column("created_at", DateTime),
+    Column("started_at", DateTime, nullable=True),
+    Column("finished_at", DateTime, nullable=True),
+    Index("ix_scan_jobs_status_created", "status", "created_at"),
+)
+Table(
+    "scan_job_images", _v1,
+    Column("job_id", String, ForeignKey("scan_jobs.id"), primary_key=True),
+    Column("position", Integer, primary_key=True),
+    Column("data", LargeBinary),
+)
+Table(
+    "scan_metadata", _v1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("card_id", Integer),
+    Column("scan_method", String),
+    Column("confidence", Float),
+    Column("timestamp", DateTime),
+)
+
+
+# Added by migration 2; users only as the foreign key's target
+_v2 = MetaData()
+Table("users", _v2, Column("id", Integer, primary_key=True))
+_collection_rollups = Table(
+    "collection_rollups", _v2,
+    Column("owner_id", Integer, ForeignKey("users.id"), primary_key=True),
+    Column("dimension", String, primary_key=True),
+    Column("key", String, primary_key=True),
+    Column("currency", String, primary_key=True),
+    Column("card_count", Integer, default=0),
+    Column("priced_count", Integer, default=0),
+    Column("value_cents", Integer, default=0),
+)
+
+
+def _create_index(conn, name, table_name, *columns, unique=False):
+    # Unless it already exists, like CREATE INDEX IF NOT EXISTS
+    stub = Table(table_name, MetaData(), *(Column(name) for name in columns))
+    Index(name, *(stub.c[name] for name in columns), unique=unique).create(bind=conn, checkfirst=True)
+
+
+def _initial_schema(conn):
+    """Tables as of the first versioned release, plus the pieces older databases predate."""
+    _v1.create_all(bind=conn)
+    columns = {c["name"] for c in inspect(conn).get_columns("card_reference")}
+    for column in ("checksum", "set_code_norm", "card_number_norm"):
+        if column not in columns:
+            conn.execute(text(f"ALTER TABLE card_reference ADD COLUMN {column} VARCHAR"))
+    # Backfill the normalised code of rows written before those columns existed
+    table = _v1.tables["card_reference"]
+    rows = conn.execute(
+        table.select().with_only_columns(table.c.id, table.c.set_code, table.c.card_number)
+        .where(table.c.set_code_norm.is_(None))
+    ).all()
+    if rows:
+        conn.execute(
+            table.update().where(table.c.id == bindparam("ref_id")),
+            [{"ref_id": ref_id, "set_code_norm": normalize_code(set_code),
+              "card_number_norm": normalize_code(card_number)} for ref_id, set_code, card_number in rows],
+        )
+    # create_all skips indexes of tables that already exist
+    for v1_table in _v1.sorted_tables:
+        for index in v1_table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _integer_prices(conn):
+    """Card prices move from a display string to integer cents, a currency and a timestamp."""
+    cards = table("cards", column("id"), column("price_cents"), column("currency"), column("price_updated_at"),
+                  column("created_at"))
+    columns = {c["name"] for c in inspect(conn).get_columns("cards")}
+    for name, type_ in (("price_cents", Integer()), ("currency", String()), ("price_updated_at", DateTime())):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE cards ADD COLUMN {name} {type_.compile(dialect=conn.dialect)}"))
+    if "price" in columns:
+        rows = conn.execute(text("SELECT id, price FROM cards WHERE price IS NOT NULL")).all()
+        updates, unparseable = [], 0
+        for card_id, price in rows:
+            try:
+                cents = to_cents(price)
+            except ValueError:
+                cents, unparseable = None, unparseable + 1
+            if cents is not None:
+                updates.append({"card_id": card_id, "price_cents": cents})
+        if updates:
+            conn.execute(cards.update().where(cards.c.id == bindparam("card_id")), updates)
+            # Existing prices are as old as the card they were scanned with
+            conn.execute(cards.update().where(cards.c.price_cents.is_not(None), cards.c.price_updated_at.is_(None))
+                         .values(price_updated_at=cards.c.created_at))
+        if unparseable:
+            logger.warning(f"{unparseable} card prices could not be parsed and were dropped")
+        conn.execute(text("ALTER TABLE cards DROP COLUMN price"))
+    conn.execute(cards.update().where(cards.c.currency.is_(None)).values(currency=DEFAULT_CURRENCY))
+    _collection_rollups.create(bind=conn, checkfirst=True)
+    collection_stats.rebuild(conn)
+
+
+def _cards_code_index(conn):
+    """The price refresh groups and updates cards by their code."""
+    _create_index(conn, "ix_cards_code", "cards", "game", "set_code", "card_number")
+
+
+def _cards_price_index(conn):
+    """GET /cards/stats reads a user's most valuable cards in index order."""
+    # Databases that ran migration 2 before this step was split out already have it
+    _create_index(conn, "ix_cards_owner_price", "cards", "owner_id", "price_cents")
+
+
+def _unique_reference_codes(conn):
+    """Catalog codes are unique per game once normalised; catalog sync upserts on that key."""
+    refs = table("card_reference", column("id"), column("set_code"), column("card_number"),
+                 column("set_code_norm"), column("card_number_norm"))
+    rows = conn.execute(
+        select(refs.c.id, refs.c.set_code, refs.c.card_number).where(
+            (refs.c.set_code_norm.is_(None)) | (refs.c.card_number_norm.is_(None)))
+    ).all()
+    if rows:
+        conn.execute(
+            refs.update().where(refs.c.id == bindparam("ref_id")),
+            [{"ref_id": ref_id, "set_code_norm": normalize_code(set_code),
+              "card_number_norm": normalize_code(card_number)} for ref_id, set_code, card_number in rows],
+        )
+    # Spellings of one code (e.g. "lob" and "LOB") were separate rows; the oldest one stays
+    removed = conn.execute(text(
+        "DELETE FROM card_reference WHERE id NOT IN "
+        "(SELECT MIN(id) FROM card_reference GROUP BY game, set_code_norm, card_number_norm)"
+    )).rowcount
+    if removed:
+        logger.warning(f"Removed {removed} card references duplicating another one's normalised code")
+    for name in ("ix_card_reference_code_norm", "ux_card_reference_code"):
+        conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    # Code first, so lookups by code alone (any game) use it too
+    _create_index(conn, "ux_card_reference_code_norm", "card_reference",
+                  "set_code_norm", "card_number_norm", "game", unique=True)
+
+
+def _sqlite_wal(conn):
+    """SQLite databases switch to the write-ahead log (SQLITE_WAL=0 leaves the rollback journal)."""
+    # Persistent in the file, so it is set once here; the per-connection pragmas stay in database.py
+    if conn.dialect.name == "sqlite" and SQLITE_WAL:
+        conn.exec_driver_sql("PRAGMA journal_mode=WAL")
+
+
+# (version, description, function(connection)); append only, never edit an applied step
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "integer card prices and collection rollups", _integer_prices),
+    (3, "index cards by code", _cards_code_index),
+    (4, "SQLite write-ahead log", _sqlite_wal),
+    (5, "index cards by owner and price", _cards_price_index),
+    (6, "unique normalised card reference codes", _unique_reference_codes),
+]
+
+
+def current_version(bind=engine):
+    with bind.connect() as conn:
+        if not inspect(conn).has_table("schema_migrations"):
+            return 0
+        return conn.execute(select(schema_migrations.c.version).order_by(
+            schema_migrations.c.version.desc()).limit(1)).scalar() or 0
+
+
+def pending(bind=engine):
+    version = current_version(bind)
+    return [step for step in MIGRATIONS if step[0] > version]
+
+
+def migrate(bind=engine):
+    """Apply pending migrations, each in its own transaction; returns the versions applied."""
+    _metadata.create_all(bind=bind)
+    applied = []
+    for version, description, step in pending(bind):
+        with bind.begin() as conn:
+            step(conn)
+            conn.execute(schema_migrations.insert().values(
+                version=version, applied_at=datetime.datetime.utcnow()))
+        logger.info(f"Applied migration {version}: {description}")
+        applied.append(version)
+    return applied
+
+
+def prepare_database(bind=engine):
+    """Startup check for the API and scan workers: migrate, or fail if that is left to a deploy step."""
+    if DB_AUTO_MIGRATE:
+        migrate(bind)
+        return
+    missing = pending(bind)
+    if missing:
+        raise RuntimeError(
+            f"Database schema is behind by {len(missing)} migration(s); run `python -m backend.app.migrations`"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="show the schema version without migrating")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.status:
+        print(f"Schema version {current_version()} of {MIGRATIONS[-1][0]}")
+    else:
+        applied = migrate()
+        print(f"Applied migrations: {applied}" if applied else "Schema is up to date.")
@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, Enum, ForeignKey, Index, LargeBinary, Text
 from sqlalchemy.orm import relationship
 from ..database import Base
+from ..services.prices import DEFAULT_CURRENCY, format_cents, to_cents
 import datetime
 import enum
 
@@ -29,7 +30,9 @@ class Card(Base):
     set_code = Column(String)
     card_number = Column(String)
     rarity = Column(String)
-    price = Column(String)
+    price_cents = Column(Integer, nullable=True) # Market price in cents of `currency`, None if unknown
+    currency = Column(String, default=DEFAULT_CURRENCY)
+    price_updated_at = Column(DateTime, nullable=True)
     description = Column(String)
     image_url = Column(String)
     image_path = Column(String)
@@ -38,6 +41,38 @@ class Card(Base):
 
     owner = relationship("User", back_populates="cards")
 
+    __table_args__ = (
+        # Serves the per-user, newest-first keyset pagination of GET /cards/
+        Index("ix_cards_owner_created", "owner_id", "created_at"),
+        # Most valuable cards of a user, read in index order by GET /cards/stats
+        Index("ix_cards_owner_price", "owner_id", "price_cents"),
+        # The price refresh groups and updates cards by their code
+        Index("ix_cards_code", "game", "set_code", "card_number"),
+    )
+
+    @property
+    def price(self):
+        # Decimal string, as the API has always returned it
+        return format_cents(self.price_cents)
+
+    @price.setter
+    def price(self, value):
+        self.price_cents = to_cents(value)
+        self.price_updated_at = datetime.datetime.utcnow() if self.price_cents is not None else None
+
+class CollectionRollup(Base):
+    __tablename__ = "collection_rollups"
+
+    # Per-user card count and value, kept current on every write so GET /cards/stats
+    # doesn't scan the collection. dimension is "total", "game", "set" or "rarity".
+    owner_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    dimension = Column(String, primary_key=True)
+    key = Column(String, primary_key=True) # "" for the total and for cards missing the field
+    currency = Column(String, primary_key=True)
+    card_count = Column(Integer, default=0)
+    priced_count = Column(Integer, default=0)
+    value_cents = Column(Integer, default=0)
+
 class CardReference(Base):
     __tablename__ = "card_reference"
 
@@ -47,6 +82,60 @@ class CardReference(Base):
     card_number = Column(String)
     name = Column(String)
     rarity = Column(String)
+    # Uppercase, whitespace-free copies of the code, used for lookups by scanned code
+    set_code_norm = Column(String)
+    card_number_norm = Column(String)
+    # Hash of the catalog fields, so a re-sync only rewrites rows whose content changed
+    checksum = Column(String)
+
+    __table_args__ = (
+        Index("ux_card_reference_code_norm", "set_code_norm", "card_number_norm", "game", unique=True),
+    )
+
+class CatalogSyncState(Base):
+    __tablename__ = "catalog_sync_state"
+
+    source = Column(String, primary_key=True) # e.g. "ygoprodeck:/data/cardinfo.json"
+    file_checksum = Column(String)
+    items_done = Column(Integer, default=0) # Dump entries committed so far, for resuming
+    rows_upserted = Column(Integer, default=0)
+    completed_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class JobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+class ScanJob(Base):
+    __tablename__ = "scan_jobs"
+
+    id = Column(String, primary_key=True) # uuid4 hex, handed to the client for polling
+    owner_id = Column(Integer, ForeignKey("users.id"))
+    kind = Column(String) # "scan" or "batch"
+    segment = Column(Integer, default=0) # Batch option: split binder pages
+    status = Column(String, default=JobStatus.QUEUED.value)
+    attempts = Column(Integer, default=0)
+    locked_by = Column(String, nullable=True) # Worker holding the lease
+    locked_until = Column(DateTime, nullable=True) # A crashed worker's job is retried after this
+    result = Column(Text, nullable=True) # JSON
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_scan_jobs_status_created", "status", "created_at"),
+    )
+
+class ScanJobImage(Base):
+    __tablename__ = "scan_job_images"
+
+    # Uploaded images wait here until the job finishes, then are deleted
+    job_id = Column(String, ForeignKey("scan_jobs.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)
+    data = Column(LargeBinary)
 
 class ScanMetadata(Base):
     __tablename__ = "scan_metadata"
@@ -0,0 +1,280 @@
+"""Scheduled refresh of the prices of the cards in users' collections.
+
+A pass collects the distinct ``(game, set_code, card_number)`` keys of all collections
+and picks those due: valuable cards daily, cheap ones weekly (STALENESS_TIERS). The
+most overdue keys go first, so a pass cut short by its window has refreshed what
+matters most. Upstream lookups are batched (YGOPRODeck by card name, pokemontcg.io by
+set), run PRICE_REFRESH_CONCURRENCY at a time and are token-bucket rate-limited per
+upstream. Each key is written back with one UPDATE of all its cards::
+
+    poetry run python -m backend.app.price_refresh --once
+    poetry run python -m backend.app.price_refresh          # a pass every PRICE_REFRESH_INTERVAL
+"""
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import time
+from collections import Counter, deque
+
+import httpx
+from sqlalchemy import bindparam, func, select, tuple_, update
+
+from .database import run_db
+from .migrations import prepare_database
+from .models import models
+from .services import collection_stats
+from .services.external_api import ExternalCardAPI, close_http_client
+from .services.prices import DEFAULT_CURRENCY, to_cents
+from .services.rate_limit import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+PRICE_REFRESH_INTERVAL = float(os.getenv("PRICE_REFRESH_INTERVAL", str(24 * 3600)))
+# A pass sends no new requests after this many seconds; the keys left are first in line next time
+PRICE_REFRESH_WINDOW = float(os.getenv("PRICE_REFRESH_WINDOW", str(4 * 3600)))
+# Requests in flight per upstream
+PRICE_REFRESH_CONCURRENCY = int(os.getenv("PRICE_REFRESH_CONCURRENCY", "4"))
+# Requests per second per upstream (YGOPRODeck allows 20)
+YGOPRODECK_RATE = float(os.getenv("YGOPRODECK_RATE", "15"))
+POKEMONTCG_RATE = float(os.getenv("POKEMONTCG_RATE", "5"))
+YGOPRODECK_BATCH = 20 # Card names per request
+POKEMONTCG_BATCH = 50 # Card numbers (of one set) per request
+PRICE_REFRESH_WRITE_BATCH = 500 # Keys written per transaction
+PRICE_REFRESH_MAX_RETRIES = 5 # Per request, after a 429
+
+# (price floor in cents, maximum age): a key uses the first tier its price reaches
+STALENESS_TIERS = [
+    (5000, datetime.timedelta(days=1)),
+    (500, datetime.timedelta(days=3)),
+    (0, datetime.timedelta(days=7)),
+]
+_NEVER = datetime.datetime(1970, 1, 1)
+
+
+def collect_due_keys(db, now):
+    """``(distinct keys, due keys)``; due keys are dicts, most overdue (then most valuable) first."""
+    card = models.Card
+    rows = db.execute(
+        select(card.game, card.set_code, card.card_number, func.max(card.name),
+               func.max(card.price_cents), func.min(func.coalesce(card.price_updated_at, _NEVER)))
+        .where(func.lower(card.game).in_(["yu-gi-oh!", "pokemon"]))
+        .group_by(card.game, card.set_code, card.card_number)
+    ).all()
+    due = []
+    for game, set_code, card_number, name, cents, updated_at in rows:
+        max_age = next(age for floor, age in STALENESS_TIERS if (cents or 0) >= floor)
+        overdue = (now - updated_at) / max_age
+        if overdue >= 1:
+            due.append({"key": (game, set_code, card_number), "name": name,
+                        "value_cents": cents or 0, "overdue": overdue})
+    due.sort(key=lambda item: (-item["overdue"], -item["value_cents"]))
+    return len(rows), due
+
+
+def plan_requests(due):
+    """Group due keys into batched upstream requests, in the order of their most urgent key."""
+    requests, open_batches = [], {}
+    for item in due:
+        game, set_code, card_number = item["key"]
+        if game.lower() == "yu-gi-oh!":
+            if not item["name"]:
+                continue
+            # One name covers every printing of the card
+            batch = open_batches.get(("name", item["name"])) or open_batches.get("ygoprodeck")
+            if batch is None or (item["name"] not in batch["names"] and len(batch["names"]) >= YGOPRODECK_BATCH):
+                batch = {"upstream": "ygoprodeck", "names": [], "keys": []}
+                requests.append(batch)
+                open_batches["ygoprodeck"] = batch
+            if item["name"] not in batch["names"]:
+                batch["names"].append(item["name"])
+                open_batches[("name", item["name"])] = batch
+        else:
+            batch = open_batches.get(("set", set_code.lower()))
+            if batch is None or len(batch["keys"]) >= POKEMONTCG_BATCH:
+                batch = {"upstream": "pokemontcg", "set_code": set_code, "keys": []}
+                requests.append(batch)
+                open_batches[("set", set_code.lower())] = batch
+        batch["keys"].append(item["key"])
+    return requests
+
+
+def _number(card_number):
+    # pokemontcg.io numbers aren't zero-padded ("25"), scanned ones may be ("025")
+    return card_number.upper().lstrip("0") or "0"
+
+
+def write_prices(db, results, now):
+    """Write ``[(key, cents)]`` back, one UPDATE per key; None means upstream has no price.
+
+    Returns the number of cards updated.
+    """
+    table = models.Card.__table__
+    where = ((table.c.game == bindparam("k_game")) & (table.c.set_code == bindparam("k_set"))
+             & (table.c.card_number == bindparam("k_number")))
+    new_prices = {key: cents for key, cents in results if cents is not None}
+    missing = [key for key, cents in results if cents is None]
+    updated = 0
+    if new_prices:
+        columns = (table.c.game, table.c.set_code, table.c.card_number, table.c.owner_id, table.c.rarity,
+                   func.coalesce(table.c.currency, DEFAULT_CURRENCY))
+        groups = db.execute(
+            select(*columns, func.count(), func.count(table.c.price_cents),
+                   func.coalesce(func.sum(table.c.price_cents), 0))
+            .where(tuple_(table.c.game, table.c.set_code, table.c.card_number).in_(list(new_prices)))
+            .group_by(*columns)
+        ).all()
+        db.execute(
+            update(table).where(where).values(price_cents=bindparam("k_cents"), currency=DEFAULT_CURRENCY,
+                                              price_updated_at=now),
+            [{"k_game": game, "k_set": set_code, "k_number": card_number, "k_cents": cents}
+             for (game, set_code, card_number), cents in new_prices.items()],
+        )
+        collection_stats.record_repricing(db, [
+            {"owner_id": owner_id, "game": game, "set_code": set_code, "rarity": rarity, "currency": currency,
+             "cards": cards, "priced": priced, "value_cents": value_cents,
+             "new_price_cents": new_prices[(game, set_code, card_number)], "new_currency": DEFAULT_CURRENCY}
+            for game, set_code, card_number, owner_id, rarity, currency, cards, priced, value_cents in groups
+        ])
+        updated = sum(group[6] for group in groups)
+    if missing:
+        # Checked, so the key waits for its next turn instead of being asked for again tomorrow
+        db.execute(update(table).where(where).values(price_updated_at=now), [
+            {"k_game": game, "k_set": set_code, "k_number": card_number} for game, set_code, card_number in missing
+        ])
+    db.commit()
+    return updated
+
+
+class PriceRefresher:
+    def __init__(self, api: ExternalCardAPI = None, concurrency=PRICE_REFRESH_CONCURRENCY,
+                 rates=None, window=PRICE_REFRESH_WINDOW):
+        self.api = api or ExternalCardAPI()
+        self.concurrency = concurrency
+        self.rates = rates or {"ygoprodeck": YGOPRODECK_RATE, "pokemontcg": POKEMONTCG_RATE}
+        self.window = window
+        self.limiters = {}
+
+    async def _throttle(self, upstream):
+        while (wait := self.limiters[upstream].acquire(upstream)) > 0:
+            await asyncio.sleep(wait)
+
+    async def _yugioh_prices(self, names):
+        await self._throttle("ygoprodeck")
+        self.stats["requests"] += 1
+        prices = await self.api.get_yugioh_prices(names)
+        if prices is None and len(names) > 1:
+            # A single unknown name fails the whole batch: split it to find the good ones
+            half = len(names) // 2
+            prices = {**(await self._yugioh_prices(names[:half]) or {}),
+                      **(await self._yugioh_prices(names[half:]) or {})}
+        return prices or {}
+
+    async def _fetch(self, batch):
+        """``[(key, cents)]`` for a batch; keys upstream has no price for get None."""
+        if batch["upstream"] == "ygoprodeck":
+            prices = await self._yugioh_prices(batch["names"])
+            found = {(set_code.upper(), number.upper()): price for (set_code, number), price in prices.items()}
+            raw = [(key, found.get((key[1].upper(), key[2].upper()))) for key in batch["keys"]]
+        else:
+            await self._throttle("pokemontcg")
+            self.stats["requests"] += 1
+            prices = await self.api.get_pokemon_prices(batch["set_code"], [_number(key[2]) for key in batch["keys"]])
+            found = {_number(number): price for number, price in prices.items()}
+            raw = [(key, found.get(_number(key[2]))) for key in batch["keys"]]
+        results = []
+        for key, price in raw:
+            try:
+                results.append((key, to_cents(price)))
+            except ValueError:
+                results.append((key, None))
+        return results
+
+    async def run(self, now=None):
+        """One refresh pass; returns its counters."""
+        start = time.monotonic()
+        now = now or datetime.datetime.utcnow()
+        self.stats = Counter()
+        # Burst of one second's worth, so the rate holds from the first request
+        self.limiters = {upstream: RateLimiter(rate, max(1, int(rate))) for upstream, rate in self.rates.items()}
+        keys, due = await run_db(collect_due_keys, now)
+        self.stats.update(keys_total=keys, keys_due=len(due))
+        queues = {upstream: deque() for upstream in self.limiters}
+        for batch in plan_requests(due):
+            queues[batch["upstream"]].append(batch)
+
+        deadline = start + self.window
+        pending, slowed_at = [], {}
+        write_lock = asyncio.Lock()
+
+        async def flush(force=False):
+            nonlocal pending
+            async with write_lock:
+                if not pending or (len(pending) < PRICE_REFRESH_WRITE_BATCH and not force):
+                    return
+                chunk, pending = pending, []
+                self.stats["cards_updated"] += await run_db(write_prices, chunk, now)
+
+        async def worker(queue):
+            while queue and time.monotonic() < deadline:
+                batch = queue.popleft()
+                try:
+                    results = await self._fetch(batch)
+                except httpx.HTTPStatusError as e:
+                    retries = batch.get("retries", 0)
+                    if e.response.status_code == 429 and retries < PRICE_REFRESH_MAX_RETRIES:
+                        # Upstream allows less than configured: halve our rate for the rest of the pass,
+                        # once per second however many requests in flight come back throttled
+                        limiter = self.limiters[batch["upstream"]]
+                        if time.monotonic() - slowed_at.get(batch["upstream"], 0) >= 1:
+                            slowed_at[batch["upstream"]] = time.monotonic()
+                            limiter.rate = max(limiter.rate / 2, 0.1)
+                            limiter.burst = max(1, int(limiter.rate))
+                        self.stats["throttled"] += 1
+                        batch["retries"] = retries + 1
+                        queue.appendleft(batch)
+                        await asyncio.sleep(float(e.response.headers.get("Retry-After", "1")))
+                        continue
+                    logger.warning(f"Price lookup failed: {e}")
+                    self.stats["keys_failed"] += len(batch["keys"])
+                    continue
+                except httpx.HTTPError as e:
+                    logger.warning(f"Price lookup failed: {e}")
+                    self.stats["keys_failed"] += len(batch["keys"])
+                    continue
+                self.stats["keys_priced"] += sum(cents is not None for _, cents in results)
+                self.stats["keys_missing"] += sum(cents is None for _, cents in results)
+                pending.extend(results)
+                await flush()
+
+        await asyncio.gather(*(worker(queue) for queue in queues.values() for _ in range(self.concurrency)))
+        await flush(force=True)
+        self.stats["keys_left"] = sum(len(batch["keys"]) for queue in queues.values() for batch in queue)
+        self.stats["seconds"] = round(time.monotonic() - start, 1)
+        return dict(self.stats)
+
+
+async def run_forever(once=False, window=PRICE_REFRESH_WINDOW):
+    refresher = PriceRefresher(window=window)
+    try:
+        while True:
+            started = time.monotonic()
+            stats = await refresher.run()
+            logger.info(f"Price refresh pass: {stats}")
+            if once:
+                return stats
+            await asyncio.sleep(max(0.0, PRICE_REFRESH_INTERVAL - (time.monotonic() - started)))
+    finally:
+        await close_http_client()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit (e.g. from cron)")
+    parser.add_argument("--window", type=float, default=PRICE_REFRESH_WINDOW, help="seconds per pass")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    prepare_database()
+    asyncio.run(run_forever(args.once, args.window))
@@ -0,0 +1,167 @@
+"""Worker processes that run queued scan jobs (``POST /cards/scan?defer=true``).
+
+Each process polls the scan_jobs table, leases the oldest job, runs RecognitionService
+on it and stores the result for clients polling ``GET /cards/jobs/{id}``. The lease is
+renewed while the job runs, and a job whose worker dies is picked up again once it
+expires. Scale these independently of the API processes::
+
+    poetry run python -m backend.app.scan_worker --processes 2
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from . import schemas
+from .database import SessionLocal, engine, run_db
+from .migrations import prepare_database
+from .services import job_queue
+from .services.container import ServiceContainer
+from .services.recognition import batch_item
+
+logger = logging.getLogger(__name__)
+
+# Idle workers check for new jobs this often
+SCAN_JOB_POLL_SECONDS = float(os.getenv("SCAN_JOB_POLL_SECONDS", "0.5"))
+# On shutdown, how long a worker may take to finish its current job before it is killed
+SCAN_WORKER_STOP_SECONDS = float(os.getenv("SCAN_WORKER_STOP_SECONDS", "30"))
+
+
+async def run_job(db, job, services):
+    """Run one job; returns ``(result, error)``. Bad input is an error, not a crash to retry."""
+    service = services.recognition(db)
+    images = job_queue.images(db, job)
+    if job.kind == "scan":
+        result = await service.scan_card(images[0], owner_id=job.owner_id)
+        if "error" in result:
+            return None, result["error"]
+        return schemas.ScanResponse(**result).model_dump(mode="json"), None
+
+    items = [batch_item(*item) async for item in service.scan_batch(images, segment=bool(job.segment))]
+    items.sort(key=lambda item: (item["image"], item["position"]))
+    return {"cards": items, "lookups_deduped": service.lookups_deduped}, None
+
+
+async def run_leased(db, job, worker_id, services):
+    """``run_job`` while renewing the job's lease; None if the lease was lost meanwhile."""
+    run = asyncio.ensure_future(run_job(db, job, services))
+    try:
+        while True:
+            done, _ = await asyncio.wait({run}, timeout=job_queue.SCAN_JOB_LEASE_SECONDS / 3)
+            if done:
+                return run.result()
+            try:
+                # Its own short session, so the renewal commits nothing of the job's work
+                renewed = await run_db(job_queue.renew, job.id, worker_id)
+            except OperationalError as e:
+                # The lease is still good for a while; try again next time
+                logger.warning(f"Renewing the lease on scan job {job.id} failed: {e}")
+                continue
+            if not renewed:
+                # Another worker runs it now; stop duplicating the work
+                return None
+    finally:
+        run.cancel()
+
+
+async def work(worker_id, stop):
+    db = SessionLocal()
+    services = ServiceContainer()
+    try:
+        services.warm_up(db)
+        while not stop.is_set():
+            try:
+                job = job_queue.claim(db, worker_id)
+            except OperationalError as e:
+                # e.g. SQLite busy while another process writes; just try again
+                logger.warning(f"Claiming a job failed: {e}")
+                db.rollback()
+                await asyncio.sleep(SCAN_JOB_POLL_SECONDS)
+                continue
+            if job is None:
+                try:
+                    await asyncio.wait_for(stop.wait(), SCAN_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                outcome = await run_leased(db, job, worker_id, services)
+                leased = outcome is not None and job_queue.finish(db, job, worker_id, *outcome)
+            except Exception as e:
+                logger.exception(f"Scan job {job.id} failed")
+                db.rollback()
+                leased = job_queue.release(db, job, worker_id, str(e) or type(e).__name__)
+            if not leased:
+                logger.warning(f"Lost the lease on scan job {job.id} to another worker; dropped its outcome")
+    finally:
+        db.close()
+        await services.aclose()
+
+
+def worker_main(worker_id):
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s {worker_id} %(levelname)s %(message)s")
+    # Never share the parent's pooled connections across processes
+    engine.dispose()
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        # Finish the current job, then exit
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        await work(worker_id, stop)
+
+    asyncio.run(main())
+
+
+def start_workers(count):
+    """Spawn ``count`` worker processes; returns them, to be ended with ``stop_workers``.
+
+    They are not daemonic, since daemonic processes can't have children and
+    CV_EXECUTOR=process starts a pool of them.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    host = socket.gethostname()
+    processes = []
+    for i in range(count):
+        process = ctx.Process(target=worker_main, args=(f"{host}:{os.getpid()}:{i}",))
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_workers(processes, timeout=SCAN_WORKER_STOP_SECONDS):
+    """Ask the workers to finish their current job and exit; kill those still running after ``timeout``."""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+        if process.is_alive():
+            logger.warning(f"Scan worker {process.pid} did not stop within {timeout:g}s; killing it")
+            process.kill()
+            process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=1)
+    args = parser.parse_args()
+
+    prepare_database()
+    workers = start_workers(args.processes)
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_workers(workers)
@@ -1,6 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, computed_field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
+from .services.prices import DEFAULT_CURRENCY, format_cents, to_cents
+
+def _normalize_price(value):
+    # "$1,299.5" -> "1299.50"; an unparseable price is a validation error
+    return format_cents(to_cents(value))
 
 class CardBase(BaseModel):
     name: str
@@ -9,6 +14,7 @@ class CardBase(BaseModel):
     card_number: str
     rarity: Optional[str] = None
     price: Optional[str] = None
+    currency: str = DEFAULT_CURRENCY
     description: Optional[str] = None
     image_url: Optional[str] = None
 
@@ -17,16 +23,87 @@ class CardCreate(CardBase):
     confidence: float
     owner_id: Optional[int] = None
 
+    _price = field_validator("price", mode="before")(_normalize_price)
+
 class Card(CardBase):
     id: int
     owner_id: Optional[int] = None
     image_path: Optional[str] = None
     confidence: float
+    price_cents: Optional[int] = None
+    price_updated_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class CardImport(BaseModel):
+    # One row of POST /cards/bulk; name, game and rarity come from CardReference when the code is known
+    set_code: str
+    card_number: str
+    name: Optional[str] = None
+    game: Optional[str] = None
+    rarity: Optional[str] = None
+    price: Optional[str] = None
+    currency: str = DEFAULT_CURRENCY
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    image_path: Optional[str] = None
+    confidence: float = 1.0
+
+    # Spreadsheets export prices as numbers
+    _price = field_validator("price", mode="before")(_normalize_price)
+
+class BulkImportError(BaseModel):
+    row: Optional[int] = None  # 1-based data row; None when the rest of the input could not be read
+    error: str
+
+class BulkImportResult(BaseModel):
+    received: int
+    inserted: int
+    errors: list[BulkImportError]
+
+class CardSummary(BaseModel):
+    # List view projection: everything but the description text
+    id: int
+    name: str
+    game: str
+    set_code: str
+    card_number: str
+    rarity: Optional[str] = None
+    price_cents: Optional[int] = None
+    currency: Optional[str] = None
+    price_updated_at: Optional[datetime] = None
+    image_url: Optional[str] = None
+    image_path: Optional[str] = None
+    confidence: float
     created_at: datetime
 
+    @computed_field
+    @property
+    def price(self) -> Optional[str]:
+        return format_cents(self.price_cents)
+
     class Config:
         from_attributes = True
 
+class ValueBucket(BaseModel):
+    key: Optional[str] = None # Game, set code or rarity; None for the total or cards without one
+    currency: str
+    cards: int
+    priced: int # Cards with a known price
+    value_cents: int
+    value: str
+
+class CollectionStats(BaseModel):
+    source: str # "rollups" or "cards"
+    # One bucket per currency in each list
+    totals: list[ValueBucket]
+    by_game: list[ValueBucket]
+    by_set: list[ValueBucket]
+    by_rarity: list[ValueBucket]
+    top: list[CardSummary]
+
 class UserBase(BaseModel):
     email: str
 
@@ -45,10 +122,34 @@ class Token(BaseModel):
     token_type: str
 
 class TokenData(BaseModel):
+    user_id: Optional[int] = None
     email: Optional[str] = None
 
+class ScannedCard(CardBase):
+    # Not persisted yet, so no id/created_at until the user confirms it
+    image_path: Optional[str] = None
+
 class ScanResponse(BaseModel):
     scan_method: str
     confidence: float
     requires_confirmation: bool
-    card_data: Optional[Card] = None
+    card_data: Optional[ScannedCard] = None
+
+class BatchScanItem(ScanResponse):
+    image: int # Index of the uploaded file
+    position: int # Card on that photo, in reading order
+
+class JobAccepted(BaseModel):
+    job_id: str
+    status: str
+
+class ScanJob(BaseModel):
+    id: str
+    kind: str
+    status: str
+    attempts: int
+    # ScanResponse for "scan" jobs, {"cards": [BatchScanItem, ...], ...} for "batch" jobs
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
@@ -1,15 +1,47 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
+import threading
+import time
+
+from .worker_pool import WorkerPool
 
 # Secrets should be in environment variables
 SECRET_KEY = os.getenv("SECRET_KEY", "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Verified tokens remembered until they expire, so repeat requests skip the signature check; 0 disables
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000"))
+
+_verified_tokens = OrderedDict()  # token -> claims
+_verified_tokens_lock = threading.Lock()
+
+# bcrypt cost factor; stored hashes with another cost are rehashed on the user's next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Hashing is CPU-bound, so it gets its own small pool instead of the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hashes allowed to wait for a worker before logins/registrations get 503
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", "16"))
+# "thread", or "inline" to hash on the event loop (old behaviour)
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+password_pool = WorkerPool(
+    kind=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    queue_size=PASSWORD_HASH_QUEUE_SIZE,
+    name="password-hash",
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -17,6 +49,16 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def verify_and_update_password(plain_password, hashed_password):
+    """``(valid, new_hash)`` computed on the password pool; ``new_hash`` is set when the cost changed.
+
+    Raises WorkerPoolBusy when the pool is saturated.
+    """
+    return await password_pool.run(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def hash_password(password):
+    return await password_pool.run(pwd_context.hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -26,3 +68,21 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def decode_access_token(token: str):
+    """Claims of a valid token, memoised until its ``exp``; raises JWTError otherwise."""
+    with _verified_tokens_lock:
+        claims = _verified_tokens.get(token)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                _verified_tokens.move_to_end(token)
+                return claims
+            del _verified_tokens[token]
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if AUTH_TOKEN_CACHE_SIZE and "exp" in claims:
+        with _verified_tokens_lock:
+            _verified_tokens[token] = claims
+            while len(_verified_tokens) > AUTH_TOKEN_CACHE_SIZE:
+                _verified_tokens.popitem(last=False)
+    return claims
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Name, description, image and rarity hardly ever change; prices do
+CARD_CACHE_STATIC_TTL = float(os.getenv("CARD_CACHE_STATIC_TTL", str(7 * 24 * 3600)))
+CARD_CACHE_PRICE_TTL = float(os.getenv("CARD_CACHE_PRICE_TTL", str(6 * 3600)))
+# How long an upstream "no such card" is remembered
+CARD_CACHE_NEGATIVE_TTL = float(os.getenv("CARD_CACHE_NEGATIVE_TTL", "3600"))
+CARD_CACHE_MAX_ENTRIES = int(os.getenv("CARD_CACHE_MAX_ENTRIES", "10000"))
+# Optional SQLite file shared by all workers on the host, e.g. ./card_cache.db
+CARD_CACHE_DB = os.getenv("CARD_CACHE_DB")
+
+
+class MemoryCacheBackend:
+    """Per-process LRU map of cache entries."""
+
+    def __init__(self, max_entries=CARD_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Cache entries in a local SQLite file, shared between worker processes.
+
+    Sits behind the in-memory LRU, so it is only consulted on a local miss. Its methods
+    block on file I/O; CardDetailsCache calls them on a worker thread.
+    """
+
+    def __init__(self, path, max_entries=CARD_CACHE_MAX_ENTRIES * 10):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS card_cache (key TEXT PRIMARY KEY, entry TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_card_cache_stored_at ON card_cache (stored_at)")
+        self._writes = 0
+
+    @staticmethod
+    def _key(key):
+        return "|".join(key)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT entry FROM card_cache WHERE key = ?", (self._key(key),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, entry):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO card_cache (key, entry, stored_at) VALUES (?, ?, ?)",
+                (self._key(key), json.dumps(entry), time.time()),
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                # Trim the oldest rows once in a while instead of on every write
+                self._conn.execute(
+                    "DELETE FROM card_cache WHERE key IN "
+                    "(SELECT key FROM card_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM card_cache WHERE key = ?", (self._key(key),))
+
+
+class CardDetailsCache:
+    """TTL + LRU cache of external card details with single-flight upstream calls.
+
+    Keys are ``(game, set_code, card_number)``. A stale price is served while one
+    background refresh runs; stale static data or a miss waits for the upstream call,
+    which concurrent callers for the same key share.
+    """
+
+    def __init__(self, memory=None, shared=None, static_ttl=CARD_CACHE_STATIC_TTL,
+                 price_ttl=CARD_CACHE_PRICE_TTL, negative_ttl=CARD_CACHE_NEGATIVE_TTL):
+        self.memory = memory or MemoryCacheBackend()
+        self.shared = shared
+        self.static_ttl = static_ttl
+        self.price_ttl = price_ttl
+        self.negative_ttl = negative_ttl
+        self.counters = Counter()
+        self._inflight = {}
+
+    async def _lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.shared is not None:
+            # SQLite file I/O stays off the event loop
+            entry = await asyncio.to_thread(self.shared.get, key)
+            if entry is not None:
+                self.counters["shared_hits"] += 1
+                self.memory.set(key, entry)
+        return entry
+
+    async def get_or_fetch(self, key, fetch):
+        """Cached details for ``key``, calling ``fetch()`` (a coroutine factory) when needed."""
+        now = time.time()
+        entry = await self._lookup(key)
+        if entry is not None:
+            if entry["data"] is None:
+                if now < entry["expires_at"]:
+                    self.counters["negative_hits"] += 1
+                    return None
+            elif now < entry["static_until"]:
+                self.counters["hits"] += 1
+                if now >= entry["price_until"]:
+                    self.counters["stale_price_refreshes"] += 1
+                    self._start_fetch(key, fetch)
+                return dict(entry["data"])
+
+        self.counters["misses"] += 1
+        data = await asyncio.shield(self._start_fetch(key, fetch))
+        return dict(data) if data else None
+
+    async def invalidate(self, key):
+        self.memory.delete(key)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.delete, key)
+
+    def _start_fetch(self, key, fetch):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.counters["coalesced"] += 1
+            return task
+        task = asyncio.ensure_future(self._fetch_and_store(key, fetch))
+        self._inflight[key] = task
+        task.add_done_callback(lambda t: self._fetch_done(key, t))
+        return task
+
+    def _fetch_done(self, key, task):
+        self._inflight.pop(key, None)
+        # Background refreshes have no awaiting caller; retrieve the error so it is not lost
+        if not task.cancelled() and task.exception() is not None:
+            self.counters["upstream_errors"] += 1
+
+    async def _fetch_and_store(self, key, fetch):
+        self.counters["upstream_calls"] += 1
+        data = await fetch()
+        now = time.time()
+        if data:
+            entry = {"data": data, "static_until": now + self.static_ttl, "price_until": now + self.price_ttl}
+        else:
+            entry = {"data": None, "expires_at": now + self.negative_ttl}
+        self.memory.set(key, entry)
+        if self.shared is not None:
+            await asyncio.to_thread(self.shared.set, key, entry)
+        return data
+
+    def stats(self):
+        lookups = self.counters["hits"] + self.counters["negative_hits"] + self.counters["misses"]
+        return {
+            **{name: self.counters[name] for name in (
+                "hits", "negative_hits", "misses", "shared_hits", "stale_price_refreshes",
+                "coalesced", "upstream_calls", "upstream_errors",
+            )},
+            "hit_rate": round((lookups - self.counters["misses"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self.memory),
+            "evictions": self.memory.evictions,
+        }
+
+
+card_cache = CardDetailsCache(shared=SQLiteCacheBackend(CARD_CACHE_DB) if CARD_CACHE_DB else None)
@@ -0,0 +1,129 @@
+import csv
+import datetime
+import io
+import json
+import logging
+import os
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from .. import schemas
+from ..catalog_sync import iter_json_array
+from ..models import models
+from . import collection_stats
+from .prices import to_cents
+from .reference_cache import reference_cache
+
+logger = logging.getLogger(__name__)
+
+# Rows validated, resolved and inserted per transaction
+BULK_IMPORT_CHUNK_SIZE = int(os.getenv("BULK_IMPORT_CHUNK_SIZE", "1000"))
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", "100000"))
+# Row errors listed in the response; the rest are only counted
+BULK_IMPORT_MAX_ERRORS = 1000
+
+_rows_adapter = TypeAdapter(list[schemas.CardImport])
+
+
+def iter_csv_rows(fp):
+    """Rows of a CSV with a header line; blank cells are left out, so defaults apply."""
+    for row in csv.DictReader(fp):
+        yield {key.strip(): value.strip() for key, value in row.items()
+               if key and isinstance(value, str) and value.strip()}
+
+
+def _validate(numbers, raws):
+    """Validate a chunk in one pass; returns ``([(row, CardImport)], [(row, error)])``."""
+    try:
+        return list(zip(numbers, _rows_adapter.validate_python(raws))), []
+    except ValidationError as e:
+        bad = {}
+        for err in e.errors():
+            index, field = err["loc"][0], ".".join(str(part) for part in err["loc"][1:])
+            bad.setdefault(index, f"{field}: {err['msg']}" if field else err["msg"])
+    good = [i for i in range(len(raws)) if i not in bad]
+    valid = _rows_adapter.validate_python([raws[i] for i in good]) if good else []
+    return list(zip((numbers[i] for i in good), valid)), [(numbers[i], msg) for i, msg in sorted(bad.items())]
+
+
+def _resolve(owner_id, card, now):
+    """Insert values for a row, completed from CardReference; raises ValueError if incomplete."""
+    values = card.model_dump()
+    values["price_cents"] = to_cents(values.pop("price"))
+    values["price_updated_at"] = now if values["price_cents"] is not None else None
+    reference = reference_cache.lookup(card.set_code, card.card_number, card.game)
+    if reference is not None:
+        values["name"] = values["name"] or reference.name
+        values["game"] = values["game"] or reference.game
+        values["rarity"] = values["rarity"] or reference.rarity or None
+    elif not values["name"] or not values["game"]:
+        raise ValueError(f"Unknown card {card.set_code}-{card.card_number}: name and game are required")
+    values["owner_id"] = owner_id
+    return values
+
+
+def import_cards(db: Session, owner_id, fp, fmt="json"):
+    """Add the cards in a JSON array or CSV (binary file object) to ``owner_id``'s collection.
+
+    Rows are handled in chunks of BULK_IMPORT_CHUNK_SIZE, each one validated in a
+    single pass, resolved against the in-memory CardReference copy and inserted in one
+    transaction. Bad rows are reported and skipped; the rest are still imported.
+    """
+    text = io.TextIOWrapper(fp, encoding="utf-8-sig", newline="")
+    rows = iter_csv_rows(text) if fmt == "csv" else iter_json_array(text)
+    reference_cache.ensure_fresh(db)
+
+    received = inserted = 0
+    errors = []
+
+    def fail(row, message):
+        if len(errors) < BULK_IMPORT_MAX_ERRORS:
+            errors.append({"row": row, "error": message})
+
+    def flush(numbers, raws):
+        nonlocal inserted
+        valid, invalid = _validate(numbers, raws)
+        for row, message in invalid:
+            fail(row, message)
+        values = []
+        now = datetime.datetime.utcnow()
+        for row, card in valid:
+            try:
+                values.append(_resolve(owner_id, card, now))
+            except ValueError as e:
+                fail(row, str(e))
+        if not values:
+            return
+        try:
+            db.execute(insert(models.Card), values)
+            # Core inserts bypass the ORM events that keep the rollups current
+            collection_stats.record_cards(db, values)
+            db.commit()
+            inserted += len(values)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.exception("Bulk card insert failed")
+            for row, _ in valid:
+                fail(row, f"Insert failed: {type(e).__name__}")
+
+    numbers, raws = [], []
+    try:
+        for raw in rows:
+            received += 1
+            if received > BULK_IMPORT_MAX_ROWS:
+                received -= 1
+                fail(None, f"Stopped after {BULK_IMPORT_MAX_ROWS} rows")
+                break
+            numbers.append(received)
+            raws.append(raw)
+            if len(raws) >= BULK_IMPORT_CHUNK_SIZE:
+                flush(numbers, raws)
+                numbers, raws = [], []
+    except (ValueError, csv.Error) as e:
+        # json.JSONDecodeError and UnicodeDecodeError are ValueErrors too
+        fail(None, f"Unreadable input after row {received}: {e}")
+    flush(numbers, raws)
+    return {"received": received, "inserted": inserted, "errors": errors}
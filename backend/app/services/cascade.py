@@ -0,0 +1,316 @@
+"""Card recognition as an ordered cascade of stages, cheapest first.
+
+Each stage either produces a result or passes. A result at least as confident as the
+stage's threshold ends the scan and the remaining stages never run. Weaker results are
+kept, and if no stage is confident the best of them is returned for the user to confirm.
+The default stages are:
+
+- ``cache``: the same upload (or, if enabled, a near-identical photo) was scanned recently
+- ``visual``: the artwork is in the perceptual-hash index, no OCR at all
+- ``code``: set-number bands are OCR'd one at a time until one parses, then looked up
+- ``name``: the name band is OCR'd and fuzzy-matched against the reference names
+- ``full``: the whole card is OCR'd, the slow last resort
+
+Per-stage runs, hits and time are kept on the cascade (``GET /cards/scan-stats``) and
+exported as ``recognition_stage_*`` metrics.
+"""
+import os
+import re
+import time
+from collections import Counter
+
+from .. import metrics
+from ..cv.hashing import frame_hashes
+from ..cv.layouts import LAYOUTS
+from ..cv.visual_index import VISUAL_MATCH_MAX_DISTANCE, get_visual_index
+from .name_index import NAME_MATCH_MIN_SCORE
+from .reference_cache import reference_cache
+from .scan_cache import scan_cache
+from .worker_pool import cv_pool
+
+# "roi" reads the name/set-number bands before falling back to whole-card OCR, "full" goes straight to it
+OCR_MODE = os.getenv("OCR_MODE", "roi")
+RECOGNITION_STAGES = os.getenv(
+    "RECOGNITION_STAGES", "cache,visual,full" if OCR_MODE == "full" else "cache,visual,code,name,full"
+)
+# A stage's result at least this confident ends the scan; by default a visual match close
+# enough not to need confirmation, a set code found in CardReference or upstream, and any
+# accepted name match
+CASCADE_VISUAL_MIN_CONFIDENCE = float(os.getenv(
+    "CASCADE_VISUAL_MIN_CONFIDENCE", str(round(1 - (VISUAL_MATCH_MAX_DISTANCE // 2) / 64, 3))
+))
+CASCADE_CODE_MIN_CONFIDENCE = float(os.getenv("CASCADE_CODE_MIN_CONFIDENCE", "0.9"))
+CASCADE_NAME_MIN_CONFIDENCE = float(os.getenv("CASCADE_NAME_MIN_CONFIDENCE", str(NAME_MATCH_MIN_SCORE)))
+
+# Patterns like LOB-001, SV1-025, EN-023
+# Yu-Gi-Oh!: XXX-ENXXX or XXX-XXX
+# Pokemon: XXX/XXX or XXX-XXX
+CARD_CODE_PATTERNS = [
+    re.compile(r'([A-Z0-9]+)-([A-Z0-9]+)'), # General hyphenated code
+    re.compile(r'([A-Z0-9]+)/([A-Z0-9]+)'), # Slash used in some games
+    re.compile(r'([A-Z]{2,3})([0-9]{3})')    # Direct concatenation
+]
+
+MANUAL_RESULT = {
+    "scan_method": "manual",
+    "confidence": 0.0,
+    "requires_confirmation": True,
+    "card_data": None
+}
+
+
+def parse_card_code(text):
+    """``{"set", "number"}`` of the first card code in OCR'd text, or None."""
+    for pattern in CARD_CODE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            return {
+                "set": match.group(1),
+                "number": match.group(2)
+            }
+    return None
+
+
+class UnreadableImage(Exception):
+    """The upload could not be decoded as an image."""
+
+
+class ScanContext:
+    """What the stages of one scan share: the photo, its warped card and what was read so far.
+
+    ``service`` is the RecognitionService doing the scan. A photo is only decoded and
+    warped when the first stage needs the card; ``warped`` skips that for cards already
+    detected (batch pages, live frames). ``digest`` enables the scan cache, and the S3
+    upload of ``image_bytes`` starts alongside the first CV job unless ``s3_url`` is known.
+    """
+
+    def __init__(self, service, image_bytes=None, warped=None, digest=None, owner_id=None,
+                 s3_url=None, batch=None):
+        self.service = service
+        self.cv = service.cv
+        self.image_bytes = image_bytes
+        self.digest = digest
+        self.owner_id = owner_id
+        self.hashes = None
+        # Game whose code band parsed, so the name stage reads only that layout
+        self.game = None
+        self.ocr_calls = 0
+        self.detect_seconds = 0.0
+        self._warped = warped
+        self._s3_url = s3_url
+        self._upload = None
+        # Semaphore limiting the CV jobs of the batch this card belongs to
+        self._batch = batch
+        self._admitted = False
+
+    async def run(self, fn, *args):
+        if self._batch is not None:
+            async with self._batch:
+                return await cv_pool.run(fn, *args, batch=True)
+        # Only the scan's first CV job may be turned away by a saturated pool; once admitted
+        # its later stages queue, so no work already done is thrown away
+        result = await cv_pool.run(fn, *args, wait=self._admitted)
+        self._admitted = True
+        return result
+
+    async def warped(self):
+        if self._upload is None and self._s3_url is None and self.image_bytes is not None:
+            self._upload = self.service.start_upload(self.image_bytes, self.digest)
+        if self._warped is None:
+            start = time.perf_counter()
+            self._warped = await self.run(self.cv.detect_card, self.image_bytes)
+            self.detect_seconds = time.perf_counter() - start
+            if self._warped is None:
+                raise UnreadableImage()
+        return self._warped
+
+    async def s3_url(self):
+        if self._upload is not None:
+            self._s3_url, self._upload = await self._upload, None
+        return self._s3_url
+
+
+class Stage:
+    """One step of the cascade.
+
+    ``run`` returns None or a ScanResponse-shaped dict, where a matched CardReference can be
+    given as ``reference`` instead of ``card_data`` (only the chosen result is looked up).
+    """
+    name = None
+    min_confidence = 1.0
+
+    def applies(self, ctx):
+        return True
+
+    async def run(self, ctx):
+        raise NotImplementedError
+
+
+class CacheStage(Stage):
+    name = "cache"
+    # A cached result is returned as it was, however confident
+    min_confidence = 0.0
+
+    def applies(self, ctx):
+        return ctx.digest is not None
+
+    async def run(self, ctx):
+        # Retries of the same upload (and, if enabled, rescans of the same card) reuse the recent result
+        cached = scan_cache.get(ctx.owner_id, ctx.digest)
+        if cached is None and scan_cache.near_distance:
+            ctx.hashes = await ctx.run(frame_hashes, ctx.image_bytes)
+            cached = scan_cache.get_near(ctx.owner_id, ctx.hashes)
+        if cached is None:
+            scan_cache.miss()
+        return cached
+
+
+class VisualStage(Stage):
+    name = "visual"
+    min_confidence = CASCADE_VISUAL_MIN_CONFIDENCE
+
+    def applies(self, ctx):
+        return len(get_visual_index()) > 0
+
+    async def run(self, ctx):
+        match = await ctx.run(ctx.cv.match_visual, await ctx.warped())
+        reference = reference_cache.get(match["reference_id"]) if match else None
+        if reference is None:
+            return None
+        distance = match["distance"]
+        return {
+            "scan_method": "visual",
+            "confidence": round(1 - distance / 64, 3),
+            "requires_confirmation": distance > VISUAL_MATCH_MAX_DISTANCE // 2,
+            "reference": reference,
+        }
+
+
+class CodeStage(Stage):
+    name = "code"
+    min_confidence = CASCADE_CODE_MIN_CONFIDENCE
+
+    def __init__(self):
+        # Layouts whose code band parsed most often are read first, so a collection that is
+        # mostly one game usually needs a single OCR call
+        self.games = Counter({game: 0 for game in LAYOUTS})
+
+    async def run(self, ctx):
+        games = [game for game, _ in self.games.most_common()]
+        read = await ctx.run(ctx.cv.read_code, await ctx.warped(), parse_card_code, games)
+        ctx.ocr_calls += read["ocr_calls"]
+        if read["game"] is None:
+            return None
+        self.games[read["game"]] += 1
+        ctx.game = read["game"]
+        return await ctx.service.lookup_code(parse_card_code(read["text"]))
+
+
+class NameStage(Stage):
+    name = "name"
+    min_confidence = CASCADE_NAME_MIN_CONFIDENCE
+
+    async def run(self, ctx):
+        names = await ctx.run(ctx.cv.read_names, await ctx.warped(), [ctx.game] if ctx.game else None)
+        ctx.ocr_calls += len(names)
+        return ctx.service.match_name([name for name in names.values() if name])
+
+
+class FullStage(Stage):
+    name = "full"
+    # Last, so this only decides what counts as a hit in the stats
+    min_confidence = CASCADE_NAME_MIN_CONFIDENCE
+
+    async def run(self, ctx):
+        text = await ctx.run(ctx.cv.read_full, await ctx.warped())
+        ctx.ocr_calls += 1
+        # The whole card's text has plenty of code-like words, so only trust a code CardReference knows
+        code = parse_card_code(text)
+        reference = reference_cache.lookup(code["set"], code["number"]) if code else None
+        if reference is not None:
+            return {"scan_method": "code", "confidence": 1.0, "requires_confirmation": False, "reference": reference}
+        return ctx.service.match_name([text]) if text.strip() else None
+
+
+STAGES = {stage.name: stage for stage in (CacheStage, VisualStage, CodeStage, NameStage, FullStage)}
+
+
+class RecognitionCascade:
+    def __init__(self, stages):
+        self.stages = stages
+        self.counters = {stage.name: Counter() for stage in stages}
+        self.seconds = Counter()
+        self.totals = Counter()
+
+    @classmethod
+    def from_names(cls, names=RECOGNITION_STAGES):
+        """The cascade of the comma-separated stage names, in that order."""
+        return cls([STAGES[name.strip()]() for name in names.split(",") if name.strip()])
+
+    async def run(self, ctx):
+        """``(stage name, result)`` of the scan; the stage is None when nothing was recognised."""
+        self.totals["scans"] += 1
+        best = None
+        try:
+            for stage in self.stages:
+                if not stage.applies(ctx):
+                    continue
+                counters = self.counters[stage.name]
+                start, detect_before = time.perf_counter(), ctx.detect_seconds
+                result, outcome = None, "error"
+                try:
+                    result = await stage.run(ctx)
+                    outcome = "miss" if result is None else "hit" if result["confidence"] >= stage.min_confidence \
+                        else "weak"
+                finally:
+                    counters["runs"] += 1
+                    # Finding and warping the card is timed on its own, not charged to the first CV stage
+                    detect = ctx.detect_seconds - detect_before
+                    elapsed = time.perf_counter() - start - detect
+                    self.seconds[stage.name] += elapsed
+                    self.seconds["detect"] += detect
+                    metrics.observe("recognition_stage_seconds", elapsed, stage=stage.name)
+                    metrics.inc("recognition_stage_total", stage=stage.name, outcome=outcome)
+                if result is None:
+                    continue
+                counters["results"] += 1
+                if result["confidence"] >= stage.min_confidence:
+                    counters["hits"] += 1
+                    return stage.name, result
+                if best is None or result["confidence"] > best[1]["confidence"]:
+                    best = (stage.name, result)
+        except UnreadableImage:
+            self.totals["unreadable"] += 1
+            return None, {"error": "Failed to process image"}
+        finally:
+            self.totals["ocr_calls"] += ctx.ocr_calls
+            self.totals["detections"] += ctx.detect_seconds > 0
+        # No stage was sure: the best guess, for the user to confirm
+        self.totals["unconfident"] += 1
+        return best or (None, dict(MANUAL_RESULT))
+
+    def stats(self):
+        scans = self.totals["scans"]
+        stages = {}
+        for stage in self.stages:
+            counters, runs = self.counters[stage.name], self.counters[stage.name]["runs"]
+            stages[stage.name] = {
+                "runs": runs,
+                "results": counters["results"],
+                "hits": counters["hits"],
+                "hit_rate": round(counters["hits"] / runs, 4) if runs else 0.0,
+                "avg_ms": round(self.seconds[stage.name] * 1000 / runs, 2) if runs else 0.0,
+                "min_confidence": stage.min_confidence,
+            }
+        return {
+            "scans": scans,
+            "unconfident": self.totals["unconfident"],
+            "unreadable": self.totals["unreadable"],
+            "ocr_calls_per_scan": round(self.totals["ocr_calls"] / scans, 3) if scans else 0.0,
+            "detect_avg_ms": round(self.seconds["detect"] * 1000 / self.totals["detections"], 2)
+            if self.totals["detections"] else 0.0,
+            "stages": stages,
+        }
+
+
+recognition_cascade = RecognitionCascade.from_names()
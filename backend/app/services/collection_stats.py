@@ -0,0 +1,216 @@
+"""Collection value statistics: live SQL aggregates and incrementally kept per-user rollups.
+
+``CollectionRollup`` holds, per user, the card count and value of the whole collection
+and of each game, set and rarity. Every card write adjusts it in the same transaction:
+ORM inserts, updates and deletes through the mapper events below, and set-based
+statements by calling ``record_cards`` (bulk import) or ``record_repricing`` (price
+refresh) themselves.
+"""
+import os
+from collections import defaultdict
+
+from sqlalchemy import delete, event, func, inspect, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from ..models import models
+from .prices import DEFAULT_CURRENCY, format_cents
+
+# Serve GET /cards/stats from the rollups (constant time) rather than aggregating the cards
+CARD_STATS_ROLLUPS = os.getenv("CARD_STATS_ROLLUPS", "1") == "1"
+CARD_STATS_BREAKDOWN_LIMIT = 50
+
+# dimension -> Card column it groups by
+DIMENSIONS = {
+    "game": models.Card.game,
+    "set": models.Card.set_code,
+    "rarity": models.Card.rarity,
+}
+_ROLLUP_FIELDS = ("owner_id", "game", "set_code", "rarity", "currency", "price_cents")
+_rollups = models.CollectionRollup.__table__
+
+
+def _contributions(card):
+    """Rollup keys a card counts towards; ``card`` is a mapping with ``_ROLLUP_FIELDS``."""
+    currency = card.get("currency") or DEFAULT_CURRENCY
+    yield ("total", "", currency)
+    for dimension, column in DIMENSIONS.items():
+        yield (dimension, card.get(column.key) or "", currency)
+
+
+def record_cards(connection, cards, sign=1):
+    """Add (``sign=1``) or remove (``sign=-1``) cards from their owners' rollups.
+
+    ``connection`` is a Session or Connection in the transaction that writes the cards.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for card in cards:
+        if card.get("owner_id") is None:
+            continue
+        cents = card.get("price_cents")
+        for dimension, key, currency in _contributions(card):
+            delta = deltas[(card["owner_id"], dimension, key, currency)]
+            delta[0] += sign
+            delta[1] += sign if cents is not None else 0
+            delta[2] += sign * (cents or 0)
+    _apply(connection, deltas)
+
+
+def record_repricing(connection, groups):
+    """Move rollups to the prices set by a set-based UPDATE.
+
+    Each group describes cards sharing an owner, game, set, rarity and currency, as
+    before the UPDATE: ``cards``, ``priced`` and ``value_cents`` are their count, how many
+    had a price and its sum. ``new_price_cents`` and ``new_currency`` are what they got.
+    """
+    deltas = defaultdict(lambda: [0, 0, 0])
+    for group in groups:
+        if group.get("owner_id") is None:
+            continue
+        cards, cents = group["cards"], group["new_price_cents"]
+        for dimension, key, currency in _contributions(group):
+            delta = deltas[(group["owner_id"], dimension, key, currency)]
+            delta[0] -= cards
+            delta[1] -= group["priced"]
+            delta[2] -= group["value_cents"]
+        for dimension, key, currency in _contributions({**group, "currency": group["new_currency"]}):
+            delta = deltas[(group["owner_id"], dimension, key, currency)]
+            delta[0] += cards
+            delta[1] += cards if cents is not None else 0
+            delta[2] += cards * (cents or 0)
+    _apply(connection, deltas)
+
+
+def _apply(connection, deltas):
+    rows = [
+        {"owner_id": owner_id, "dimension": dimension, "key": key, "currency": currency,
+         "card_count": count, "priced_count": priced, "value_cents": value}
+        for (owner_id, dimension, key, currency), (count, priced, value) in deltas.items()
+        if count or priced or value
+    ]
+    if not rows:
+        return
+    bind = connection.get_bind() if hasattr(connection, "get_bind") else connection
+    insert = postgresql.insert if bind.dialect.name == "postgresql" else sqlite.insert
+    stmt = insert(_rollups)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["owner_id", "dimension", "key", "currency"],
+        set_={column: _rollups.c[column] + stmt.excluded[column]
+              for column in ("card_count", "priced_count", "value_cents")},
+    )
+    connection.execute(stmt, rows)
+
+
+def rebuild(connection, owner_id=None):
+    """Recompute the rollups from the cards table, for one user or everyone."""
+    card = models.Card
+    clear = delete(_rollups)
+    where = []
+    if owner_id is not None:
+        clear = clear.where(_rollups.c.owner_id == owner_id)
+        where.append(card.owner_id == owner_id)
+    currency = func.coalesce(card.currency, DEFAULT_CURRENCY)
+    selects = []
+    for dimension, column in (("total", None), *DIMENSIONS.items()):
+        # Postgres rejects a constant in GROUP BY, so the total only groups by owner and currency
+        keys = [] if column is None else [func.coalesce(column, "")]
+        selects.append(
+            select(card.owner_id, literal(dimension), *(keys or [literal("")]), currency, func.count(),
+                   func.count(card.price_cents), func.coalesce(func.sum(card.price_cents), 0))
+            .where(card.owner_id.is_not(None), *where)
+            .group_by(card.owner_id, *keys, currency)
+        )
+    connection.execute(clear)
+    connection.execute(_rollups.insert().from_select(
+        ["owner_id", "dimension", "key", "currency", "card_count", "priced_count", "value_cents"],
+        union_all(*selects),
+    ))
+
+
+def _snapshot(card, history="current"):
+    state = inspect(card)
+    values = {}
+    for field in _ROLLUP_FIELDS:
+        attr = state.attrs[field]
+        if history == "previous" and attr.history.deleted:
+            values[field] = attr.history.deleted[0]
+        else:
+            values[field] = attr.value
+    return values
+
+
+@event.listens_for(models.Card, "after_insert")
+def _card_inserted(mapper, connection, target):
+    record_cards(connection, [_snapshot(target)])
+
+
+@event.listens_for(models.Card, "before_delete")
+def _card_deleted(mapper, connection, target):
+    # Before the DELETE, while expired attributes can still be loaded
+    record_cards(connection, [_snapshot(target, "previous")], sign=-1)
+
+
+@event.listens_for(models.Card, "after_update")
+def _card_updated(mapper, connection, target):
+    before, after = _snapshot(target, "previous"), _snapshot(target)
+    if before != after:
+        record_cards(connection, [before], sign=-1)
+        record_cards(connection, [after])
+
+
+def _bucket(key, currency, cards, priced, value_cents):
+    return {"key": key, "currency": currency, "cards": cards, "priced": priced,
+            "value_cents": value_cents, "value": format_cents(value_cents)}
+
+
+def _from_rollups(db, owner_id, limit):
+    stats = {}
+    for dimension in ("total", *DIMENSIONS):
+        rows = db.execute(
+            select(_rollups.c.key, _rollups.c.currency, _rollups.c.card_count,
+                   _rollups.c.priced_count, _rollups.c.value_cents)
+            .where(_rollups.c.owner_id == owner_id, _rollups.c.dimension == dimension,
+                   _rollups.c.card_count > 0)
+            .order_by(_rollups.c.value_cents.desc(), _rollups.c.card_count.desc(), _rollups.c.key)
+            .limit(limit)
+        ).all()
+        stats[dimension] = [_bucket(key or None, *rest) for key, *rest in rows]
+    return stats
+
+
+def _from_cards(db, owner_id, limit):
+    card = models.Card
+    currency = func.coalesce(card.currency, DEFAULT_CURRENCY)
+    value = func.coalesce(func.sum(card.price_cents), 0)
+    stats = {}
+    for dimension, column in (("total", None), *DIMENSIONS.items()):
+        keys = [] if column is None else [column]
+        rows = db.execute(
+            select(*(keys or [literal("")]), currency, func.count(), func.count(card.price_cents), value)
+            .where(card.owner_id == owner_id)
+            .group_by(*keys, currency)
+            .order_by(value.desc(), func.count().desc(), *keys)
+            .limit(limit)
+        ).all()
+        stats[dimension] = [_bucket(key or None, *rest) for key, *rest in rows]
+    return stats
+
+
+def collection_stats(db, owner_id, top_columns, top=10, limit=CARD_STATS_BREAKDOWN_LIMIT, rollups=CARD_STATS_ROLLUPS):
+    """Totals and per game/set/rarity breakdowns (by value, ``limit`` each) plus the ``top`` most
+    valuable cards, selected as ``top_columns``. Nothing is loaded row by row."""
+    stats = (_from_rollups if rollups else _from_cards)(db, owner_id, limit)
+    card = models.Card
+    top_cards = db.execute(
+        select(*top_columns)
+        .where(card.owner_id == owner_id, card.price_cents.is_not(None))
+        .order_by(card.price_cents.desc(), card.id.desc())
+        .limit(top)
+    ).all() if top else []
+    return {
+        "source": "rollups" if rollups else "cards",
+        "totals": stats["total"],
+        "by_game": stats["game"],
+        "by_set": stats["set"],
+        "by_rarity": stats["rarity"],
+        "top": top_cards,
+    }
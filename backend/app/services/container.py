@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import time
+
+from ..cv.processor import CVProcessor, get_ocr_backend
+from ..cv.visual_index import get_visual_index
+from .external_api import ExternalCardAPI, close_http_client, get_http_client
+from .name_index import name_index
+from .recognition import RecognitionService
+from .reference_cache import reference_cache
+from .s3_service import get_s3_client, s3_service
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceContainer:
+    """The scan pipeline's long-lived objects, built once per process and shared by every request.
+
+    The API builds one in its lifespan hook (``app.state.services``) and each scan
+    worker process builds its own. Only the database session is per request:
+    ``recognition(db)`` binds it to a lightweight RecognitionService.
+    """
+
+    def __init__(self, cv=None, external_api=None, s3=None):
+        self.cv = cv or CVProcessor()
+        self.external_api = external_api or ExternalCardAPI()
+        self.s3 = s3 or s3_service
+        self.startup_seconds = {}
+
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        fn(*args)
+        self.startup_seconds[name] = round(time.perf_counter() - start, 4)
+
+    def warm_up(self, db):
+        """Build the lazily created engines, clients and indexes now rather than on the first scan."""
+        # Before the worker pool starts, so forked CV workers inherit it
+        self._timed("visual_index", get_visual_index)
+        self._timed("ocr_backend", get_ocr_backend)
+        self._timed("name_index", name_index.refresh, db)
+        self._timed("reference_cache", reference_cache.load, db)
+        self._timed("http_client", get_http_client)
+        if self.s3.bucket_name:
+            self._timed("s3_client", get_s3_client)
+        logger.info(f"Services ready: {self.startup_seconds}")
+        return self
+
+    def recognition(self, db):
+        return RecognitionService(db, cv=self.cv, external_api=self.external_api, s3=self.s3)
+
+    async def aclose(self):
+        # Finish queued photo uploads before the process goes away
+        await asyncio.to_thread(self.s3.uploader.drain)
+        await close_http_client()
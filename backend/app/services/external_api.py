@@ -1,18 +1,115 @@
+import asyncio
+import importlib.util
 import httpx
 import logging
+import os
+import time
+
+from .. import metrics
+from .card_cache import CardDetailsCache, card_cache
 
 logger = logging.getLogger(__name__)
 
+YGOPRODECK_URL = os.getenv("YGOPRODECK_URL", "https://db.ygoprodeck.com/api/v7/cardinfo.php")
+POKEMONTCG_URL = os.getenv("POKEMONTCG_URL", "https://api.pokemontcg.io/v2/cards")
+EXTERNAL_API_TIMEOUT = float(os.getenv("EXTERNAL_API_TIMEOUT", "10"))
+EXTERNAL_API_MAX_CONNECTIONS = int(os.getenv("EXTERNAL_API_MAX_CONNECTIONS", "20"))
+
+GAMES = ["Yu-Gi-Oh!", "Pokemon"]
+
+_client = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Process-wide pooled client, so upstream connections (and TLS sessions) are reused."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(EXTERNAL_API_TIMEOUT, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=EXTERNAL_API_MAX_CONNECTIONS,
+                max_keepalive_connections=EXTERNAL_API_MAX_CONNECTIONS,
+                keepalive_expiry=60.0,
+            ),
+            # HTTP/2 needs the optional h2 package (httpx[http2])
+            http2=importlib.util.find_spec("h2") is not None,
+        )
+    return _client
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _pokemon_price(card):
+    # Market price of the first listed variant, e.g. holofoil
+    prices = (card.get("tcgplayer") or {}).get("prices")
+    if prices:
+        return next(iter(prices.values())).get("market")
+    return None
+
+
 class ExternalCardAPI:
-    def __init__(self):
-        self.yugioh_url = "https://db.ygoprodeck.com/api/v7/cardinfo.php"
-        self.pokemon_url = "https://api.pokemontcg.io/v2/cards"
+    def __init__(self, client: httpx.AsyncClient = None, cache: CardDetailsCache = None):
+        self.yugioh_url = YGOPRODECK_URL
+        self.pokemon_url = POKEMONTCG_URL
+        self._client = client
+        self.cache = cache or card_cache
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_http_client()
+
+    async def _get(self, upstream, url, **kwargs):
+        # Every upstream request goes through here to be timed by upstream and status
+        if not metrics.active():
+            return await self.client.get(url, **kwargs)
+        start, status = time.perf_counter(), "error"
+        try:
+            response = await self.client.get(url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            metrics.observe("external_api_seconds", time.perf_counter() - start, upstream=upstream, status=status)
 
     async def get_card_details(self, game: str, set_code: str, card_number: str):
         if game.lower() == "yu-gi-oh!":
-            return await self._get_yugioh_details(set_code, card_number)
+            fetch = self._get_yugioh_details
         elif game.lower() == "pokemon":
-            return await self._get_pokemon_details(set_code, card_number)
+            fetch = self._get_pokemon_details
+        else:
+            return None
+
+        key = (game.lower(), set_code.upper(), card_number.upper())
+        try:
+            return await self.cache.get_or_fetch(key, lambda: fetch(set_code, card_number))
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching {game} data: {e}")
+            return None
+
+    async def find_card(self, set_code: str, card_number: str, games=GAMES):
+        """Probe every game concurrently; the first one that knows the code wins.
+
+        Returns ``(game, details)`` or None. Slower probes are cancelled once a winner is found.
+        """
+        tasks = {
+            asyncio.create_task(self.get_card_details(game, set_code, card_number)): game
+            for game in games
+        }
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    game = tasks.pop(task)
+                    details = task.result()
+                    if details:
+                        return game, details
+        finally:
+            for task in tasks:
+                task.cancel()
         return None
 
     async def _get_yugioh_details(self, set_code: str, card_number: str):
@@ -20,36 +117,40 @@ class ExternalCardAPI:
         full_code = f"{set_code}-{card_number}"
         params = {"cardset": full_code}
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(self.yugioh_url, params=params)
-                if response.status_code == 200:
-                    data = response.json().get("data", [])
-                    if data:
-                        card = data[0]
-                        # Extract price and rarity from the matching set if possible
-                        price = "0.00"
-                        rarity = "Common"
-                        
-                        full_code = f"{set_code}-{card_number}".upper()
-                        sets = card.get("card_sets", [])
-                        matching_set = next((s for s in sets if s.get("set_code") == full_code), None)
-                        
-                        if matching_set:
-                            price = matching_set.get("set_price", "0.00")
-                            rarity = matching_set.get("set_rarity", "Common")
-                        elif card.get("card_prices"):
-                            # Fallback to general TCGPlayer price if set matching fails
-                            price = card["card_prices"][0].get("tcgplayer_price", "0.00")
-                            if sets:
-                                rarity = sets[0].get("set_rarity", "Common")
-                        
-                        return {
-                            "name": card.get("name"),
-                            "description": card.get("desc"),
-                            "price": price,
-                            "image_url": card.get("card_images", [{}])[0].get("image_url"),
-                            "rarity": rarity
-                        }
+            response = await self._get("ygoprodeck", self.yugioh_url, params=params)
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code == 200:
+                data = response.json().get("data", [])
+                if data:
+                    card = data[0]
+                    # Extract price and rarity from the matching set if possible
+                    price = "0.00"
+                    rarity = "Common"
+                    
+                    full_code = f"{set_code}-{card_number}".upper()
+                    sets = card.get("card_sets", [])
+                    matching_set = next((s for s in sets if s.get("set_code") == full_code), None)
+                    
+                    if matching_set:
+                        price = matching_set.get("set_price", "0.00")
+                        rarity = matching_set.get("set_rarity", "Common")
+                    elif card.get("card_prices"):
+                        # Fallback to general TCGPlayer price if set matching fails
+                        price = card["card_prices"][0].get("tcgplayer_price", "0.00")
+                        if sets:
+                            rarity = sets[0].get("set_rarity", "Common")
+                    
+                    return {
+                        "name": card.get("name"),
+                        "description": card.get("desc"),
+                        "price": price,
+                        "image_url": card.get("card_images", [{}])[0].get("image_url"),
+                        "rarity": rarity
+                    }
+        except httpx.HTTPError:
+            # Upstream unavailable rather than "no such card": don't let it be cached as a miss
+            raise
         except Exception as e:
             logger.error(f"Error fetching Yu-Gi-Oh! data: {e}")
         return None
@@ -62,26 +163,55 @@ class ExternalCardAPI:
             query += f" set.id:{set_code.lower()}"
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(self.pokemon_url, params={"q": query})
-                if response.status_code == 200:
-                    data = response.json().get("data", [])
-                    if data:
-                        card = data[0]
-                        price = "0.00"
-                        if card.get("tcgplayer", {}).get("prices"):
-                            # Get a price, e.g., holofoil market price
-                            prices = card["tcgplayer"]["prices"]
-                            first_type = list(prices.keys())[0]
-                            price = prices[first_type].get("market", "0.00")
-                        
-                        return {
-                            "name": card.get("name"),
-                            "description": card.get("flavorText", ""),
-                            "price": str(price),
-                            "image_url": card.get("images", {}).get("large"),
-                            "rarity": card.get("rarity")
-                        }
+            response = await self._get("pokemontcg", self.pokemon_url, params={"q": query})
+            if response.status_code == 429 or response.status_code >= 500:
+                response.raise_for_status()
+            if response.status_code == 200:
+                data = response.json().get("data", [])
+                if data:
+                    card = data[0]
+                    return {
+                        "name": card.get("name"),
+                        "description": card.get("flavorText", ""),
+                        "price": str(_pokemon_price(card) or "0.00"),
+                        "image_url": card.get("images", {}).get("large"),
+                        "rarity": card.get("rarity")
+                    }
+        except httpx.HTTPError:
+            # Upstream unavailable rather than "no such card": don't let it be cached as a miss
+            raise
         except Exception as e:
             logger.error(f"Error fetching Pokemon data: {e}")
         return None
+
+    async def get_yugioh_prices(self, names):
+        """Set prices of every printing of the named cards, in one request.
+
+        Returns ``{(set_code, card_number): price}``, or None if YGOPRODeck rejected the
+        query because a name is unknown (it answers 400 for the whole request then).
+        HTTP errors and 429s are raised for the caller to retry.
+        """
+        response = await self._get("ygoprodeck", self.yugioh_url, params={"name": "|".join(names)})
+        if response.status_code == 400:
+            return None
+        response.raise_for_status()
+        prices = {}
+        for card in response.json().get("data", []):
+            for printing in card.get("card_sets") or []:
+                code = (printing.get("set_code") or "").upper()
+                if "-" in code:
+                    prices[tuple(code.split("-", 1))] = printing.get("set_price")
+        return prices
+
+    async def get_pokemon_prices(self, set_code, card_numbers):
+        """Market prices of several cards of one set, in one request: ``{CARD_NUMBER: price}``."""
+        numbers = " OR ".join(f"number:{number}" for number in card_numbers)
+        response = await self._get(
+            "pokemontcg", self.pokemon_url,
+            params={"q": f"set.id:{set_code.lower()} ({numbers})", "pageSize": 250},
+        )
+        response.raise_for_status()
+        return {
+            str(card.get("number", "")).upper(): _pokemon_price(card)
+            for card in response.json().get("data", [])
+        }
@@ -0,0 +1,138 @@
+import datetime
+import json
+import logging
+import os
+import uuid
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+logger = logging.getLogger(__name__)
+
+# A running job whose worker has not renewed its lease within this time is handed to another worker
+SCAN_JOB_LEASE_SECONDS = float(os.getenv("SCAN_JOB_LEASE_SECONDS", "300"))
+# Attempts (including crashed ones) before a job is marked failed
+SCAN_JOB_MAX_ATTEMPTS = int(os.getenv("SCAN_JOB_MAX_ATTEMPTS", "3"))
+
+Status = models.JobStatus
+
+
+def enqueue(db: Session, owner_id, kind, images, segment=False):
+    """Store a job and its images; returns the job id."""
+    job = models.ScanJob(id=uuid.uuid4().hex, owner_id=owner_id, kind=kind, segment=int(segment))
+    db.add(job)
+    db.add_all(models.ScanJobImage(job_id=job.id, position=i, data=data) for i, data in enumerate(images))
+    db.commit()
+    return job.id
+
+
+def _claimable(now):
+    job = models.ScanJob
+    return or_(
+        job.status == Status.QUEUED.value,
+        (job.status == Status.RUNNING.value) & (job.locked_until < now),
+    )
+
+
+def claim(db: Session, worker_id):
+    """Lease the oldest runnable job to ``worker_id``; returns it, or None if the queue is empty.
+
+    The conditional UPDATE makes the claim atomic: if two workers pick the same candidate,
+    only one of them changes the row.
+    """
+    while True:
+        now = datetime.datetime.utcnow()
+        candidate = db.query(models.ScanJob.id).filter(_claimable(now)).order_by(
+            models.ScanJob.created_at
+        ).limit(1).scalar()
+        if candidate is None:
+            return None
+        claimed = db.execute(
+            update(models.ScanJob)
+            .where(models.ScanJob.id == candidate, _claimable(now))
+            .values(
+                status=Status.RUNNING.value,
+                locked_by=worker_id,
+                locked_until=now + datetime.timedelta(seconds=SCAN_JOB_LEASE_SECONDS),
+                attempts=models.ScanJob.attempts + 1,
+                started_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        if not claimed:
+            continue  # Another worker won the race; try the next job
+
+        job = db.get(models.ScanJob, candidate)
+        db.refresh(job)
+        if job.attempts > SCAN_JOB_MAX_ATTEMPTS:
+            # Kept crashing its workers (e.g. an image that kills the OCR engine)
+            finish(db, job, worker_id, error=f"Gave up after {job.attempts - 1} attempts")
+            continue
+        return job
+
+
+def images(db: Session, job):
+    rows = db.query(models.ScanJobImage.data).filter(
+        models.ScanJobImage.job_id == job.id
+    ).order_by(models.ScanJobImage.position)
+    return [data for (data,) in rows]
+
+
+def _update_leased(db: Session, job_id, worker_id, **values):
+    # Changes the job only while ``worker_id`` still holds it; False once the lease was lost
+    updated = db.execute(
+        update(models.ScanJob)
+        .where(models.ScanJob.id == job_id, models.ScanJob.locked_by == worker_id,
+               models.ScanJob.status == Status.RUNNING.value)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    return updated == 1
+
+
+def renew(db: Session, job_id, worker_id):
+    """Extend ``worker_id``'s lease on a running job; returns False if another worker took it over."""
+    renewed = _update_leased(
+        db, job_id, worker_id,
+        locked_until=datetime.datetime.utcnow() + datetime.timedelta(seconds=SCAN_JOB_LEASE_SECONDS),
+    )
+    db.commit()
+    return renewed
+
+
+def finish(db: Session, job, worker_id, result=None, error=None):
+    """Store the outcome of a job; returns False, leaving the job alone, if the lease was lost."""
+    finished = _update_leased(
+        db, job.id, worker_id,
+        status=Status.FAILED.value if error else Status.DONE.value,
+        result=json.dumps(result) if result is not None else None,
+        error=error,
+        locked_until=None,
+        finished_at=datetime.datetime.utcnow(),
+    )
+    if finished:
+        db.query(models.ScanJobImage).filter(models.ScanJobImage.job_id == job.id).delete()
+    db.commit()
+    return finished
+
+
+def release(db: Session, job, worker_id, error):
+    """Put a job that failed transiently back in the queue, or fail it once out of attempts.
+
+    Returns False if the lease was lost, like ``finish``.
+    """
+    if job.attempts >= SCAN_JOB_MAX_ATTEMPTS:
+        return finish(db, job, worker_id, error=error)
+    released = _update_leased(db, job.id, worker_id, status=Status.QUEUED.value, error=error, locked_until=None)
+    db.commit()
+    return released
+
+
+def get(db: Session, job_id, owner_id):
+    job = db.get(models.ScanJob, job_id)
+    if job is None or job.owner_id != owner_id:
+        return None
+    return job
@@ -0,0 +1,185 @@
+"""Live camera scanning: recognise a card from a stream of frames instead of one still.
+
+Every frame gets the cheap check only (``CVProcessor.inspect_frame``: find the card,
+measure its sharpness). Frames that arrive while one is being checked replace each
+other, so a slow server drops frames instead of falling behind. Once the card has held
+still for LIVE_SCAN_STABLE_FRAMES frames, the sharpest frame of that run is OCR'd.
+A confident result is pushed straight away. Otherwise a noticeably sharper frame is
+tried, up to LIVE_SCAN_MAX_ATTEMPTS times, before the best guess is sent for
+confirmation.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+import numpy as np
+
+from .worker_pool import WorkerPoolBusy, cv_pool
+
+logger = logging.getLogger(__name__)
+
+# Consecutive frames the card must stay in place before it is OCR'd
+LIVE_SCAN_STABLE_FRAMES = int(os.getenv("LIVE_SCAN_STABLE_FRAMES", "3"))
+# How far (fraction of the frame) a corner may move between frames and still count as in place
+LIVE_SCAN_STABLE_DISTANCE = float(os.getenv("LIVE_SCAN_STABLE_DISTANCE", "0.02"))
+# Laplacian variance below which a frame is too blurred to be worth OCR at all
+LIVE_SCAN_MIN_SHARPNESS = float(os.getenv("LIVE_SCAN_MIN_SHARPNESS", "50"))
+# A result at least this confident is sent without trying more frames
+LIVE_SCAN_MIN_CONFIDENCE = float(os.getenv("LIVE_SCAN_MIN_CONFIDENCE", "0.9"))
+LIVE_SCAN_MAX_ATTEMPTS = int(os.getenv("LIVE_SCAN_MAX_ATTEMPTS", "3"))
+# A retry needs a frame this much sharper than the last one OCR'd
+LIVE_SCAN_RETRY_SHARPER = 1.25
+LIVE_SCAN_MAX_FRAME_BYTES = int(os.getenv("LIVE_SCAN_MAX_FRAME_BYTES", str(512 * 1024)))
+# A session with no frames for this long is closed
+LIVE_SCAN_IDLE_SECONDS = float(os.getenv("LIVE_SCAN_IDLE_SECONDS", "30"))
+
+
+def _control(message):
+    # Control messages are {"type": ...} JSON, or just the type
+    try:
+        parsed = json.loads(message)
+    except ValueError:
+        return message.strip()
+    return parsed.get("type") if isinstance(parsed, dict) else None
+
+
+class LiveScanSession:
+    """State of one live-scan connection.
+
+    ``recognize(warped, frame_bytes)`` resolves a chosen frame to a ScanResponse dict.
+    ``serve`` reads frames with ``receive()`` (bytes, a text control message, or None
+    once the client is gone) and pushes JSON-able messages with ``send(message)``.
+    """
+
+    def __init__(self, cv, recognize):
+        self.cv = cv
+        self.recognize = recognize
+        self.counters = Counter(frames=0, processed=0, dropped=0, ocr_runs=0, results=0)
+        self._latest = None
+        self._frame_ready = asyncio.Event()
+        self._closed = False
+        self._ocr = None
+        self._reset()
+        # After a result, nothing more is OCR'd until the card leaves the frame (or "next")
+        self._paused = False
+
+    def _reset(self):
+        # A new stable run: the card just appeared or moved
+        self._corners = None
+        self._stable = 0
+        self._best = None  # (sharpness, warped, frame_bytes)
+        self._attempts = 0
+        self._tried_sharpness = 0.0
+        self._best_result = None
+        self._seen_at = None
+
+    async def serve(self, receive, send):
+        reader = asyncio.ensure_future(self._read(receive, send))
+        try:
+            while not self._closed:
+                await self._frame_ready.wait()
+                self._frame_ready.clear()
+                frame, self._latest = self._latest, None
+                if frame is not None:
+                    await self._process(frame, send)
+        finally:
+            reader.cancel()
+            if self._ocr is not None:
+                self._ocr.cancel()
+
+    async def _read(self, receive, send):
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(receive(), LIVE_SCAN_IDLE_SECONDS)
+                except asyncio.TimeoutError:
+                    message = None
+                if message is None:
+                    break
+                if isinstance(message, str):
+                    if _control(message) == "next":
+                        # The client wants another scan of the card still in view
+                        self._paused = False
+                        self._reset()
+                    continue
+                if len(message) > LIVE_SCAN_MAX_FRAME_BYTES:
+                    await send({"type": "error", "detail": f"Frames are limited to {LIVE_SCAN_MAX_FRAME_BYTES} bytes"})
+                    continue
+                self.counters["frames"] += 1
+                if self._latest is not None:
+                    # The previous frame was never looked at: the newest one replaces it
+                    self.counters["dropped"] += 1
+                self._latest = message
+                self._frame_ready.set()
+        finally:
+            self._closed = True
+            self._frame_ready.set()
+
+    async def _process(self, frame, send):
+        try:
+            found = await cv_pool.run(self.cv.inspect_frame, frame)
+        except WorkerPoolBusy:
+            self.counters["dropped"] += 1
+            return
+        self.counters["processed"] += 1
+        if found is None:
+            self._paused = False
+            self._reset()
+            await send({"type": "frame", "card": False})
+            return
+
+        now = time.perf_counter()
+        if self._corners is None or np.abs(found["corners"] - self._corners).max() > LIVE_SCAN_STABLE_DISTANCE:
+            seen_at = self._seen_at or now
+            self._reset()
+            self._seen_at = seen_at
+        self._corners = found["corners"]
+        self._stable += 1
+        if self._best is None or found["sharpness"] > self._best[0]:
+            self._best = (found["sharpness"], found["warped"], frame)
+        stable = self._stable >= LIVE_SCAN_STABLE_FRAMES
+        await send({"type": "frame", "card": True, "stable": stable, "sharpness": round(found["sharpness"], 1)})
+
+        sharpest = self._best[0]
+        if (stable and not self._paused and self._ocr is None and self._attempts < LIVE_SCAN_MAX_ATTEMPTS
+                and sharpest >= LIVE_SCAN_MIN_SHARPNESS
+                and (not self._attempts or sharpest >= self._tried_sharpness * LIVE_SCAN_RETRY_SHARPER)):
+            self._attempts += 1
+            self._tried_sharpness = sharpest
+            self._ocr = asyncio.ensure_future(self._recognize(self._best, send))
+
+    async def _recognize(self, best, send):
+        try:
+            _, warped, frame = best
+            self.counters["ocr_runs"] += 1
+            try:
+                result = await self.recognize(warped, frame)
+            except WorkerPoolBusy:
+                # Try again on a later frame
+                self._attempts -= 1
+                return
+            except Exception as e:
+                logger.exception("Live scan recognition failed")
+                await send({"type": "error", "detail": str(e) or type(e).__name__})
+                return
+            if "error" in result:
+                await send({"type": "error", "detail": result["error"]})
+                return
+            if self._best_result is None or result["confidence"] > self._best_result["confidence"]:
+                self._best_result = result
+            if result["confidence"] >= LIVE_SCAN_MIN_CONFIDENCE or self._attempts >= LIVE_SCAN_MAX_ATTEMPTS:
+                self._paused = True
+                self.counters["results"] += 1
+                elapsed = time.perf_counter() - (self._seen_at or time.perf_counter())
+                await send({
+                    "type": "result",
+                    **self._best_result,
+                    "attempts": self._attempts,
+                    "elapsed_ms": round(elapsed * 1000),
+                    **self.counters,
+                })
+        finally:
+            self._ocr = None
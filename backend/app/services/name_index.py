@@ -0,0 +1,251 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from sqlalchemy.orm import Session
+
+from ..database import run_db
+from ..models import models
+from .reference_cache import catalog_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Candidates below this score are not offered as a match
+NAME_MATCH_MIN_SCORE = float(os.getenv("NAME_MATCH_MIN_SCORE", "0.5"))
+# How often the index picks up references added or renamed by other processes (e.g. catalog sync)
+NAME_INDEX_REFRESH_SECONDS = float(os.getenv("NAME_INDEX_REFRESH_SECONDS", "60"))
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+# Only the rarest query trigrams generate candidates; common ones mostly add noise and cost
+_CANDIDATE_GRAMS = 8
+_MIN_CANDIDATE_GRAMS = 6
+# Posting entries counted per query once the minimum number of grams is reached
+_CANDIDATE_BUDGET = 4000
+# Pending additions are merged into the frozen postings after this many names
+_COMPACT_EVERY = 1024
+# How many trigram-overlap candidates get re-ranked by edit distance
+_RERANK = 16
+# Re-ranking stops once k candidates score at least this (they are tried most overlap first)
+_GOOD_ENOUGH = 0.9
+
+
+def normalize_name(text):
+    return " ".join(_NON_ALNUM.sub(" ", text.lower()).split())
+
+
+def _trigrams(name):
+    padded = f"  {name} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _pattern_masks(pattern):
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    return peq
+
+
+def levenshtein(a, b, peq=None):
+    """Edit distance using Myers' bit-parallel algorithm; ``peq`` caches ``_pattern_masks(b)``."""
+    if not b:
+        return len(a)
+
+    if peq is None:
+        peq = _pattern_masks(b)
+    mask = (1 << len(b)) - 1
+    last = 1 << (len(b) - 1)
+    pv, mv, score = mask, 0, len(b)
+    for c in a:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = ((ph << 1) | 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return score
+
+
+def _count_slots(slots):
+    # np.unique(slots, return_counts=True) without its overhead
+    slots = np.sort(slots)
+    starts = np.flatnonzero(np.concatenate(([True], slots[1:] != slots[:-1])))
+    return slots[starts], np.diff(np.append(starts, len(slots)))
+
+
+class NameIndex:
+    """Trigram inverted index over CardReference names with edit-distance re-ranking.
+
+    Postings are frozen into numpy arrays of slot numbers so candidate counting is a single
+    ``bincount``; names added since the last compaction sit in small pending lists.
+    """
+
+    def __init__(self):
+        self._names = []  # slot -> normalized name, None once removed
+        self._ids = []  # slot -> CardReference id
+        self._slots = {}  # CardReference id -> slot
+        self._frozen = {}  # trigram -> np.ndarray of slots
+        self._pending = defaultdict(list)  # trigram -> slots added since the last compaction
+        self._pending_count = 0
+        self._max_id = 0
+        self._fingerprint = None
+        self._refreshed_at = 0.0
+        self._refresh_task = None
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, ref_id, name):
+        self.remove(ref_id)
+        normalized = normalize_name(name or "")
+        if not normalized:
+            return
+        slot = len(self._names)
+        self._names.append(normalized)
+        self._ids.append(ref_id)
+        self._slots[ref_id] = slot
+        for gram in _trigrams(normalized):
+            self._pending[gram].append(slot)
+        self._pending_count += 1
+        self._max_id = max(self._max_id, ref_id)
+        if self._pending_count >= _COMPACT_EVERY:
+            self._compact()
+
+    def remove(self, ref_id):
+        # Stale slots stay in the postings and are skipped when re-ranking
+        slot = self._slots.pop(ref_id, None)
+        if slot is not None:
+            self._names[slot] = None
+
+    def _compact(self):
+        for gram, slots in self._pending.items():
+            added = np.array(slots, dtype=np.int32)
+            existing = self._frozen.get(gram)
+            self._frozen[gram] = added if existing is None else np.concatenate([existing, added])
+        self._pending = defaultdict(list)
+        self._pending_count = 0
+
+    def _changes(self, db: Session):
+        """What a refresh has to apply: ``(fingerprint, new rows, rebuilt index)``.
+
+        Only reads the index, so it can run on a worker thread while searches go on.
+        """
+        fingerprint = catalog_fingerprint(db)
+        if fingerprint == self._fingerprint:
+            return fingerprint, [], None
+        rows = db.query(models.CardReference.id, models.CardReference.name)
+        if self._fingerprint is not None and fingerprint[1] == self._fingerprint[1]:
+            # Only new rows: index them on top
+            return fingerprint, rows.filter(models.CardReference.id > self._max_id).all(), None
+        # Catalog sync ran and may have renamed cards under their existing ids: start over
+        fresh = NameIndex()
+        for ref_id, name in rows.yield_per(10000):
+            fresh.add(ref_id, name)
+        fresh._compact()
+        return fingerprint, [], fresh
+
+    def _apply(self, fingerprint, rows, fresh):
+        if fresh is not None:
+            self._names, self._ids, self._slots = fresh._names, fresh._ids, fresh._slots
+            self._frozen, self._pending, self._pending_count = fresh._frozen, fresh._pending, fresh._pending_count
+            self._max_id = fresh._max_id
+        for ref_id, name in rows:
+            self.add(ref_id, name)
+        self._compact()
+        self._fingerprint = fingerprint
+        self._refreshed_at = time.monotonic()
+
+    def refresh(self, db: Session):
+        """Bring the index up to date with CardReference, blocking until done (startup)."""
+        self._apply(*self._changes(db))
+
+    def refresh_if_stale(self):
+        """Start a background refresh when one is due; searches use the current index meanwhile."""
+        if self._refresh_task is None and time.monotonic() - self._refreshed_at >= NAME_INDEX_REFRESH_SECONDS:
+            self._refresh_task = asyncio.ensure_future(self._refresh_in_background())
+
+    async def _refresh_in_background(self):
+        try:
+            # The DB reads and any rebuild run on a thread; the result is swapped in on the event loop
+            self._apply(*await run_db(self._changes))
+        except Exception as e:
+            logger.error(f"Name index refresh failed: {e}")
+            self._refreshed_at = time.monotonic()
+        finally:
+            self._refresh_task = None
+
+    def search(self, text, k=5):
+        """Top ``k`` ``(ref_id, score)`` pairs for noisy OCR text, best first.
+
+        Scores are in [NAME_MATCH_MIN_SCORE, 1]; weaker candidates are never worth offering.
+        """
+        query = normalize_name(text)
+        if not query or not self._slots:
+            return []
+
+        postings = []
+        for gram in _trigrams(query):
+            lists = [p for p in (self._frozen.get(gram), self._pending.get(gram)) if p is not None]
+            if lists:
+                postings.append((sum(len(p) for p in lists), lists))
+        if not postings:
+            return []
+        postings.sort(key=lambda entry: entry[0])
+
+        # Rarest grams first, stopping once enough postings are gathered to find the name
+        chosen, grams, total = [], 0, 0
+        for size, lists in postings[:_CANDIDATE_GRAMS]:
+            if grams >= _MIN_CANDIDATE_GRAMS and total + size > _CANDIDATE_BUDGET:
+                break
+            chosen.extend(lists)
+            grams += 1
+            total += size
+        slots, counts = _count_slots(np.concatenate(chosen))
+        if len(slots) > _RERANK:
+            # The _RERANK best-overlapping slots. Counts are small and tie a lot, which makes
+            # argpartition slow, so cut at the count where enough slots are reached instead.
+            at_least = np.cumsum(np.bincount(counts)[::-1])[::-1]
+            cut = int(np.flatnonzero(at_least >= _RERANK)[-1])
+            above = counts > cut
+            tied = np.flatnonzero(counts == cut)[:_RERANK - int(above.sum())]
+            keep = np.concatenate([np.flatnonzero(above), tied])
+            slots, counts = slots[keep], counts[keep]
+        order = np.argsort(-counts, kind="stable")
+
+        peq = _pattern_masks(query)
+        best = []  # min-heap of the k best (score, ref_id)
+        good = 0
+        for slot, count in zip(slots[order].tolist(), counts[order].tolist()):
+            name = self._names[slot]
+            if name is None:
+                continue
+            longest = max(len(query), len(name))
+            # Lower bounds on the edits, to skip names that can't make it without running Myers:
+            # the length difference, and one edit per three of the chosen grams the name lacks
+            bound = 1 - max(abs(len(name) - len(query)), (grams - count + 2) // 3) / longest
+            if bound < NAME_MATCH_MIN_SCORE or (len(best) == k and bound <= best[0][0]):
+                continue
+            score = 1 - levenshtein(name, query, peq) / longest
+            if len(best) < k:
+                heapq.heappush(best, (score, self._ids[slot]))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score, self._ids[slot]))
+            good += score >= _GOOD_ENOUGH
+            if good >= k:
+                break
+        return [(ref_id, round(score, 3)) for score, ref_id in sorted(best, reverse=True)]
+
+
+name_index = NameIndex()
@@ -0,0 +1,31 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Currency of prices that don't name one; TCGPlayer and YGOPRODeck quote US dollars
+DEFAULT_CURRENCY = "USD"
+
+
+def to_cents(value):
+    """Integer cents of a price like ``"12.5"``, ``"$1,299.00"`` or ``3.2``; None when empty.
+
+    Raises ValueError for anything else, including negative prices.
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.strip().lstrip("$").replace(",", "").strip()
+        if not value:
+            return None
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"Not a price: {value!r}")
+    if not amount.is_finite() or amount < 0:
+        raise ValueError(f"Not a price: {value!r}")
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    """``1299`` -> ``"12.99"``; None stays None."""
+    if cents is None:
+        return None
+    return f"{cents // 100}.{cents % 100:02d}"
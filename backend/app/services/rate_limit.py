@@ -0,0 +1,56 @@
+import math
+import threading
+import time
+
+
+class RateLimiter:
+    """In-process token buckets, one per key (e.g. a client address or an account).
+
+    Each bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per second.
+    A ``rate`` of 0 disables limiting. Full buckets are dropped, so idle keys cost nothing.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = {}  # key -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, tokens=1):
+        """Take ``tokens`` from the key's bucket; returns 0 if allowed, else seconds until it would be."""
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            level, updated_at = self._buckets.get(key, (self.burst, now))
+            level = min(self.burst, level + (now - updated_at) * self.rate)
+            if level < tokens:
+                self._buckets[key] = (level, now)
+                return (tokens - level) / self.rate
+            self._buckets[key] = (level - tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+        return 0.0
+
+    def refund(self, key, tokens=1):
+        """Give back tokens taken by ``acquire``, e.g. for an attempt that turned out not to count."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        with self._lock:
+            level, updated_at = self._buckets.get(key, (self.burst, now))
+            level = min(self.burst, level + (now - updated_at) * self.rate + tokens)
+            if level >= self.burst:
+                self._buckets.pop(key, None)
+            else:
+                self._buckets[key] = (level, now)
+
+    def _prune(self, now):
+        for key, (level, updated_at) in list(self._buckets.items()):
+            if level + (now - updated_at) * self.rate >= self.burst:
+                del self._buckets[key]
+
+
+def retry_after_header(seconds):
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
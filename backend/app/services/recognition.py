@@ -1,145 +1,231 @@
 from sqlalchemy.orm import Session
-from ..models import models
-from .. import schemas
+from .. import metrics, schemas
 from ..cv.processor import CVProcessor
+from .cascade import ScanContext, recognition_cascade
 from .external_api import ExternalCardAPI
-from .s3_service import S3Service
-import re
-import uuid
+from .name_index import NAME_MATCH_MIN_SCORE, name_index
+from .reference_cache import reference_cache
+from .s3_service import s3_service
+from .scan_cache import content_hash, scan_cache
+from .worker_pool import cv_pool
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# CV jobs one batch scan runs at once; 0 means the CV pool's whole share for batches
+SCAN_BATCH_CONCURRENCY = int(os.getenv("SCAN_BATCH_CONCURRENCY", "0"))
+
+def batch_item(index, position, result):
+    """One entry of a batch scan's output, ready for JSON."""
+    if "error" in result:
+        return {"image": index, "position": position, "error": result["error"]}
+    return schemas.BatchScanItem(image=index, position=position, **result).model_dump(mode="json")
 
 class RecognitionService:
-    def __init__(self, db: Session):
+    # The API and scan workers pass in their shared ServiceContainer objects; only db is per request
+    def __init__(self, db: Session, cv=None, external_api=None, s3=None, cascade=None):
         self.db = db
-        self.cv = CVProcessor()
-        self.external_api = ExternalCardAPI()
-        self.s3 = S3Service()
-
-    async def scan_card(self, image_bytes: bytes):
-        # 0. Upload image to S3 (if configured)
-        s3_url = self.s3.upload_image(image_bytes, f"scans/{uuid.uuid4()}.jpg")
-
-        # 1. Try Primary Path (Visual)
-        cv_result = self.cv.process_image(image_bytes)
-        if not cv_result:
-            return {"error": "Failed to process image"}
-        
-        full_text = cv_result["text"]
-        img = cv_result["image"]
-        
-        # Simple fuzzy matching or direct lookup (mocked for now)
-        # In real case, we'd search CardReference by name extracted from full_text
-        
-        # 2. Try Failsafe Path (Card Code)
-        code_text = self.cv.extract_card_code(img)
-        detected_code = self._parse_card_code(code_text)
-        
-        if detected_code:
-            # Lookup in DB
-            reference = self.db.query(models.CardReference).filter(
-                models.CardReference.set_code == detected_code['set'],
-                models.CardReference.card_number == detected_code['number']
-            ).first()
-            
-            # Even if not in local reference DB, try external API
-            game_guess = "Yu-Gi-Oh!" if "-" in f"{detected_code['set']}-{detected_code['number']}" else "Pokemon"
-            # Actually our regexes are generic. Let's try to be smart or just try both.
-            # For now, let's use the reference if found, otherwise try external with a guess.
-            
-            external_data = None
-            if reference:
-                external_data = await self.external_api.get_card_details(
-                    reference.game, reference.set_code, reference.card_number
-                )
-                
-                card_data = {
-                    "name": reference.name,
-                    "game": reference.game,
-                    "set_code": reference.set_code,
-                    "card_number": reference.card_number,
-                    "rarity": reference.rarity,
-                }
-                
-                if external_data:
-                    card_data.update(external_data)
-                
-                if s3_url:
-                    card_data["image_path"] = s3_url
-
-                return {
-                    "scan_method": "code",
-                    "confidence": 1.0,
-                    "requires_confirmation": False,
-                    "card_data": card_data
-                }
-            else:
-                # Try external API directly with detected code
-                # Try Yu-Gi-Oh! first as it's common
-                external_data = await self.external_api.get_card_details(
-                    "Yu-Gi-Oh!", detected_code['set'], detected_code['number']
-                )
-                if not external_data:
-                    # Try Pokemon
-                    external_data = await self.external_api.get_card_details(
-                        "Pokemon", detected_code['set'], detected_code['number']
+        self.cv = cv or CVProcessor()
+        self.external_api = external_api or ExternalCardAPI()
+        self.s3 = s3 or s3_service
+        self.cascade = cascade or recognition_cascade
+        # External lookups of the current batch, so repeated cards share one call
+        self._lookups = None
+        self.lookups_deduped = 0
+
+    async def scan_card(self, image_bytes: bytes, owner_id=None):
+        start = time.perf_counter()
+        ctx = ScanContext(self, image_bytes=image_bytes, digest=content_hash(image_bytes), owner_id=owner_id)
+        stage, result = await self._recognize(ctx)
+        if stage != "cache" and "error" not in result:
+            scan_cache.put(owner_id, ctx.digest, ctx.hashes, result, time.perf_counter() - start)
+        return result
+
+    async def recognize_card(self, warped, image_bytes=None):
+        """Recognise a card that is already detected and warped, e.g. the chosen frame of a live scan.
+
+        ``image_bytes`` (the frame as received) is what gets stored in S3. Raises WorkerPoolBusy
+        rather than waiting when the CV pool is saturated.
+        """
+        _, result = await self._recognize(ScanContext(self, image_bytes=image_bytes, warped=warped))
+        return result
+
+    async def scan_batch(self, images, segment=False):
+        """Scan many photos, yielding ``(image_index, position, result)`` as each card finishes.
+
+        With ``segment`` every photo is a binder page that may hold several cards. CV jobs
+        wait for a free worker instead of being rejected, behind single scans and at most
+        ``SCAN_BATCH_CONCURRENCY`` at a time, so concurrent batches take turns. External
+        lookups are shared across the batch.
+        """
+        self._lookups = {}
+        detect = self.cv.segment_cards if segment else self.cv.detect_card
+        limit = asyncio.Semaphore(SCAN_BATCH_CONCURRENCY or cv_pool.batch_slots)
+
+        async def split(index, image_bytes):
+            upload = self.start_upload(image_bytes)
+            async with limit:
+                cards = await cv_pool.run(detect, image_bytes, batch=True)
+            s3_url = await upload
+            if cards is not None and not segment:
+                cards = [cards]
+            return index, cards, s3_url
+
+        async def scan(index, position, warped, s3_url):
+            try:
+                _, result = await self._recognize(ScanContext(self, warped=warped, s3_url=s3_url, batch=limit))
+                return index, position, result
+            except Exception as e:
+                logger.exception(f"Batch scan of image {index} card {position} failed")
+                return index, position, {"error": str(e) or type(e).__name__}
+
+        splits = {asyncio.ensure_future(split(index, image)) for index, image in enumerate(images)}
+        pending = set(splits)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task not in splits:
+                        yield task.result()
+                        continue
+                    index, cards, s3_url = task.result()
+                    if cards is None:
+                        yield index, 0, {"error": "Failed to process image"}
+                        continue
+                    # The photo's cards join the pending set and are yielded as they finish
+                    pending.update(
+                        asyncio.ensure_future(scan(index, position, warped, s3_url))
+                        for position, warped in enumerate(cards)
                     )
-                
-                if external_data:
-                    card_data = {
-                        "game": "Yu-Gi-Oh!" if "Yu-Gi-Oh!" in str(external_data) else "Pokemon", # Simple heuristic
-                        "set_code": detected_code['set'],
-                        "card_number": detected_code['number'],
-                    }
-                    card_data.update(external_data)
-                    
-                    if s3_url:
-                        card_data["image_path"] = s3_url
-
-                    return {
-                        "scan_method": "code",
-                        "confidence": 0.9,
-                        "requires_confirmation": True,
-                        "card_data": card_data
-                    }
-
-        # 3. Fallback to Visual match if possible (Simplified)
-        # ... logic for fuzzy matching name ...
-        # If we have OCR text but no code match, return it for confirmation
-        if full_text.strip():
+        finally:
+            for task in pending:
+                task.cancel()
+            self._lookups = None
+
+    async def _shared_lookup(self, key, make):
+        # Outside a batch every lookup goes straight to the (cached) external API
+        if self._lookups is None:
+            return await make()
+        task = self._lookups.get(key)
+        if task is None:
+            task = self._lookups[key] = asyncio.ensure_future(make())
+        else:
+            self.lookups_deduped += 1
+        return await asyncio.shield(task)
+
+    def start_upload(self, image_bytes, digest=None):
+        # Stored in S3 (if configured) keyed by content, so the same photo is stored once.
+        # The upload runs off the critical path, alongside CV or from the background queue
+        return self.s3.start_upload(image_bytes, f"scans/{digest or content_hash(image_bytes)}.jpg")
+
+    async def _recognize(self, ctx):
+        """Run the cascade and build the chosen result's card data: ``(stage, result)``."""
+        start = time.perf_counter()
+        refresh = reference_cache.refresh_if_stale()
+        if refresh is not None and not reference_cache.loaded:
+            # Nothing to look codes up in yet (the service was not warmed up): wait for the first load
+            await asyncio.shield(refresh)
+        stage, result = await self.cascade.run(ctx)
+        if stage != "cache" and "error" not in result:
+            s3_url = await ctx.s3_url()
+            reference = result.pop("reference", None)
+            if reference is not None:
+                result["card_data"] = await self._card_from_reference(reference, s3_url)
+            elif result["card_data"] is not None and s3_url:
+                result["card_data"]["image_path"] = s3_url
+        if metrics.active():
+            outcome = "error" if "error" in result else stage or "none"
+            metrics.observe("recognition_seconds", time.perf_counter() - start, stage=outcome)
+        return stage, result
+
+    async def lookup_code(self, code):
+        """Result for a parsed set code: CardReference first, then the external APIs; None if unknown."""
+        # Lookup in the in-process copy of CardReference (no DB round trip)
+        reference = reference_cache.lookup(code["set"], code["number"])
+        if reference:
+            return {
+                "scan_method": "code",
+                "confidence": 1.0,
+                "requires_confirmation": False,
+                "reference": reference,
+            }
+        # Try external API directly with detected code, racing all games
+        found = await self._shared_lookup(
+            ("find", code["set"], code["number"]),
+            lambda: self.external_api.find_card(code["set"], code["number"]),
+        )
+        if not found:
+            return None
+        game, external_data = found
+        card_data = {
+            "game": game,
+            "set_code": code["set"],
+            "card_number": code["number"],
+        }
+        card_data.update(external_data)
+        return {
+            "scan_method": "code",
+            "confidence": 0.9,
+            "requires_confirmation": True,
+            "card_data": card_data
+        }
+
+    def match_name(self, texts):
+        """Fuzzy-match OCR'd names against the reference names; the raw guess if none is close enough."""
+        if not texts:
+            return None
+        name_index.refresh_if_stale()
+        best = None
+        for text in texts:
+            name_guess = text.split('\n')[0][:50] # Guessing first line is name
+            matches = name_index.search(name_guess, k=1)
+            score = matches[0][1] if matches else 0.0
+            if best is None or score > best[1]:
+                best = (name_guess, score, matches[0][0] if matches else None)
+        name_guess, score, ref_id = best
+        reference = reference_cache.get(ref_id) if ref_id is not None and score >= NAME_MATCH_MIN_SCORE else None
+        if reference:
             return {
                 "scan_method": "visual",
-                "confidence": 0.6,
+                "confidence": score,
                 "requires_confirmation": True,
-                "card_data": {
-                    "name": full_text.split('\n')[0][:50], # Guessing first line is name
-                    "game": "Unknown",
-                    "set_code": "",
-                    "card_number": "",
-                    "image_path": s3_url if s3_url else ""
-                }
+                "reference": reference,
             }
 
+        # No reference is close enough: return the raw guess for the user to confirm
         return {
-            "scan_method": "manual",
-            "confidence": 0.0,
+            "scan_method": "visual",
+            "confidence": score,
             "requires_confirmation": True,
-            "card_data": None
+            "card_data": {
+                "name": name_guess,
+                "game": "Unknown",
+                "set_code": "",
+                "card_number": "",
+                "image_path": ""
+            }
+        }
+
+    async def _card_from_reference(self, reference, s3_url):
+        external_data = await self._shared_lookup(
+            ("details", reference.game, reference.set_code, reference.card_number),
+            lambda: self.external_api.get_card_details(reference.game, reference.set_code, reference.card_number),
+        )
+
+        card_data = {
+            "name": reference.name,
+            "game": reference.game,
+            "set_code": reference.set_code,
+            "card_number": reference.card_number,
+            "rarity": reference.rarity,
         }
 
-    def _parse_card_code(self, text):
-        # Regex for patterns like LOB-001, SV1-025, EN-023
-        # Yu-Gi-Oh!: XXX-ENXXX or XXX-XXX
-        # Pokemon: XXX/XXX or XXX-XXX
-        patterns = [
-            r'([A-Z0-9]+)-([A-Z0-9]+)', # General hyphenated code
-            r'([A-Z0-9]+)/([A-Z0-9]+)', # Slash used in some games
-            r'([A-Z]{2,3})([0-9]{3})'    # Direct concatenation
-        ]
-        
-        for pattern in patterns:
-            match = re.search(pattern, text)
-            if match:
-                return {
-                    "set": match.group(1),
-                    "number": match.group(2)
-                }
-        return None
+        if external_data:
+            card_data.update(external_data)
+
+        if s3_url:
+            card_data["image_path"] = s3_url
+        return card_data
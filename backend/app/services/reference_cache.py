@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import namedtuple
+from types import MappingProxyType
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..database import run_db
+from ..models import models
+
+logger = logging.getLogger(__name__)
+
+# How often a worker checks whether another process (e.g. catalog sync) changed the catalog
+REFERENCE_CACHE_CHECK_SECONDS = float(os.getenv("REFERENCE_CACHE_CHECK_SECONDS", "30"))
+
+ReferenceEntry = namedtuple("ReferenceEntry", "id game set_code card_number name rarity")
+
+_EMPTY = MappingProxyType({})
+
+
+def normalize_code(text):
+    """Uppercase with whitespace removed, as stored in the ``*_norm`` columns."""
+    return "".join((text or "").split()).upper()
+
+
+def catalog_fingerprint(db: Session):
+    """Changes whenever CardReference does.
+
+    Catalog rows are only ever added or upserted, so the newest id plus the latest sync
+    progress is enough to tell whether anything changed. Only the id moves when rows are
+    added outside catalog sync (e.g. the sample data loader).
+    """
+    max_id = db.query(func.max(models.CardReference.id)).scalar()
+    synced = db.query(func.max(models.CatalogSyncState.updated_at)).scalar()
+    return max_id, synced
+
+
+def _code_key(set_code, card_number):
+    return f"{normalize_code(set_code)}-{normalize_code(card_number)}"
+
+
+class ReferenceCache:
+    """Read-only, in-process copy of the CardReference table.
+
+    Lookups read immutable maps that are swapped wholesale on reload, so request
+    handlers never lock or touch the DB. Writes made through ``catalog_sync`` in this
+    process invalidate it directly; writes from other processes are noticed by a cheap
+    fingerprint query every ``REFERENCE_CACHE_CHECK_SECONDS``. From the event loop both
+    run in the background (``refresh_if_stale``) and scans use the old maps meanwhile.
+    """
+
+    def __init__(self):
+        self._by_code = _EMPTY  # "SET-NUM" -> tuple of ReferenceEntry (one per game)
+        self._by_id = _EMPTY
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+        self._refresh_task = None
+
+    def __len__(self):
+        return len(self._by_id)
+
+    @property
+    def loaded(self):
+        return self._fingerprint is not None
+
+    def invalidate(self):
+        self._stale = True
+
+    def _build(self, db: Session, since_id=None):
+        # New maps from the database, or the current ones plus rows with ``id > since_id``
+        with self._lock:
+            start = time.perf_counter()
+            fingerprint = catalog_fingerprint(db)
+            by_code, by_id = ({}, {}) if since_id is None else (dict(self._by_code), dict(self._by_id))
+            intern = sys.intern
+            rows = db.query(
+                models.CardReference.id, models.CardReference.game, models.CardReference.set_code,
+                models.CardReference.card_number, models.CardReference.name, models.CardReference.rarity,
+            )
+            if since_id is not None:
+                rows = rows.filter(models.CardReference.id > since_id)
+            for ref_id, game, set_code, card_number, name, rarity in rows.yield_per(10000):
+                # Games, sets and rarities repeat across thousands of rows
+                entry = ReferenceEntry(
+                    ref_id, intern(game or ""), intern(set_code or ""), card_number, name, intern(rarity or "")
+                )
+                by_id[ref_id] = entry
+                key = _code_key(set_code, card_number)
+                by_code[key] = by_code.get(key, ()) + (entry,)
+        logger.info(f"Reference cache loaded {len(by_id)} rows in {time.perf_counter() - start:.2f}s")
+        return MappingProxyType(by_code), MappingProxyType(by_id), fingerprint
+
+    def _install(self, by_code, by_id, fingerprint):
+        self._by_code, self._by_id = by_code, by_id
+        self._fingerprint = fingerprint
+
+    def load(self, db: Session, since_id=None):
+        """(Re)build the maps from the database, or only add rows with ``id > since_id``."""
+        self._stale = False
+        self._install(*self._build(db, since_id))
+        self._checked_at = time.monotonic()
+
+    def _changes(self, db: Session, full=False):
+        # The maps to install if the catalog changed since they were loaded, else None
+        fingerprint = catalog_fingerprint(db)
+        if not full and fingerprint == self._fingerprint:
+            return None
+        max_id, synced = self._fingerprint or (None, None)
+        # Only new rows (e.g. the sample data loader): add them instead of reloading everything
+        incremental = not full and fingerprint[1] == synced and max_id is not None
+        return self._build(db, since_id=max_id if incremental else None)
+
+    def ensure_fresh(self, db: Session):
+        """Reload now if needed; for callers already off the event loop (e.g. inside ``run_db``)."""
+        if self._stale or time.monotonic() - self._checked_at >= REFERENCE_CACHE_CHECK_SECONDS:
+            full, self._stale = self._stale or not self.loaded, False
+            self._checked_at = time.monotonic()
+            changes = self._changes(db, full)
+            if changes is not None:
+                self._install(*changes)
+
+    def refresh_if_stale(self):
+        """Start a background check (and reload, if the catalog changed) when one is due.
+
+        Returns the running refresh, if any. At most one runs at a time, and only every
+        ``REFERENCE_CACHE_CHECK_SECONDS`` unless the cache was invalidated.
+        """
+        if self._refresh_task is None and (
+            self._stale or time.monotonic() - self._checked_at >= REFERENCE_CACHE_CHECK_SECONDS
+        ):
+            # Cleared up front, so an invalidation during the reload schedules another one
+            full, self._stale = self._stale or not self.loaded, False
+            self._checked_at = time.monotonic()
+            self._refresh_task = asyncio.ensure_future(self._refresh_in_background(full))
+        return self._refresh_task
+
+    async def _refresh_in_background(self, full):
+        try:
+            # Queried and built on a thread; the new maps are swapped in on the event loop
+            changes = await run_db(self._changes, full)
+            if changes is not None:
+                self._install(*changes)
+        except Exception as e:
+            logger.error(f"Reference cache refresh failed: {e}")
+            self._stale = self._stale or full
+        finally:
+            self._refresh_task = None
+
+    def lookup(self, set_code, card_number, game=None):
+        """First reference with this code (optionally for one game), or None."""
+        entries = self._by_code.get(_code_key(set_code, card_number), ())
+        for entry in entries:
+            if game is None or entry.game == game:
+                return entry
+        return None
+
+    def get(self, ref_id):
+        return self._by_id.get(ref_id)
+
+
+reference_cache = ReferenceCache()
@@ -1,35 +1,246 @@
+import asyncio
 import boto3
 import os
 import logging
-from botocore.exceptions import ClientError
+import queue
+import threading
+import time
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+from collections import Counter, OrderedDict
+
+import cv2
+import numpy as np
+
+from .. import metrics
 
 logger = logging.getLogger(__name__)
 
+# "background" returns the URL at once and uploads from a queue, "concurrent" overlaps the
+# upload with CV and waits for it, "inline" uploads before CV starts (old behaviour)
+S3_UPLOAD_MODE = os.getenv("S3_UPLOAD_MODE", "background")
+S3_UPLOAD_WORKERS = int(os.getenv("S3_UPLOAD_WORKERS", "2"))
+# Uploads allowed to wait; beyond that a scan uploads concurrently with its own CV instead
+S3_UPLOAD_QUEUE_SIZE = int(os.getenv("S3_UPLOAD_QUEUE_SIZE", "100"))
+S3_UPLOAD_RETRIES = int(os.getenv("S3_UPLOAD_RETRIES", "3"))
+# Seconds to keep uploading queued photos on shutdown
+S3_UPLOAD_DRAIN_SECONDS = float(os.getenv("S3_UPLOAD_DRAIN_SECONDS", "10"))
+# Optional re-encoding before storage: longest side in pixels and JPEG quality, 0 keeps the original
+S3_UPLOAD_MAX_SIDE = int(os.getenv("S3_UPLOAD_MAX_SIDE", "0"))
+S3_UPLOAD_JPEG_QUALITY = int(os.getenv("S3_UPLOAD_JPEG_QUALITY", "0"))
+# S3-compatible endpoint (MinIO, a local stand-in); unset for AWS
+AWS_S3_ENDPOINT_URL = os.getenv("AWS_S3_ENDPOINT_URL")
+
+# Content-addressed keys this process has seen in the bucket, to skip repeat HEAD requests
+_KNOWN_OBJECTS_MAX = 10000
+_known_objects = OrderedDict()
+
+def _remember(object_name):
+    _known_objects[object_name] = True
+    if len(_known_objects) > _KNOWN_OBJECTS_MAX:
+        _known_objects.popitem(last=False)
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_s3_client():
+    """Process-wide boto3 client (they are thread-safe and pool their connections)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = boto3.client(
+                    's3',
+                    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
+                    region_name=os.getenv("AWS_REGION", "us-east-1"),
+                    endpoint_url=AWS_S3_ENDPOINT_URL,
+                    config=Config(
+                        max_pool_connections=max(10, S3_UPLOAD_WORKERS * 2),
+                        s3={"addressing_style": "path"} if AWS_S3_ENDPOINT_URL else None,
+                    ),
+                )
+    return _client
+
+def reencode_jpeg(image_bytes, max_side=S3_UPLOAD_MAX_SIDE, quality=S3_UPLOAD_JPEG_QUALITY):
+    """Downscale/re-compress a photo for storage; the original is kept if that isn't smaller."""
+    if not max_side and not quality:
+        return image_bytes
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return image_bytes
+    longest = max(img.shape[:2])
+    if max_side and longest > max_side:
+        factor = max_side / longest
+        img = cv2.resize(img, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality or 90])
+    if not ok or len(encoded) >= len(image_bytes):
+        return image_bytes
+    return encoded.tobytes()
+
+class BackgroundUploader:
+    """Bounded queue of uploads drained by a few daemon threads, with retries."""
+
+    def __init__(self, service, workers=S3_UPLOAD_WORKERS, queue_size=S3_UPLOAD_QUEUE_SIZE,
+                 retries=S3_UPLOAD_RETRIES):
+        self.service = service
+        self.workers = max(1, workers)
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._threads = []
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def _start(self):
+        with self._lock:
+            if not self._threads:
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._run, name=f"s3-upload-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, image_bytes, object_name, skip_existing=False):
+        """Queue an upload; False if the queue is full."""
+        self._start()
+        try:
+            self._queue.put_nowait((image_bytes, object_name, skip_existing))
+        except queue.Full:
+            self.counters["queue_full"] += 1
+            return False
+        self.counters["queued"] += 1
+        return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._upload(*item)
+            except Exception:
+                # Not worth retrying (e.g. a photo that fails to re-encode); the thread must survive it
+                self.counters["failed"] += 1
+                metrics.inc("s3_uploads_total", outcome="failed")
+                logger.exception(f"Uploading {item[1]} to S3 failed")
+            finally:
+                self._queue.task_done()
+
+    def _upload(self, image_bytes, object_name, skip_existing):
+        for attempt in range(self.retries + 1):
+            try:
+                self.service.put(image_bytes, object_name, skip_existing)
+                self.counters["uploaded"] += 1
+                metrics.inc("s3_uploads_total", outcome="uploaded")
+                return
+            except (BotoCoreError, ClientError) as e:
+                if attempt == self.retries:
+                    self.counters["failed"] += 1
+                    metrics.inc("s3_uploads_total", outcome="failed")
+                    logger.error(f"Giving up uploading {object_name} to S3: {e}")
+                    return
+                self.counters["retries"] += 1
+                metrics.inc("s3_uploads_total", outcome="retry")
+                time.sleep(0.5 * 2 ** attempt)
+
+    def drain(self, timeout=S3_UPLOAD_DRAIN_SECONDS):
+        """Wait up to ``timeout`` seconds for queued uploads; True if all finished."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                logger.warning(f"{self._queue.unfinished_tasks} S3 uploads still pending at shutdown")
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stats(self):
+        return {**self.counters, "pending": self._queue.unfinished_tasks}
+
 class S3Service:
-    def __init__(self):
+    def __init__(self, client=None):
         self.bucket_name = os.getenv("AWS_STORAGE_BUCKET_NAME")
         self.region = os.getenv("AWS_REGION", "us-east-1")
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=self.region
-        )
-
-    def upload_image(self, image_bytes, object_name):
-        """Upload an image to an S3 bucket"""
-        if not self.bucket_name:
-            logger.warning("AWS_STORAGE_BUCKET_NAME not set. Skipping S3 upload.")
-            return None
+        self._client = client
+        self.mode = S3_UPLOAD_MODE
+        self.uploader = BackgroundUploader(self)
+        self.counters = Counter()
+
+    @property
+    def s3_client(self):
+        return self._client or get_s3_client()
+
+    def _url(self, object_name):
+        if AWS_S3_ENDPOINT_URL:
+            return f"{AWS_S3_ENDPOINT_URL.rstrip('/')}/{self.bucket_name}/{object_name}"
+        return f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{object_name}"
 
+    def object_exists(self, object_name):
+        if object_name in _known_objects:
+            return True
         try:
+            with metrics.timer("s3_seconds", op="head"):
+                self.s3_client.head_object(Bucket=self.bucket_name, Key=object_name)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+        _remember(object_name)
+        return True
+
+    def put(self, image_bytes, object_name, skip_existing=False):
+        """Store one object, re-encoded if configured; raises boto errors."""
+        if skip_existing and self.object_exists(object_name):
+            self.counters["skipped_existing"] += 1
+            return
+        body = reencode_jpeg(image_bytes)
+        self.counters["bytes_in"] += len(image_bytes)
+        self.counters["bytes_stored"] += len(body)
+        with metrics.timer("s3_seconds", op="put"):
             self.s3_client.put_object(
                 Bucket=self.bucket_name,
                 Key=object_name,
-                Body=image_bytes,
+                Body=body,
                 ContentType='image/jpeg'
             )
-            return f"https://{self.bucket_name}.s3.{self.region}.amazonaws.com/{object_name}"
-        except ClientError as e:
+        if skip_existing:
+            _remember(object_name)
+
+    def upload_image(self, image_bytes, object_name, skip_existing=False):
+        """Upload an image to an S3 bucket
+
+        With ``skip_existing`` (for content-addressed keys) an object already in the
+        bucket is not uploaded again.
+        """
+        if not self.bucket_name:
+            logger.warning("AWS_STORAGE_BUCKET_NAME not set. Skipping S3 upload.")
+            return None
+
+        try:
+            self.put(image_bytes, object_name, skip_existing)
+            return self._url(object_name)
+        except (BotoCoreError, ClientError) as e:
             logger.error(f"Error uploading to S3: {e}")
             return None
+
+    def start_upload(self, image_bytes, object_name):
+        """Begin storing a content-addressed scan photo; returns an awaitable of its URL (or None).
+
+        Await it after the CV stage so the upload never delays the scan itself.
+        """
+        future = asyncio.get_running_loop().create_future()
+        if not self.bucket_name:
+            future.set_result(None)
+        elif self.mode == "inline":
+            future.set_result(self.upload_image(image_bytes, object_name, skip_existing=True))
+        elif self.mode == "background" and self.uploader.submit(image_bytes, object_name, skip_existing=True):
+            # The key is deterministic, so the URL is known before the object lands
+            future.set_result(self._url(object_name))
+        else:
+            return asyncio.ensure_future(
+                asyncio.to_thread(self.upload_image, image_bytes, object_name, True)
+            )
+        return future
+
+    def stats(self):
+        return {**self.counters, **{f"queue_{k}": v for k, v in self.uploader.stats().items()}}
+
+s3_service = S3Service()
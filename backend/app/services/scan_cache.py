@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+# Results embed prices, so they are only reused for a short while
+SCAN_CACHE_TTL = float(os.getenv("SCAN_CACHE_TTL", "600"))
+SCAN_CACHE_MAX_ENTRIES = int(os.getenv("SCAN_CACHE_MAX_ENTRIES", "1000"))
+# pHash and dHash distance (of 64) at which a new photo counts as a rescan of a cached one; 0 disables
+SCAN_CACHE_NEAR_DISTANCE = int(os.getenv("SCAN_CACHE_NEAR_DISTANCE", "0"))
+
+
+def content_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+class ScanResultCache:
+    """Recent scan results per user, keyed by the SHA-256 of the uploaded bytes.
+
+    Retries of the same upload hit the exact key. When near-duplicate matching is on,
+    a fresh photo of the same card is matched by the perceptual hashes of the whole
+    frame. Entries are scoped to the owner, since results carry the photo's URL.
+    """
+
+    def __init__(self, ttl=SCAN_CACHE_TTL, max_entries=SCAN_CACHE_MAX_ENTRIES,
+                 near_distance=SCAN_CACHE_NEAR_DISTANCE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.near_distance = near_distance
+        self._entries = OrderedDict()  # (owner_id, digest) -> entry
+        self._lock = threading.Lock()
+        self.counters = Counter()
+        self.seconds_saved = 0.0
+
+    def _hit(self, kind, entry):
+        self.counters[kind] += 1
+        self.seconds_saved += entry["elapsed"]
+        return copy.deepcopy(entry["result"])
+
+    def get(self, owner_id, digest):
+        """Cached result for these exact bytes, or None (not counted as a miss yet)."""
+        with self._lock:
+            entry = self._entries.get((owner_id, digest))
+            if entry is None:
+                return None
+            if time.monotonic() - entry["stored_at"] > self.ttl:
+                del self._entries[(owner_id, digest)]
+                return None
+            self._entries.move_to_end((owner_id, digest))
+            return self._hit("exact_hits", entry)
+
+    def get_near(self, owner_id, hashes):
+        """Cached result of a perceptually near-identical photo, or None."""
+        if not self.near_distance or hashes is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                entry for (owner, _), entry in self._entries.items()
+                if owner == owner_id and entry["hashes"] is not None and now - entry["stored_at"] <= self.ttl
+            ]
+            if not candidates:
+                return None
+            stored = np.array([entry["hashes"] for entry in candidates], dtype=np.uint64)
+            query = np.array(hashes, dtype=np.uint64)
+            distances = np.bitwise_count(stored ^ query)
+            # Both hashes must agree, so one coincidentally close hash isn't enough
+            worst = distances.max(axis=1)
+            best = int(np.argmin(worst))
+            if worst[best] > self.near_distance:
+                return None
+            return self._hit("near_hits", candidates[best])
+
+    def miss(self):
+        self.counters["misses"] += 1
+
+    def put(self, owner_id, digest, hashes, result, elapsed):
+        with self._lock:
+            self._entries[(owner_id, digest)] = {
+                "result": copy.deepcopy(result),
+                "hashes": hashes,
+                "elapsed": elapsed,
+                "stored_at": time.monotonic(),
+            }
+            self._entries.move_to_end((owner_id, digest))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        hits = self.counters["exact_hits"] + self.counters["near_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            "exact_hits": self.counters["exact_hits"],
+            "near_hits": self.counters["near_hits"],
+            "misses": self.counters["misses"],
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "seconds_saved": round(self.seconds_saved, 3),
+            "entries": len(self._entries),
+        }
+
+
+scan_cache = ScanResultCache()
@@ -0,0 +1,67 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from sqlalchemy import event
+
+from .. import schemas
+from ..models import models
+
+# Seconds an authenticated user is served from memory; 0 looks the user up on every request
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class UserCache:
+    """Recently authenticated users by id, as detached ``schemas.User`` snapshots.
+
+    Updating or deleting a User through the ORM in this process drops its entry at
+    once; other processes (and bulk ``query.update()`` calls, which skip mapper
+    events) see the change within ``USER_CACHE_TTL``.
+    """
+
+    def __init__(self, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (stored_at, schemas.User)
+        self._lock = threading.Lock()
+        self.counters = Counter()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def put(self, user):
+        """Snapshot a User row; returns the snapshot."""
+        snapshot = schemas.User.model_validate(user)
+        if self.ttl > 0:
+            with self._lock:
+                self._entries[snapshot.id] = (time.monotonic(), snapshot)
+                self._entries.move_to_end(snapshot.id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def stats(self):
+        return {**self.counters, "entries": len(self._entries)}
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user(mapper, connection, target):
+    # e.g. deactivation: the next request re-reads the row
+    user_cache.invalidate(target.id)
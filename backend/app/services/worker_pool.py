@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .. import metrics
+
+logger = logging.getLogger(__name__)
+
+# "thread" keeps everything in-process, "process" sidesteps the GIL for the
+# numpy/OpenCV parts, "inline" runs on the event loop (old behaviour, debugging only).
+CV_EXECUTOR = os.getenv("CV_EXECUTOR", "thread")
+CV_WORKERS = int(os.getenv("CV_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs allowed to wait for a free worker before new scans are rejected with 503
+CV_QUEUE_SIZE = int(os.getenv("CV_QUEUE_SIZE", "8"))
+# Workers batch jobs leave free, so single scans never queue behind a batch
+CV_RESERVED_WORKERS = int(os.getenv("CV_RESERVED_WORKERS", "1"))
+
+
+class WorkerPoolBusy(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+
+class WorkerPool:
+    """Executor with a bounded number of slots (running plus queued jobs).
+
+    Slots are counted on the event loop and handed out in order: jobs of scans already
+    under way first, then batch jobs. Batch jobs only get ``batch_slots`` of them, fewer
+    than there are workers, so however many batches run a single scan finds a free worker.
+    """
+
+    def __init__(self, kind: str = CV_EXECUTOR, workers: int = CV_WORKERS, queue_size: int = CV_QUEUE_SIZE,
+                 name: str = "cv-worker", reserved: int = CV_RESERVED_WORKERS):
+        self.kind = kind
+        self.name = name
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.slots = self.workers + self.queue_size
+        # With a single worker nothing can be held back
+        self.batch_slots = max(1, self.workers - max(0, reserved))
+        self._in_use = 0
+        self._batch_in_use = 0
+        self._waiters = deque()  # futures of scans waiting for a slot
+        self._batch_waiters = deque()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers, thread_name_prefix=self.name
+                        )
+        return self._executor
+
+    def _free(self, batch):
+        # Whether a slot can be taken right now by a scan, or by a batch job
+        if batch:
+            return self._in_use < self.slots and self._batch_in_use < self.batch_slots
+        return self._in_use < self.slots
+
+    def _take(self, batch):
+        self._in_use += 1
+        self._batch_in_use += batch
+
+    def _release(self, batch):
+        self._in_use -= 1
+        self._batch_in_use -= batch
+        # Hand the freed slot on: scans under way first, then batch jobs
+        for waiters, for_batch in ((self._waiters, False), (self._batch_waiters, True)):
+            while waiters and self._free(for_batch):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self._take(for_batch)
+                    waiter.set_result(None)
+
+    async def _acquire(self, batch):
+        waiters = self._batch_waiters if batch else self._waiters
+        # No overtaking: a batch job also lets waiting scans go first
+        if not self._waiters and not (batch and self._batch_waiters) and self._free(batch):
+            self._take(batch)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the caller gave up
+                self._release(batch)
+            elif waiter in waiters:
+                waiters.remove(waiter)
+            raise
+
+    async def run(self, fn, *args, wait=False, batch=False):
+        """Run ``fn(*args)`` on the pool, or raise WorkerPoolBusy if it is saturated.
+
+        With ``wait=True`` the job waits for a slot instead; scans use this once their
+        first job was admitted, so no work already done is thrown away. ``batch=True``
+        jobs always wait, behind those, and within the pool's ``batch_slots``.
+        """
+        if self.kind == "inline":
+            return fn(*args)
+
+        start = time.perf_counter()
+        if batch or wait:
+            await self._acquire(batch)
+        elif not self._waiters and self._free(False):
+            self._take(False)
+        else:
+            metrics.inc("worker_pool_rejected_total", pool=self.name)
+            raise WorkerPoolBusy(f"{self.name} pool is saturated")
+
+        loop = asyncio.get_running_loop()
+        try:
+            if self.kind == "process":
+                future = self._get_executor().submit(fn, *args)
+            else:
+                # Timers inside the job count towards the request's Server-Timing
+                future = self._get_executor().submit(contextvars.copy_context().run, fn, *args)
+        except Exception:
+            self._release(batch)
+            raise
+        # Release on completion rather than when the caller stops waiting, so a
+        # cancelled request can't free a slot while its job is still running.
+        future.add_done_callback(lambda _: self._release_threadsafe(loop, batch))
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            if metrics.active():
+                # Includes waiting for a slot and for a free worker
+                metrics.observe("worker_pool_job_seconds", time.perf_counter() - start, pool=self.name)
+
+    def _release_threadsafe(self, loop, batch):
+        # Done callbacks run on the worker thread; the counts belong to the event loop
+        try:
+            loop.call_soon_threadsafe(self._release, batch)
+        except RuntimeError:
+            # The loop is already closed, so nobody is waiting any more
+            self._in_use -= 1
+            self._batch_in_use -= batch
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cv_pool = WorkerPool()
@@ -0,0 +1,117 @@
+"""Per-request authentication overhead under concurrent load.
+
+    python -m backend.benchmarks.bench_auth --users 50 --requests 4000 --concurrency 12
+
+Every request is an authenticated ``GET /cards/cache-stats`` (no work of its own).
+"no auth" overrides get_current_user entirely and is the floor; "email lookup" is
+the old dependency (JWT decode plus a query by email on every request); "uncached"
+is the current one with the token and user caches turned off.
+
+Keep ``--concurrency`` under the DB pool size (15) when comparing: the old dependency
+queries on the event loop and holds its connection for the whole request, so beyond
+that it blocks the loop until the pool times out.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from .common import BENCH_USER, summarize
+
+
+def legacy_get_current_user():
+    from fastapi import Depends, HTTPException
+    from jose import JWTError, jwt
+
+    from ..app.api.auth import oauth2_scheme
+    from ..app.database import get_db
+    from ..app.models import models
+    from ..app.services import auth
+
+    async def get_current_user(token: str = Depends(oauth2_scheme), db=Depends(get_db)):
+        try:
+            email = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]).get("sub")
+        except JWTError:
+            raise HTTPException(status_code=401)
+        user = db.query(models.User).filter(models.User.email == email).first()
+        if user is None:
+            raise HTTPException(status_code=401)
+        return user
+
+    return get_current_user
+
+
+async def run(args):
+    import httpx
+
+    from ..app.api.auth import get_current_user
+    from ..app.database import SessionLocal
+    from ..app.main import app
+    from ..app.migrations import migrate
+    from ..app.models import models
+    from ..app.services import auth
+    from ..app.services.container import ServiceContainer
+    from ..app.services.user_cache import user_cache
+
+    migrate()
+    app.state.services = ServiceContainer()
+    db = SessionLocal()
+    try:
+        users = [models.User(email=f"user{i}@example.com", hashed_password="-") for i in range(args.users)]
+        db.add_all(users)
+        db.commit()
+        id_tokens = [auth.create_access_token({"sub": str(u.id), "email": u.email}) for u in users]
+        email_tokens = [auth.create_access_token({"sub": u.email}) for u in users]
+    finally:
+        db.close()
+
+    token_cache_size = auth.AUTH_TOKEN_CACHE_SIZE
+    user_cache_ttl = user_cache.ttl
+
+    def configure(mode):
+        app.dependency_overrides.clear()
+        auth._verified_tokens.clear()
+        user_cache._entries.clear()
+        auth.AUTH_TOKEN_CACHE_SIZE, user_cache.ttl = token_cache_size, user_cache_ttl
+        if mode == "no auth":
+            app.dependency_overrides[get_current_user] = lambda: BENCH_USER
+        elif mode == "email lookup":
+            app.dependency_overrides[get_current_user] = legacy_get_current_user()
+        elif mode == "uncached":
+            auth.AUTH_TOKEN_CACHE_SIZE, user_cache.ttl = 0, 0
+        return email_tokens if mode == "email lookup" else id_tokens
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for mode in ("no auth", "email lookup", "uncached", "cached"):
+            tokens = configure(mode)
+            rng = random.Random(0)
+            latencies = []
+
+            async def worker(n):
+                for _ in range(n):
+                    token = rng.choice(tokens)
+                    t = time.perf_counter()
+                    r = await client.get("/cards/cache-stats", headers={"Authorization": f"Bearer {token}"})
+                    latencies.append(time.perf_counter() - t)
+                    assert r.status_code == 200, r.text
+
+            start = time.perf_counter()
+            await asyncio.gather(*(worker(args.requests // args.concurrency) for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - start
+            summarize(mode, latencies)
+            print(f"{'':<28} {len(latencies) / elapsed:8.0f} req/s")
+    print(f"user cache: {user_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=12)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Collection import: one POST /cards/ per card vs POST /cards/bulk (JSON and CSV).
+
+    python -m backend.benchmarks.bench_bulk_import --rows 20000 --single 500
+
+Rows give only a set code, card number and price; name, game and rarity are
+resolved from CardReference. One row in a hundred is bad (unknown code or
+unparseable confidence) and must come back as a row error without stopping the import.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import time
+
+
+def make_rows(count, references):
+    rows = []
+    for i in range(count):
+        row = {"set_code": f"S{i % references // 100:04d}", "card_number": f"EN{i % 100:03d}", "price": 0.25 + i % 7}
+        if i % 100 == 99:
+            row = {"set_code": "NOPE", "card_number": str(i)} if i % 200 == 99 else {**row, "confidence": "high"}
+        rows.append(row)
+    return rows
+
+
+async def run(args):
+    import httpx
+
+    from .common import load_app  # before the app, so DATABASE_URL points at a scratch file
+    from ..app.catalog_sync import upsert_references
+    from ..app.database import SessionLocal
+
+    app = load_app()
+    db = SessionLocal()
+    try:
+        upsert_references(db, [
+            {"game": "Yu-Gi-Oh!", "set_code": f"S{i // 100:04d}", "card_number": f"EN{i % 100:03d}",
+             "name": f"Card {i}", "rarity": "Common"}
+            for i in range(args.references)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    rows = make_rows(args.rows, args.references)
+    bad = sum(i % 100 == 99 for i in range(args.rows))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        for i in range(args.single):
+            r = await client.post("/cards/", json={"name": f"Card {i}", "game": "Yu-Gi-Oh!", "set_code": "S0000",
+                                                   "card_number": f"EN{i % 100:03d}", "confidence": 1.0})
+            assert r.status_code == 200, r.text
+        elapsed = time.perf_counter() - start
+        print(f"POST /cards/ loop        {args.single} rows in {elapsed:6.2f}s  {args.single / elapsed:8.0f} rows/s")
+
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=["set_code", "card_number", "price", "confidence"])
+        writer.writeheader()
+        writer.writerows(rows)
+        bodies = {
+            "json": (json.dumps(rows).encode(), "application/json"),
+            "csv": (buf.getvalue().encode(), "text/csv"),
+        }
+        for fmt, (body, content_type) in bodies.items():
+            start = time.perf_counter()
+            r = await client.post("/cards/bulk", content=body, headers={"Content-Type": content_type})
+            elapsed = time.perf_counter() - start
+            assert r.status_code == 200, r.text
+            result = r.json()
+            assert result["inserted"] == args.rows - bad and len(result["errors"]) == bad, result["errors"][:3]
+            print(f"POST /cards/bulk ({fmt:<4})  {args.rows} rows in {elapsed:6.2f}s  {args.rows / elapsed:8.0f} rows/s"
+                  f"  ({result['inserted']} inserted, {len(result['errors'])} row errors)")
+        print(f"e.g. {result['errors'][:2]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--single", type=int, default=500, help="cards added one request at a time")
+    parser.add_argument("--references", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""External card-details cache: hit latency, single-flight and negative caching.
+
+    python -m backend.benchmarks.bench_card_cache --concurrency 50
+    CARD_CACHE_DB=/tmp/card_cache.db python -m backend.benchmarks.bench_card_cache
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import summarize
+from .stub_upstream import StubUpstream
+
+
+async def run(args, stub):
+    from ..app.services.external_api import ExternalCardAPI, close_http_client
+
+    api = ExternalCardAPI()
+
+    # A hot card scanned by many users at once: one upstream call for all of them
+    start = time.perf_counter()
+    results = await asyncio.gather(*(
+        api.get_card_details("Yu-Gi-Oh!", "LOB", "001") for _ in range(args.concurrency)
+    ))
+    burst = time.perf_counter() - start
+    assert all(r and r["name"] == "Blue-Eyes White Dragon" for r in results)
+    print(f"{args.concurrency} concurrent lookups of a cold card: {burst * 1000:.1f}ms, "
+          f"upstream requests={stub.requests['ygo']}")
+
+    hits = []
+    for _ in range(args.lookups):
+        start = time.perf_counter()
+        await api.get_card_details("Yu-Gi-Oh!", "LOB", "001")
+        hits.append(time.perf_counter() - start)
+    summarize("cached lookup", hits)
+
+    before = stub.requests["ygo"]
+    for _ in range(args.lookups):
+        await api.get_card_details("Yu-Gi-Oh!", "NOPE", "404")
+    print(f"{args.lookups} lookups of an unknown code: upstream requests={stub.requests['ygo'] - before}")
+    print(f"cache stats: {api.cache.stats()}")
+    await close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.05, help="simulated upstream latency (s)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--lookups", type=int, default=1000)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=args.delay).start()
+    os.environ["YGOPRODECK_URL"] = f"{stub.base_url}/ygo"
+    os.environ["POKEMONTCG_URL"] = f"{stub.base_url}/pokemon"
+    try:
+        asyncio.run(run(args, stub))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Latency and peak memory of card detection + OCR preprocessing against input resolution.
+
+    python -m backend.benchmarks.bench_card_detection
+
+"full-res" replays the old pipeline: Canny/findContours on the full photo and
+OCR preprocessing of the unwarped photo. "pyramid" is ``CVProcessor.detect_card``
+(detection on a downscaled level, warp to the canonical size) plus preprocessing.
+No OCR is run, so the numbers isolate the image work.
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from .common import percentile, synthetic_photo
+
+RESOLUTIONS = [(960, 1280), (1536, 2048), (2268, 3024), (3024, 4032), (4000, 6000)]
+
+
+def full_res(processor, image_bytes):
+    img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    edged = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 75, 200)
+    cv2.findContours(edged.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return processor._preprocess_for_ocr(img)
+
+
+def pyramid(processor, image_bytes):
+    return processor._preprocess_for_ocr(processor.detect_card(image_bytes))
+
+
+def measure(fn, processor, image_bytes, rounds):
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(processor, image_bytes)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    out = fn(processor, image_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return percentile(times, 50) * 1000, peak / 2**20, out.shape
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    from ..app.cv.processor import CVProcessor
+
+    processor = CVProcessor()
+    print(f"{'resolution':<12} {'pipeline':<9} {'p50 ms':>8} {'peak MiB':>9}  OCR input")
+    for resolution in RESOLUTIONS:
+        image_bytes = synthetic_photo(resolution=resolution)
+        for label, fn in (("full-res", full_res), ("pyramid", pyramid)):
+            ms, mib, shape = measure(fn, processor, image_bytes, args.rounds)
+            print(f"{resolution[0]}x{resolution[1]:<7} {label:<9} {ms:8.1f} {mib:9.1f}  {shape[1]}x{shape[0]}")
+
+
+if __name__ == "__main__":
+    main()
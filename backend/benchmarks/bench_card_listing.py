@@ -0,0 +1,107 @@
+"""GET /cards/ for a large collection: full list vs keyset pages vs the NDJSON export.
+
+    python -m backend.benchmarks.bench_card_listing --cards 100000
+"""
+import argparse
+import asyncio
+import datetime
+import time
+import tracemalloc
+
+from .common import BENCH_USER, load_app, summarize
+
+
+def seed(db, models, count):
+    start = datetime.datetime(2024, 1, 1)
+    rows = [
+        {
+            "owner_id": BENCH_USER.id, "name": f"Card {i}", "game": "Yu-Gi-Oh!", "set_code": f"S{i // 100:04d}",
+            "card_number": f"{i % 100:03d}", "rarity": "Common", "price": "1.00", "description": "Lorem ipsum " * 80,
+            "image_url": f"https://images.example/{i}.jpg", "image_path": "", "confidence": 1.0,
+            "created_at": start + datetime.timedelta(seconds=i // 3),  # ties on created_at are common
+        }
+        for i in range(count)
+    ]
+    db.bulk_insert_mappings(models.Card, rows)
+    db.commit()
+
+
+def measure_memory(fn):
+    tracemalloc.start()
+    result = fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, peak / 1e6
+
+
+def full_list(db, models, schemas):
+    # What GET /cards/ used to do: every ORM row, description included, in one JSON list
+    from pydantic import TypeAdapter
+
+    rows = db.query(models.Card).filter(models.Card.owner_id == BENCH_USER.id).all()
+    return TypeAdapter(list[schemas.Card]).dump_json(rows)
+
+
+def export(cards_api):
+    size = 0
+    for chunk in cards_api._export_rows(BENCH_USER.id):
+        size += len(chunk)
+    return size
+
+
+async def paginate(app, limit):
+    import httpx
+
+    transport = httpx.ASGITransport(app=app)
+    pages, cursor, count = [], None, 0
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        while True:
+            params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+            start = time.perf_counter()
+            response = await client.get("/cards/", params=params)
+            pages.append(time.perf_counter() - start)
+            count += len(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                return pages, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=100000)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    app = load_app()
+    from ..app import schemas
+    from ..app.api import cards as cards_api
+    from ..app.database import SessionLocal
+    from ..app.models import models
+
+    db = SessionLocal()
+    try:
+        seed(db, models, args.cards)
+
+        start = time.perf_counter()
+        body = full_list(db, models, schemas)
+        elapsed = time.perf_counter() - start
+        _, peak = measure_memory(lambda: full_list(db, models, schemas))
+        print(f"full list:   {elapsed:.2f}s, {len(body) / 1e6:.0f} MB body, peak {peak:.0f} MB allocated")
+
+        pages, count = asyncio.run(paginate(app, args.limit))
+        assert count == args.cards, count
+        summarize(f"keyset page (limit={args.limit})", pages)
+        print(f"  first page {pages[0] * 1000:.1f}ms, last page {pages[-1] * 1000:.1f}ms, "
+              f"{len(pages)} pages in {sum(pages):.2f}s")
+
+        start = time.perf_counter()
+        size = export(cards_api)
+        elapsed = time.perf_counter() - start
+        _, peak = measure_memory(lambda: export(cards_api))
+        print(f"ndjson export: {elapsed:.2f}s, {size / 1e6:.0f} MB streamed, peak {peak:.1f} MB allocated")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Offline catalog sync throughput on synthetic YGOPRODeck / pokemontcg.io dumps.
+
+    python -m backend.benchmarks.bench_catalog_sync --cards 20000 --sets-per-card 5
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+
+from .common import Timer
+
+
+def write_ygo_dump(path, rng, cards, sets_per_card, renamed=0):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"data": [')
+        for i in range(cards):
+            name = f"Card {i}" + (" (Reprint)" if i < renamed else "")
+            printings = [
+                {"set_code": f"S{s:03d}-EN{i:05d}", "set_rarity": rng.choice(["Common", "Rare", "Ultra Rare"])}
+                for s in range(sets_per_card)
+            ]
+            f.write(("," if i else "") + json.dumps({"id": i, "name": name, "desc": "x" * 200, "card_sets": printings}))
+        f.write('], "meta": {}}')
+
+
+def write_pokemon_dump(path, cards):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([{"id": f"sv{i // 200}-{i % 200}", "name": f"Mon {i}", "number": str(i % 200),
+                    "set": {"id": f"sv{i // 200}"}, "rarity": "Common"} for i in range(cards)], f)
+
+
+def timed(label, fn):
+    with Timer() as timer:
+        result = fn()
+    elapsed = timer.elapsed
+    if result is None:
+        print(f"{label:<28} skipped (unchanged) in {elapsed * 1000:.1f}ms")
+    else:
+        items, written = result
+        print(f"{label:<28} {items} entries, {written} rows written in {elapsed:.2f}s "
+              f"({items / elapsed:,.0f} entries/s)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=20000)
+    parser.add_argument("--sets-per-card", type=int, default=5)
+    parser.add_argument("--pokemon", type=int, default=20000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from ..app.catalog_sync import sync_file
+    from ..app.database import SessionLocal
+    from ..app.migrations import migrate
+    from ..app.models import models
+
+    rng = random.Random(0)
+    workdir = tempfile.mkdtemp(prefix="cardscope-catalog-")
+    ygo_path = os.path.join(workdir, "cardinfo.json")
+    pokemon_path = os.path.join(workdir, "pokemon.json")
+    write_ygo_dump(ygo_path, rng, args.cards, args.sets_per_card)
+    write_pokemon_dump(pokemon_path, args.pokemon)
+
+    migrate()
+    db = SessionLocal()
+    try:
+        timed("ygoprodeck, first sync", lambda: sync_file(db, "ygoprodeck", ygo_path, args.batch_size))
+        timed("pokemontcg, first sync", lambda: sync_file(db, "pokemontcg", pokemon_path, args.batch_size))
+        timed("ygoprodeck, unchanged", lambda: sync_file(db, "ygoprodeck", ygo_path, args.batch_size))
+
+        # A new dump where 1% of the cards changed: only their printings are rewritten
+        write_ygo_dump(ygo_path, random.Random(0), args.cards, args.sets_per_card, renamed=args.cards // 100)
+        timed("ygoprodeck, 1% changed", lambda: sync_file(db, "ygoprodeck", ygo_path, args.batch_size))
+
+        # Simulate a crash half way through a forced re-sync, then resume
+        state = db.get(models.CatalogSyncState, f"ygoprodeck:{os.path.abspath(ygo_path)}")
+        state.items_done, state.completed_at = args.cards // 2, None
+        db.commit()
+        timed("ygoprodeck, resumed at 50%", lambda: sync_file(db, "ygoprodeck", ygo_path, args.batch_size))
+
+        print(f"card_reference rows: {db.query(models.CardReference).count()}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
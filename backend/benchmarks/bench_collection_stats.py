@@ -0,0 +1,90 @@
+"""Collection valuation at scale: parse every price in Python vs SQL aggregates vs rollups.
+
+    python -m backend.benchmarks.bench_collection_stats --cards 100000
+
+"python" is what computing the value took before prices were stored as cents: load
+the user's rows and parse the price strings. "live" is ``GET /cards/stats?live=true``
+(GROUP BY over the user's cards) and "rollups" the default ``GET /cards/stats``.
+"""
+import argparse
+import datetime
+import random
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+from .common import summarize
+
+
+def python_valuation(db, owner_id):
+    from ..app.models import models
+
+    totals = defaultdict(Decimal)
+    rows = db.query(models.Card.game, models.Card.set_code, models.Card.rarity, models.Card.price_cents) \
+        .filter(models.Card.owner_id == owner_id).all()
+    for game, set_code, rarity, cents in rows:
+        # As stored before: a decimal string
+        price = Decimal(f"{cents / 100:.2f}") if cents is not None else Decimal(0)
+        for key in (("total",), ("game", game), ("set", set_code), ("rarity", rarity)):
+            totals[key] += price
+    top = sorted(rows, key=lambda row: row.price_cents or 0, reverse=True)[:10]
+    return totals, top
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=100000, help="in the measured user's collection")
+    parser.add_argument("--other-users", type=int, default=4, help="users with as many cards again")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    from sqlalchemy import insert
+
+    from .common import load_app  # sets DATABASE_URL before the app is imported
+    load_app()
+    from ..app.api.cards import _SUMMARY_COLUMNS
+    from ..app.database import SessionLocal
+    from ..app.models import models
+    from ..app.services import collection_stats
+
+    rng = random.Random(7)
+    games = ["Pokemon", "Yu-Gi-Oh!", "Magic"]
+    rarities = ["Common", "Uncommon", "Rare", "Ultra Rare", "Secret Rare"]
+    now = datetime.datetime.utcnow()
+    db = SessionLocal()
+    start = time.perf_counter()
+    for owner_id in range(1, args.other_users + 2):
+        for offset in range(0, args.cards, 10000):
+            db.execute(insert(models.Card), [
+                {"owner_id": owner_id, "name": f"Card {i}", "game": rng.choice(games),
+                 "set_code": f"S{rng.randrange(300):03d}", "card_number": f"{i % 200:03d}",
+                 "rarity": rng.choice(rarities), "currency": "USD", "confidence": 1.0,
+                 "price_cents": rng.choice([None, rng.randrange(10, 5000), rng.randrange(5000, 200000)]),
+                 "price_updated_at": now}
+                for i in range(offset, min(offset + 10000, args.cards))
+            ])
+        db.commit()
+    collection_stats.rebuild(db)
+    db.commit()
+    print(f"seeded {args.cards * (args.other_users + 1)} cards and rollups in {time.perf_counter() - start:.1f}s")
+
+    check = {}
+    for label, run in (
+        ("python", lambda: python_valuation(db, 1)),
+        ("live", lambda: collection_stats.collection_stats(db, 1, _SUMMARY_COLUMNS, rollups=False)),
+        ("rollups", lambda: collection_stats.collection_stats(db, 1, _SUMMARY_COLUMNS, rollups=True)),
+    ):
+        latencies = []
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            result = run()
+            latencies.append(time.perf_counter() - t)
+        if label != "python":
+            check[label] = {key: value for key, value in result.items() if key != "source"}
+        summarize(f"{label:<8}", latencies)
+    assert check["live"] == check["rollups"], "rollups disagree with the live aggregates"
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
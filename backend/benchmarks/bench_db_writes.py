@@ -0,0 +1,98 @@
+"""Concurrent card inserts against SQLite: the old engine setup vs the WAL profile.
+
+    python -m backend.benchmarks.bench_db_writes --writers 8 --inserts 200 --readers 2
+
+Writers commit one card at a time, as ``POST /cards/`` does, while readers keep
+streaming the collection, as ``GET /cards/export`` does. "old" is the engine the
+app used to create (rollback journal, default pool, 5s lock timeout); "wal" is
+``database.make_engine`` with its pragmas. Each runs on a fresh database file.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from .common import summarize
+
+
+def run(label, engine, args):
+    from ..app.migrations import migrate
+    from ..app.models import models
+
+    migrate(engine)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    with Session() as db:
+        db.add_all(models.Card(owner_id=1, name=f"Seed {i}", game="Pokemon", set_code="SV1",
+                               card_number=f"{i:03d}", price="1.00") for i in range(args.seed))
+        db.commit()
+
+    latencies, errors, reads = [], [], [0]
+    stop = threading.Event()
+
+    def writer(w):
+        for i in range(args.inserts):
+            t = time.perf_counter()
+            db = Session()
+            try:
+                card = models.Card(owner_id=1, name=f"Card {w}-{i}", game="Pokemon", set_code="SV1",
+                                   card_number=f"{i:03d}", price="1.00")
+                db.add(card)
+                db.commit()
+                db.refresh(card)
+                latencies.append(time.perf_counter() - t)
+            except OperationalError as e:
+                errors.append(str(e.orig))
+                db.rollback()
+            finally:
+                db.close()
+
+    def reader():
+        while not stop.is_set():
+            with Session() as db:
+                result = db.execute(select(models.Card.__table__).execution_options(yield_per=500))
+                for _ in result.partitions():
+                    pass
+            reads[0] += 1
+
+    readers = [threading.Thread(target=reader) for _ in range(args.readers)]
+    writers = [threading.Thread(target=writer, args=(w,)) for w in range(args.writers)]
+    start = time.perf_counter()
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    print(f"--- {label}")
+    summarize("  insert + commit", latencies)
+    print(f"  {len(latencies) / elapsed:.0f} commits/s, {len(errors)} failed "
+          f"({errors[0] if errors else 'no errors'}), {reads[0]} full reads")
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--inserts", type=int, default=200, help="per writer")
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=20000, help="cards in the table before the run")
+    args = parser.parse_args()
+
+    from ..app.database import make_engine
+
+    workdir = tempfile.mkdtemp(prefix="cardscope-bench-")
+    old = create_engine(f"sqlite:///{os.path.join(workdir, 'old.db')}", connect_args={"check_same_thread": False})
+    run("old (rollback journal)", old, args)
+    run("wal profile", make_engine(f"sqlite:///{os.path.join(workdir, 'wal.db')}"), args)
+
+
+if __name__ == "__main__":
+    main()
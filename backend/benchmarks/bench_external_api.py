@@ -0,0 +1,75 @@
+"""ExternalCardAPI against a local stub upstream: pooled client and racing game probes.
+
+    python -m backend.benchmarks.bench_external_api --delay 0.05
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import summarize
+from .stub_upstream import StubUpstream
+
+
+async def run(args, stub):
+    import httpx
+
+    from ..app.services import external_api
+    from ..app.services.card_cache import CardDetailsCache
+    from ..app.services.external_api import ExternalCardAPI
+
+    # Zero TTLs: every lookup goes upstream, so the HTTP path itself is measured
+    uncached = CardDetailsCache(static_ttl=0, price_ttl=0, negative_ttl=0)
+
+    # Per-call client (old behaviour) vs the shared pooled client
+    fresh, pooled = [], []
+    for _ in range(args.lookups):
+        start = time.perf_counter()
+        async with httpx.AsyncClient() as client:
+            await ExternalCardAPI(client, cache=uncached).get_card_details("Yu-Gi-Oh!", "LOB", "001")
+        fresh.append(time.perf_counter() - start)
+    api = ExternalCardAPI(cache=uncached)
+    for _ in range(args.lookups):
+        start = time.perf_counter()
+        await api.get_card_details("Yu-Gi-Oh!", "LOB", "001")
+        pooled.append(time.perf_counter() - start)
+    summarize("client per lookup", fresh)
+    summarize("pooled client", pooled)
+
+    # A Pokemon code not in CardReference: sequential Yu-Gi-Oh! then Pokemon vs racing both
+    sequential, raced = [], []
+    for _ in range(args.lookups):
+        start = time.perf_counter()
+        if not await api.get_card_details("Yu-Gi-Oh!", "SV1", "025"):
+            await api.get_card_details("Pokemon", "SV1", "025")
+        sequential.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found = await api.find_card("SV1", "025")
+        raced.append(time.perf_counter() - start)
+        assert found and found[0] == "Pokemon", found
+    summarize("unknown code, sequential", sequential)
+    summarize("unknown code, raced", raced)
+
+    assert await api.find_card("NOPE", "999") is None
+    print(f"upstream requests: {stub.requests}")
+    await external_api.close_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--delay", type=float, default=0.05, help="simulated upstream latency (s)")
+    parser.add_argument("--lookups", type=int, default=50)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=args.delay).start()
+    os.environ["YGOPRODECK_URL"] = f"{stub.base_url}/ygo"
+    os.environ["POKEMONTCG_URL"] = f"{stub.base_url}/pokemon"
+    try:
+        asyncio.run(run(args, stub))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
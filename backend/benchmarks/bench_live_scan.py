@@ -0,0 +1,178 @@
+"""Time to recognition of a live camera scan against the photo-and-retry flow.
+
+    python -m backend.benchmarks.bench_live_scan --fps 10 --shutter-at 0.9 --reaction 1.5
+
+A simulated camera sees an empty table, then a card sliding in (motion-blurred),
+settling, and held still. The live scan streams every frame over
+``/cards/scan/live``; the POST flow shoots a full-resolution still at
+``--shutter-at`` seconds, and when that fails retakes it ``--reaction`` seconds
+after the answer. Time is counted from the card entering the frame. CPU is this
+process's (server and client both run in it; frames are encoded up front).
+
+The artwork is in the visual index and the upstream is a local stub, so no OCR
+engine or network is needed; without a tesseract binary the blurred first shot,
+which misses the visual index and falls back to OCR, fails with a 500 instead of
+a low-confidence guess, and is retaken all the same. WebSockets are driven through Starlette's
+TestClient, which needs no WebSocket library for uvicorn.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from .common import load_app, synthetic_card, synthetic_photo
+from .stub_upstream import StubUpstream
+
+CAMERA = (960, 1280)
+STILL = (3024, 4032)
+
+
+def camera_frame(base, shift, blur, quality=80):
+    # The card photo shifted sideways by ``shift`` of the width, with horizontal motion blur
+    h, w = base.shape[:2]
+    M = np.float32([[1, 0, shift * w], [0, 1, 0]])
+    img = cv2.warpAffine(base, M, (w, h), borderMode=cv2.BORDER_REPLICATE)
+    if blur > 1:
+        img = cv2.blur(img, (blur, 1))
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def timeline(card, fps):
+    """(seconds, JPEG) of each camera frame; the card enters at 0.5s and is still from 2s."""
+    empty = np.full((CAMERA[1], CAMERA[0], 3), 60, np.uint8)
+    cv2.randu(empty, 40, 80)
+    empty_jpeg = cv2.imencode(".jpg", empty, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+    base = cv2.imdecode(np.frombuffer(synthetic_photo(resolution=CAMERA, card=card), np.uint8), cv2.IMREAD_COLOR)
+    rng = np.random.default_rng(1)
+    frames = []
+    for i in range(int(4 * fps)):
+        t = i / fps
+        if t < 0.5:
+            frames.append((t, empty_jpeg))
+        elif t < 1.5:
+            # Sliding in from the right
+            frames.append((t, camera_frame(base, (1.5 - t) * 0.3, 25)))
+        elif t < 2.0:
+            frames.append((t, camera_frame(base, rng.normal(0, 0.01), 5)))
+        else:
+            frames.append((t, camera_frame(base, rng.normal(0, 0.002), 1)))
+    return frames
+
+
+def still_photo(card, at):
+    # What the phone's shutter captures at ``at`` seconds: full resolution, placed and blurred as the camera saw it
+    base = cv2.imdecode(np.frombuffer(synthetic_photo(resolution=STILL, card=card), np.uint8), cv2.IMREAD_COLOR)
+    if at < 1.5:
+        return camera_frame(base, (1.5 - at) * 0.3, 75, quality=90)
+    return camera_frame(base, 0, 15 if at < 2.0 else 1, quality=90)
+
+
+def seed_references(card, decoys):
+    from ..app.cv.hashing import dhash, phash
+    from ..app.cv.visual_index import VISUAL_INDEX_PATH, VisualIndex
+    from ..app.database import SessionLocal
+    from ..app.models import models
+
+    db = SessionLocal()
+    rows = [models.CardReference(id=1, game="Yu-Gi-Oh!", set_code="LOB", card_number="005", name="Dark Magician",
+                                 rarity="Ultra Rare")]
+    rows += [models.CardReference(id=i + 2, game="Yu-Gi-Oh!", set_code="DCY", card_number=f"{i:03d}",
+                                  name=f"Decoy {i}", rarity="Common") for i in range(len(decoys))]
+    db.add_all(rows)
+    db.commit()
+    db.close()
+    images = [card, *decoys]
+    VisualIndex(list(range(1, len(images) + 1)), [phash(c) for c in images], [dhash(c) for c in images]) \
+        .save(VISUAL_INDEX_PATH)
+
+
+def run_post(client, card, args):
+    # The retake is always of the settled card
+    shots = [still_photo(card, args.shutter_at), still_photo(card, 3.0)]
+    elapsed, cpu, statuses = args.shutter_at - 0.5, time.process_time(), []
+    for photo in shots:
+        start = time.perf_counter()
+        r = client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+        elapsed += time.perf_counter() - start
+        statuses.append(r.status_code)
+        # A failed scan (card not found, an error, or a guess to confirm) means a retake
+        if r.status_code == 200 and not r.json()["requires_confirmation"]:
+            break
+        elapsed += args.reaction
+    return elapsed, time.process_time() - cpu, statuses, r.json()
+
+
+def run_live(client, frames, fps):
+    with client.websocket_connect("/cards/scan/live") as ws:
+        card_at = next(t for t, _ in frames if t >= 0.5)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        stop = threading.Event()
+
+        def camera():
+            for t, jpeg in frames:
+                delay = start + t - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                if stop.is_set():
+                    return
+                ws.send_bytes(jpeg)
+
+        sender = threading.Thread(target=camera, daemon=True)
+        sender.start()
+        while True:
+            message = ws.receive_json()
+            if message["type"] != "frame":
+                break
+        elapsed = time.perf_counter() - start - card_at
+        stop.set()
+        sender.join()
+        return elapsed, time.process_time() - cpu, message
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fps", type=float, default=10)
+    parser.add_argument("--shutter-at", type=float, default=0.9,
+                        help="seconds; the card enters at 0.5 and settles at 2.0")
+    parser.add_argument("--reaction", type=float, default=1.5, help="seconds to notice a failed scan and retake")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=0.05).start()
+    os.environ.update({
+        "YGOPRODECK_URL": f"{stub.base_url}/ygo",
+        "POKEMONTCG_URL": f"{stub.base_url}/pokemon",
+        "VISUAL_INDEX_PATH": os.path.join(tempfile.mkdtemp(prefix="cardscope-bench-"), "visual_index.npz"),
+        "SCAN_CACHE_TTL": "0",
+    })
+    from fastapi.testclient import TestClient
+
+    app = load_app()
+    card = synthetic_card("Dark Magician", "LOB-EN005", art_seed=5)
+    seed_references(card, [synthetic_card(f"Decoy {i}", f"DCY-{i:03d}", art_seed=100 + i) for i in range(20)])
+    frames = timeline(card, args.fps)
+    print(f"{len(frames)} camera frames at {args.fps:g}fps, {CAMERA[0]}x{CAMERA[1]}, "
+          f"~{sum(len(f) for _, f in frames) // len(frames) // 1024}KB each")
+
+    try:
+        with TestClient(app, raise_server_exceptions=False) as client:
+            for i in range(args.rounds):
+                elapsed, cpu, statuses, result = run_post(client, card, args)
+                print(f"POST /cards/scan + retry  {elapsed:6.2f}s to recognition  cpu {cpu * 1000:6.0f}ms  "
+                      f"responses {statuses}  -> {result['card_data']['name']} ({result['confidence']})")
+                elapsed, cpu, result = run_live(client, frames, args.fps)
+                assert result["type"] == "result", result
+                print(f"WS /cards/scan/live       {elapsed:6.2f}s to recognition  cpu {cpu * 1000:6.0f}ms  "
+                      f"frames {result['frames']} processed {result['processed']} dropped {result.get('dropped', 0)} "
+                      f"ocr_runs {result['ocr_runs']}  -> {result['card_data']['name']} ({result['confidence']})")
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
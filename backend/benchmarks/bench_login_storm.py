@@ -0,0 +1,98 @@
+"""Scan and API latency while a burst of logins hashes passwords.
+
+    python -m backend.benchmarks.bench_login_storm --logins 4 --scans 4
+
+"inline" verifies bcrypt on the event loop (the old behaviour), "pool" on the bounded
+password pool. A cheap authenticated request is probed every 50ms alongside the
+scans to show how long the event loop stalls. Rate limiting is off for the storm
+and measured separately at the end.
+"""
+import argparse
+import asyncio
+import time
+
+from .common import load_app, summarize, synthetic_card, synthetic_photo
+
+
+async def run(args):
+    import httpx
+
+    from ..app.api import auth as auth_api
+    from ..app.database import SessionLocal
+    from ..app.models import models
+    from ..app.services import auth
+
+    app = load_app()
+    hashed = auth.get_password_hash("correct horse")
+    db = SessionLocal()
+    try:
+        db.add_all(models.User(email=f"storm{i}@example.com", hashed_password=hashed) for i in range(args.logins))
+        db.commit()
+    finally:
+        db.close()
+    print(f"bcrypt cost {auth.BCRYPT_ROUNDS}, {args.logins} concurrent logins")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def login(i):
+            r = await client.post("/token", data={"username": f"storm{i}@example.com", "password": "correct horse"})
+            return r.status_code
+
+        async def storm(stop):
+            count = 0
+            while not stop.is_set():
+                codes = await asyncio.gather(*(login(i) for i in range(args.logins)))
+                assert all(code == 200 for code in codes), codes
+                count += len(codes)
+            return count
+
+        for m, mode in enumerate(("no storm", "inline", "pool")):
+            auth.password_pool.kind = "inline" if mode == "inline" else "thread"
+            auth_api.client_limiter.rate = auth_api.account_limiter.rate = 0
+            stop = asyncio.Event()
+            storm_task = asyncio.ensure_future(storm(stop)) if mode != "no storm" else None
+            probes = []
+
+            async def probe():
+                while not stop.is_set():
+                    t = time.perf_counter()
+                    await client.get("/cards/cache-stats")
+                    probes.append(time.perf_counter() - t)
+                    await asyncio.sleep(0.05)
+
+            probe_task = asyncio.ensure_future(probe())
+            scans = []
+            start = time.perf_counter()
+            for i in range(args.scans):
+                photo = synthetic_photo(card=synthetic_card(f"Card {i}", f"LOB-0{i:02d}", art_seed=m * 100 + i))
+                t = time.perf_counter()
+                r = await client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+                scans.append(time.perf_counter() - t)
+                assert r.status_code == 200, r.text
+            elapsed = time.perf_counter() - start
+            stop.set()
+            await probe_task
+            logins = await storm_task if storm_task else 0
+
+            print(f"--- {mode}")
+            summarize("  POST /cards/scan", scans)
+            summarize("  GET /cards/cache-stats", probes)
+            print(f"  {logins / elapsed:.1f} logins/s")
+
+        auth_api.client_limiter.rate = auth_api.account_limiter.rate = auth_api.LOGIN_RATE_PER_MINUTE / 60
+        codes = [await login(0) for _ in range(args.limited)]
+        print(f"--- rate limit ({auth_api.LOGIN_RATE_PER_MINUTE:g}/min, burst {auth_api.LOGIN_RATE_BURST}): "
+              f"{args.limited} logins from one client -> {codes.count(200)} ok, {codes.count(429)} rejected (429)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=4, help="logins in flight during the storm")
+    parser.add_argument("--scans", type=int, default=4)
+    parser.add_argument("--limited", type=int, default=20, help="back-to-back logins for the rate-limit check")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
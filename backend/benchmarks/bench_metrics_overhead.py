@@ -0,0 +1,56 @@
+"""Cost of the metrics timers, disabled and enabled, next to a typical CV step.
+
+    python -m backend.benchmarks.bench_metrics_overhead --calls 200000
+
+Times an empty ``timer`` block with METRICS_ENABLED off and on, with a Server-Timing
+request active, and the ``timed`` decorator. For scale, decoding one phone photo is
+tens of milliseconds and a scan runs a few dozen timers.
+"""
+import argparse
+import time
+
+from .common import load_app
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+
+    load_app()
+    from ..app import metrics
+
+    def block():
+        with metrics.timer("bench_seconds", stage="noop"):
+            pass
+
+    @metrics.timed("bench_seconds", stage="decorated")
+    def decorated():
+        pass
+
+    def bare():
+        pass
+
+    baseline = per_call(bare, args.calls)
+    results = []
+    for label, enabled, server_timing in (("disabled", False, False), ("enabled", True, False),
+                                          ("Server-Timing only", False, True), ("enabled + Server-Timing", True, True)):
+        metrics.METRICS_ENABLED = enabled
+        token = metrics._request_timings.set(metrics._RequestTimings() if server_timing else None)
+        try:
+            results.append((label, per_call(block, args.calls), per_call(decorated, args.calls)))
+        finally:
+            metrics._request_timings.reset(token)
+    for label, timer_s, decorated_s in results:
+        print(f"{label:<26} timer {timer_s * 1e9:7.0f}ns  timed() {(decorated_s - baseline) * 1e9:7.0f}ns per call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Fuzzy name lookups against index size, with OCR-style noise on the queries.
+
+    python -m backend.benchmarks.bench_name_index --sizes 10000 100000
+"""
+import argparse
+import random
+import time
+
+from .common import summarize
+
+WORDS = (
+    "blue eyes white dragon dark magician red black skull knight elf mystical "
+    "celtic guardian summoned feral imp gaia fierce baby magic cylinder mirror "
+    "force pot greed raigeki monster reborn harpie lady sisters pikachu charizard "
+    "mewtwo bulbasaur squirtle eevee gengar snorlax lucario greninja rayquaza "
+    "ancient ultimate chaos emperor sorcerer warrior witch shadow flame thunder"
+).split()
+OCR_CONFUSIONS = {"o": "0", "l": "1", "i": "l", "e": "c", "s": "5", "a": "o", "g": "9"}
+
+
+SYLLABLES = "ka ra mi to ge on dra gor vel is an tha mor lux fen dar sy qu el ix bo na rel zan cro".split()
+
+
+def make_names(rng, n):
+    # Real catalogs have a vocabulary in the thousands, so pad the themed words with made-up ones
+    vocab = WORDS + ["".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))) for _ in range(4000)]
+    names = set()
+    while len(names) < n:
+        names.add(" ".join(rng.choice(vocab) for _ in range(rng.randint(2, 4))).title())
+    return list(names)
+
+
+def ocr_noise(rng, name):
+    chars = list(name)
+    for _ in range(max(1, len(chars) // 10)):
+        i = rng.randrange(len(chars))
+        chars[i] = OCR_CONFUSIONS.get(chars[i].lower(), chars[i])
+    if rng.random() < 0.3:
+        del chars[rng.randrange(len(chars))]
+    return "".join(chars) + rng.choice(["", " |", " ®", ";"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    from ..app.services.name_index import NameIndex
+
+    rng = random.Random(7)
+    for size in args.sizes:
+        names = make_names(rng, size)
+        index = NameIndex()
+        start = time.perf_counter()
+        for ref_id, name in enumerate(names, 1):
+            index.add(ref_id, name)
+        build = time.perf_counter() - start
+
+        targets = [rng.randrange(size) for _ in range(args.queries)]
+        queries = [ocr_noise(rng, names[t]) for t in targets]
+        # k=1 is what the scan fallback asks for; k=5 can stop re-ranking early far less often
+        results = {}
+        for k in (1, 5):
+            times, top1 = [], 0
+            for t, query in zip(targets, queries):
+                start = time.perf_counter()
+                hits = index.search(query, k=k)
+                times.append(time.perf_counter() - start)
+                top1 += bool(hits) and hits[0][0] == t + 1
+            results[k] = times, top1
+
+        start = time.perf_counter()
+        index.add(size + 1, "Freshly Added Reference")
+        added = time.perf_counter() - start
+
+        print(f"--- {size} names (built in {build:.2f}s, incremental add {added * 1e6:.0f}us)")
+        for k, (times, top1) in results.items():
+            summarize(f"search top-{k}", times)
+        print(f"{'top-1 accuracy':<28} {results[1][1] / len(targets):.3f}")
+
+
+if __name__ == "__main__":
+    main()
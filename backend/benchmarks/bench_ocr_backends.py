@@ -0,0 +1,70 @@
+"""Per-scan OCR latency and CPU for each OCR backend on a fixed synthetic corpus.
+
+    python -m backend.benchmarks.bench_ocr_backends --backends pytesseract tesserocr
+
+CPU includes child processes, so the tesseract binaries spawned by the
+pytesseract backend are counted too.
+"""
+import argparse
+import resource
+import time
+
+from .common import summarize, synthetic_card
+from .ocr_baselines import extract_card_code
+
+CORPUS_NAMES = [
+    ("Blue-Eyes White Dragon", "LOB-EN001"),
+    ("Dark Magician", "LOB-EN005"),
+    ("Pikachu", "025/198"),
+    ("Charizard ex", "199/165"),
+    ("Red-Eyes Black Dragon", "LOB-EN070"),
+    ("Mewtwo", "150/165"),
+]
+
+
+def cpu_seconds():
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+
+def bench_backend(name, corpus, rounds):
+    from ..app.cv.processor import CVProcessor, get_ocr_backend
+
+    processor = CVProcessor(ocr=get_ocr_backend(name))
+    # Warm-up so one-off model loading is reported separately from steady state
+    start = time.perf_counter()
+    extract_card_code(processor, corpus[0])
+    print(f"{name}: first call {1000 * (time.perf_counter() - start):.1f}ms")
+
+    latencies = []
+    cpu_start = cpu_seconds()
+    for _ in range(rounds):
+        for card in corpus:
+            start = time.perf_counter()
+            # Same two OCR passes a scan performs
+            processor.ocr.image_to_string(processor._preprocess_for_ocr(card))
+            extract_card_code(processor, card)
+            latencies.append(time.perf_counter() - start)
+    cpu = cpu_seconds() - cpu_start
+
+    summarize(f"{name} per scan", latencies)
+    print(f"{name:<28} cpu/scan={1000 * cpu / len(latencies):8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=["pytesseract", "tesserocr"])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = [synthetic_card(name, code) for name, code in CORPUS_NAMES]
+    for name in args.backends:
+        try:
+            bench_backend(name, corpus, args.rounds)
+        except (RuntimeError, OSError) as e:
+            print(f"{name}: skipped ({e})")
+
+
+if __name__ == "__main__":
+    main()
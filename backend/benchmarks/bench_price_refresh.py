@@ -0,0 +1,105 @@
+"""Nightly price refresh of every owned card against the stub upstreams.
+
+    python -m backend.benchmarks.bench_price_refresh --cards 500000 --keys 40000
+
+Cards are drawn from a catalog of ``--keys`` distinct printings, half Yu-Gi-Oh!
+(a few printings per card name, 1% with a name upstream doesn't know) and half
+Pokemon (100 per set), none priced yet.
+The stub upstreams answer 429 above ``--upstream-rate`` requests per second each;
+the refresher runs at its configured YGOPRODECK_RATE / POKEMONTCG_RATE. The
+request counts of unbatched strategies are projected at the same rates.
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from sqlalchemy import func, insert, select
+
+
+def build_catalog(keys, rng):
+    ygo, pokemon = {}, {}
+    for i in range(keys // 2):
+        name = f"Monster {i // 3}"
+        ygo[f"Y{i // 100:03d}-EN{i % 100:03d}"] = {"name": name, "price": f"{rng.randrange(5, 20000) / 100:.2f}",
+                                                   "rarity": "Common"}
+    for i in range(keys - keys // 2):
+        pokemon[(f"p{i // 100:03d}", f"{i % 100:03d}")] = {"name": f"Pokemon {i}", "market": rng.randrange(5, 20000) / 100,
+                                                          "rarity": "Rare"}
+    return ygo, pokemon
+
+
+async def run(args):
+    from .common import load_app  # before the app, so DATABASE_URL points at a scratch file
+    load_app()
+    from ..app import price_refresh
+    from ..app.database import SessionLocal
+    from ..app.models import models
+    from ..app.services import collection_stats
+    from ..app.services.external_api import ExternalCardAPI
+    from .stub_upstream import StubUpstream
+
+    rng = random.Random(3)
+    ygo, pokemon = build_catalog(args.keys, rng)
+    # A few collections spell a name the way upstream doesn't: those batches get split up
+    printings = [("Yu-Gi-Oh!", *code.split("-"), card["name"] + (" (misspelt)" if i % 97 == 0 else ""))
+                 for i, (code, card) in enumerate(ygo.items())]
+    printings += [("Pokemon", set_id.upper(), number, card["name"]) for (set_id, number), card in pokemon.items()]
+
+    start = time.perf_counter()
+    db = SessionLocal()
+    for offset in range(0, args.cards, 20000):
+        rows = []
+        for i in range(offset, min(offset + 20000, args.cards)):
+            game, set_code, card_number, name = rng.choice(printings)
+            rows.append({"owner_id": 1 + i % args.users, "game": game, "set_code": set_code, "card_number": card_number,
+                         "name": name, "rarity": "Common", "confidence": 1.0})
+        db.execute(insert(models.Card), rows)
+        db.commit()
+    collection_stats.rebuild(db)
+    db.commit()
+    print(f"seeded {args.cards} cards ({args.keys} printings, {args.users} users) in {time.perf_counter() - start:.0f}s")
+
+    stub = StubUpstream(delay=args.delay, ygo_cards=ygo, pokemon_cards={
+        # Upstream numbers aren't zero-padded
+        (set_id, number.lstrip("0") or "0"): card for (set_id, number), card in pokemon.items()
+    }, rate=args.upstream_rate).start()
+    api = ExternalCardAPI()
+    api.yugioh_url, api.pokemon_url = f"{stub.base_url}/ygo", f"{stub.base_url}/pokemon"
+    refresher = price_refresh.PriceRefresher(api=api)
+    try:
+        stats = await refresher.run()
+        print(f"pass 1: {stats}")
+        print(f"  upstream requests: {stub.requests}")
+        again = await refresher.run()
+        print(f"pass 2 (right after): {again['keys_due']} keys due, {again.get('requests', 0)} requests")
+    finally:
+        stub.stop()
+        await api.client.aclose()
+
+    live = collection_stats.collection_stats(db, 1, [models.Card.id], rollups=False)
+    rolled = collection_stats.collection_stats(db, 1, [models.Card.id], rollups=True)
+    assert live["totals"] == rolled["totals"] and live["by_set"] == rolled["by_set"], "rollups drifted"
+    unpriced = db.execute(select(func.count()).where(models.Card.price_cents.is_(None))).scalar()
+    db.close()
+    print(f"  {unpriced} cards left unpriced, rollups match the cards table")
+
+    ygo_rate, pokemon_rate = price_refresh.YGOPRODECK_RATE, price_refresh.POKEMONTCG_RATE
+    per_second = (ygo_rate + pokemon_rate) / 2
+    for label, requests in (("one request per owned card", args.cards), ("one request per printing", args.keys)):
+        print(f"  projected {label:<28} {requests:>7} requests, ~{requests / per_second / 3600:5.1f}h")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=500000)
+    parser.add_argument("--keys", type=int, default=40000, help="distinct printings owned")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--delay", type=float, default=0.15, help="upstream latency, seconds")
+    parser.add_argument("--upstream-rate", type=float, default=20, help="requests/s each stub accepts")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
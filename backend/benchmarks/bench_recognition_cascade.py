@@ -0,0 +1,111 @@
+"""OCR calls and time per recognised card: every band up front vs the early-exit cascade.
+
+    python -m backend.benchmarks.bench_recognition_cascade --backend tesserocr --name-only 0.2
+
+Cards are already warped (as from a batch page or a live frame), so only recognition
+is timed. Most carry a readable set code that CardReference knows; a ``--name-only``
+fraction has no code printed and must be recognised by name. "all bands" is the
+previous ROI pipeline: the name and code bands of every layout OCR'd for each card.
+Needs a Tesseract install; card details come from a local stub upstream.
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+from .bench_ocr_backends import CORPUS_NAMES
+from .common import load_app, summarize, synthetic_card
+from .ocr_baselines import read_bands
+from .stub_upstream import StubUpstream
+
+
+def counting(backend):
+    # Wraps the OCR engine to count calls; everything else is the real backend
+    from ..app.cv.processor import OCRBackend
+
+    class CountingOCR(OCRBackend):
+        name = backend.name
+
+        def __init__(self):
+            self.calls = 0
+
+        def image_to_string(self, img, psm=3):
+            self.calls += 1
+            return backend.image_to_string(img, psm=psm)
+
+    return CountingOCR()
+
+
+async def run(args):
+    load_app()
+    from ..app.cv.processor import CVProcessor, get_ocr_backend
+    from ..app.database import SessionLocal
+    from ..app.models import models
+    from ..app.services.cascade import parse_card_code, recognition_cascade
+    from ..app.services.container import ServiceContainer
+    from ..app.services.reference_cache import reference_cache
+
+    db = SessionLocal()
+    for name, code in CORPUS_NAMES:
+        parsed = parse_card_code(code)
+        db.add(models.CardReference(game="Yu-Gi-Oh!" if "-" in code else "Pokemon", set_code=parsed["set"],
+                                    card_number=parsed["number"], name=name, rarity="Common",
+                                    set_code_norm=parsed["set"], card_number_norm=parsed["number"]))
+    db.commit()
+    reference_cache.load(db)
+
+    ocr = counting(get_ocr_backend(args.backend))
+    services = ServiceContainer(cv=CVProcessor(ocr=ocr))
+    rng = random.Random(5)
+    corpus = [synthetic_card(name, "" if rng.random() < args.name_only else code)
+              for name, code in CORPUS_NAMES for _ in range(args.rounds)]
+    rng.shuffle(corpus)
+
+    bands, cascade = [], []
+    for card in corpus:
+        start = time.perf_counter()
+        read_bands(services.cv, card)
+        bands.append(time.perf_counter() - start)
+    band_calls, ocr.calls = ocr.calls, 0
+
+    recognised = 0
+    for card in corpus:
+        start = time.perf_counter()
+        result = await services.recognition(db).recognize_card(card)
+        cascade.append(time.perf_counter() - start)
+        recognised += result.get("card_data") is not None and result["scan_method"] != "manual"
+    cascade_calls = ocr.calls
+    await services.aclose()
+    db.close()
+
+    summarize("all bands (OCR only)", bands)
+    summarize("cascade (OCR + lookups)", cascade)
+    print(f"OCR calls per card: all bands {band_calls / len(corpus):.2f}, cascade {cascade_calls / len(corpus):.2f}"
+          f"  ({recognised}/{len(corpus)} recognised by the cascade)")
+    stats = recognition_cascade.stats()
+    for name, stage in stats["stages"].items():
+        print(f"  {name:<8} runs {stage['runs']:>4}  hits {stage['hits']:>4}  hit rate {stage['hit_rate']:.2f}  "
+              f"avg {stage['avg_ms']:7.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--name-only", type=float, default=0.2, help="fraction of cards without a set code")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=0).start()
+    os.environ.update({
+        "YGOPRODECK_URL": f"{stub.base_url}/ygo",
+        "POKEMONTCG_URL": f"{stub.base_url}/pokemon",
+    })
+    try:
+        asyncio.run(run(args))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""CardReference code lookups: unindexed query vs normalised-code index vs in-process cache.
+
+    python -m backend.benchmarks.bench_reference_lookup --sizes 10000 100000 1000000
+"""
+import argparse
+import random
+import resource
+import time
+
+from .common import summarize
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    from ..app.catalog_sync import upsert_references
+    from ..app.database import SessionLocal
+    from ..app.migrations import migrate
+    from ..app.models import models
+    from ..app.services.reference_cache import ReferenceCache, normalize_code
+
+    migrate()
+    rng = random.Random(0)
+    db = SessionLocal()
+    loaded = 0
+    try:
+        for size in args.sizes:
+            batch = []
+            for i in range(loaded, size):
+                batch.append({"game": "Yu-Gi-Oh!" if i % 2 else "Pokemon", "set_code": f"S{i // 100:05d}",
+                              "card_number": f"EN{i % 100:03d}", "name": f"Card {i}", "rarity": "Common"})
+                if len(batch) == 10000:
+                    upsert_references(db, batch)
+                    batch = []
+            upsert_references(db, batch)
+            db.commit()
+            loaded = size
+
+            codes = [(f"s{i // 100:05d}", f"en{i % 100:03d}") for i in (rng.randrange(size) for _ in range(args.lookups))]
+            print(f"--- {size} references")
+
+            # The query scan_card used to run: nothing indexes (set_code, card_number) alone
+            timings = []
+            for set_code, number in codes[:max(20, args.lookups // 100)]:
+                start = time.perf_counter()
+                db.query(models.CardReference).filter(
+                    models.CardReference.set_code == set_code.upper(),
+                    models.CardReference.card_number == number.upper(),
+                ).first()
+                timings.append(time.perf_counter() - start)
+            summarize("  unindexed query", timings)
+
+            timings = []
+            for set_code, number in codes:
+                start = time.perf_counter()
+                db.query(models.CardReference).filter(
+                    models.CardReference.set_code_norm == normalize_code(set_code),
+                    models.CardReference.card_number_norm == normalize_code(number),
+                ).first()
+                timings.append(time.perf_counter() - start)
+            summarize("  indexed query", timings)
+
+            cache = ReferenceCache()
+            before = rss_mb()
+            start = time.perf_counter()
+            cache.load(db)
+            print(f"  cache warm-up: {time.perf_counter() - start:.2f}s, peak RSS +{rss_mb() - before:.0f} MB")
+
+            timings = []
+            for set_code, number in codes:
+                start = time.perf_counter()
+                entry = cache.lookup(set_code, number)
+                timings.append(time.perf_counter() - start)
+                assert entry is not None
+            timings.sort()
+            print(f"  {'cache lookup':<26} n={len(timings):<6} p50={timings[len(timings) // 2] * 1e6:8.2f}us  "
+                  f"p99={timings[int(len(timings) * 0.99)] * 1e6:8.2f}us")
+            del cache
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
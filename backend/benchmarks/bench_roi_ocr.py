@@ -0,0 +1,54 @@
+"""Per-scan OCR time and pixels handed to Tesseract: full-card OCR vs name/code bands.
+
+    python -m backend.benchmarks.bench_roi_ocr --backend tesserocr --band-threads 4
+"""
+import argparse
+import os
+import time
+
+from .bench_ocr_backends import CORPUS_NAMES
+from .common import summarize, synthetic_card
+from .ocr_baselines import extract_card_code, read_bands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="auto")
+    parser.add_argument("--band-threads", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ["OCR_BAND_THREADS"] = str(args.band_threads)
+    from ..app.cv.layouts import LAYOUTS
+    from ..app.cv.processor import CVProcessor, get_ocr_backend
+
+    processor = CVProcessor(ocr=get_ocr_backend(args.backend))
+    corpus = [synthetic_card(name, code) for name, code in CORPUS_NAMES]
+    h, w = corpus[0].shape[:2]
+
+    full, roi = [], []
+    for _ in range(args.rounds):
+        for card in corpus:
+            start = time.perf_counter()
+            processor.ocr.image_to_string(processor._preprocess_for_ocr(card))
+            extract_card_code(processor, card)
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            read_bands(processor, card)
+            roi.append(time.perf_counter() - start)
+
+    full_pixels = h * w + (h - int(h * 0.80)) * w
+    roi_pixels = sum(
+        band.crop(corpus[0]).shape[0] * band.crop(corpus[0]).shape[1]
+        for layout in LAYOUTS.values()
+        for band in layout.bands
+    )
+    summarize("full OCR per scan", full)
+    summarize("ROI OCR per scan", roi)
+    print(f"pixels OCR'd: full={full_pixels} roi={roi_pixels} "
+          f"({100 * (1 - roi_pixels / full_pixels):.0f}% fewer)")
+
+
+if __name__ == "__main__":
+    main()
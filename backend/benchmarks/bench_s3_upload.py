@@ -0,0 +1,84 @@
+"""Scan latency with S3 uploads inline, concurrent with CV, or queued in the background.
+
+    python -m backend.benchmarks.bench_s3_upload --scans 6 --upload-delay 0.5
+    python -m backend.benchmarks.bench_s3_upload --max-side 1600 --quality 85   # bytes stored
+
+Uploads go to a local S3 stand-in (stub_s3.StubS3) whose ``--upload-delay`` plays the
+round trip of a phone-sized photo to the bucket. Each mode scans different photos, so
+neither the scan result cache nor the known-object check short-circuits anything.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import load_app, summarize, synthetic_card, synthetic_photo
+from .stub_s3 import StubS3
+from .stub_upstream import StubUpstream
+
+MODES = ("inline", "concurrent", "background")
+
+
+async def run(args, stub):
+    import httpx
+
+    from ..app.services.s3_service import s3_service
+
+    app = load_app()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for m, mode in enumerate(MODES):
+            s3_service.mode = mode
+            photos = [
+                synthetic_photo(card=synthetic_card(f"Card {i}", f"LOB-0{i:02d}", art_seed=m * 100 + i))
+                for i in range(args.scans)
+            ]
+            latencies = []
+            for photo in photos:
+                start = time.perf_counter()
+                r = await client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+                latencies.append(time.perf_counter() - start)
+                assert r.status_code == 200, r.text
+            summarize(f"scan ({mode})", latencies)
+
+        start = time.perf_counter()
+        assert s3_service.uploader.drain(timeout=60)
+        print(f"background queue drained {time.perf_counter() - start:.2f}s after the last scan")
+
+    stats = s3_service.stats()
+    assert len(stub.objects) == len(MODES) * args.scans, len(stub.objects)
+    saved = 1 - stats["bytes_stored"] / stats["bytes_in"]
+    print(f"{len(stub.objects)} objects stored, {stats['bytes_in'] / 1e6:.1f}MB uploaded -> "
+          f"{stats['bytes_stored'] / 1e6:.1f}MB stored ({saved:.0%} saved)")
+    print(f"uploader: {stats}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scans", type=int, default=6)
+    parser.add_argument("--upload-delay", type=float, default=0.5)
+    parser.add_argument("--max-side", type=int, default=0)
+    parser.add_argument("--quality", type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubS3(delay=args.upload_delay).start()
+    upstream = StubUpstream(delay=0.05).start()
+    os.environ.update({
+        "YGOPRODECK_URL": f"{upstream.base_url}/ygo",
+        "POKEMONTCG_URL": f"{upstream.base_url}/pokemon",
+        "AWS_S3_ENDPOINT_URL": stub.base_url,
+        "AWS_STORAGE_BUCKET_NAME": "bench-scans",
+        "AWS_ACCESS_KEY_ID": "bench",
+        "AWS_SECRET_ACCESS_KEY": "bench",
+        "S3_UPLOAD_MAX_SIDE": str(args.max_side),
+        "S3_UPLOAD_JPEG_QUALITY": str(args.quality),
+    })
+    try:
+        asyncio.run(run(args, stub))
+    finally:
+        upstream.stop()
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
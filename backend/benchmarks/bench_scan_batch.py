@@ -0,0 +1,93 @@
+"""Cards/sec of POST /cards/scan/batch against the same cards sent as sequential single scans.
+
+    python -m backend.benchmarks.bench_scan_batch --images 12 --pages 2 --workers 4
+
+External lookups go to a local stub upstream with the card cache disabled, so the
+cross-batch lookup dedup is what saves the upstream calls.
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from .common import ThreadedServer, load_app, synthetic_card, synthetic_page, synthetic_photo
+from .stub_upstream import StubUpstream
+
+
+async def run(args, stub):
+    import httpx
+
+    server = ThreadedServer(load_app()).start()
+    photos = [synthetic_photo(card=synthetic_card(f"Card {i}", f"LOB-0{i % 10:02d}")) for i in range(args.images)]
+    pages = [synthetic_page() for _ in range(args.pages)]
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=None) as client:
+        def report(label, cards, elapsed, calls):
+            print(f"{label:<32} {cards:>3} cards in {elapsed:6.2f}s  {cards / elapsed:6.2f} cards/s  "
+                  f"upstream calls {calls}")
+
+        before = sum(stub.requests.values())
+        start = time.perf_counter()
+        for photo in photos:
+            r = await client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+            assert r.status_code == 200, r.text
+        report("sequential POST /cards/scan", len(photos), time.perf_counter() - start,
+               sum(stub.requests.values()) - before)
+
+        async def batch(files, segment):
+            before = sum(stub.requests.values())
+            start, first, cards = time.perf_counter(), None, 0
+            async with client.stream("POST", "/cards/scan/batch", params={"segment": segment}, files=files) as r:
+                assert r.status_code == 200, await r.aread()
+                async for line in r.aiter_lines():
+                    item = json.loads(line)
+                    if item.get("done"):
+                        summary = item
+                        break
+                    assert "error" not in item, item
+                    cards += 1
+                    first = first or time.perf_counter() - start
+            elapsed = time.perf_counter() - start
+            return cards, elapsed, first, sum(stub.requests.values()) - before, summary
+
+        files = [("files", (f"scan{i}.jpg", photo, "image/jpeg")) for i, photo in enumerate(photos)]
+        cards, elapsed, first, calls, summary = await batch(files, segment=False)
+        report("POST /cards/scan/batch", cards, elapsed, calls)
+        print(f"  first result after {first:.2f}s, lookups deduped {summary['lookups_deduped']}")
+
+        if pages:
+            files = [("files", (f"page{i}.jpg", page, "image/jpeg")) for i, page in enumerate(pages)]
+            cards, elapsed, first, calls, summary = await batch(files, segment=True)
+            report("POST /cards/scan/batch?segment", cards, elapsed, calls)
+            print(f"  first result after {first:.2f}s, lookups deduped {summary['lookups_deduped']}")
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=12, help="single-card photos")
+    parser.add_argument("--pages", type=int, default=2, help="3x3 binder pages for the segmented batch")
+    parser.add_argument("--executor", default="thread", choices=["thread", "process"])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--delay", type=float, default=0.1, help="simulated upstream latency (s)")
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=args.delay).start()
+    os.environ.update({
+        "CV_EXECUTOR": args.executor,
+        "CV_WORKERS": str(args.workers),
+        "YGOPRODECK_URL": f"{stub.base_url}/ygo",
+        "POKEMONTCG_URL": f"{stub.base_url}/pokemon",
+        "CARD_CACHE_STATIC_TTL": "0",
+        "CARD_CACHE_PRICE_TTL": "0",
+        "CARD_CACHE_NEGATIVE_TTL": "0",
+    })
+    try:
+        asyncio.run(run(args, stub))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
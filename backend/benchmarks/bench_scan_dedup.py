@@ -0,0 +1,79 @@
+"""Repeated uploads: fresh scans vs byte-identical retries vs re-shot photos of the same card.
+
+    python -m backend.benchmarks.bench_scan_dedup --cards 6 --near-distance 4
+
+A "rescan" re-encodes the photo at another JPEG quality with a little sensor noise,
+so its bytes differ but the frame hashes stay close. Different cards must not match.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import cv2
+import numpy as np
+
+from .common import load_app, summarize, synthetic_card, synthetic_photo
+
+
+def reshoot(photo, seed):
+    img = cv2.imdecode(np.frombuffer(photo, np.uint8), cv2.IMREAD_COLOR)
+    noise = np.random.default_rng(seed).integers(-6, 7, img.shape, dtype=np.int16)
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+
+
+async def run(args):
+    import httpx
+
+    app = load_app()
+    photos = [
+        synthetic_photo(card=synthetic_card(f"Card {i}", f"LOB-0{i:02d}", art_seed=i)) for i in range(args.cards)
+    ]
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def scan(photo):
+            start = time.perf_counter()
+            r = await client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+            assert r.status_code == 200, r.text
+            return time.perf_counter() - start, r.json()
+
+        fresh, results = [], []
+        for photo in photos:
+            elapsed, result = await scan(photo)
+            fresh.append(elapsed)
+            results.append(result)
+        summarize("fresh scan", fresh)
+
+        retries = []
+        for photo, expected in zip(photos, results):
+            elapsed, result = await scan(photo)
+            retries.append(elapsed)
+            assert result == expected
+        summarize("retry (same bytes)", retries)
+
+        rescans = []
+        for i, photo in enumerate(photos):
+            elapsed, _ = await scan(reshoot(photo, i))
+            rescans.append(elapsed)
+        summarize("rescan (re-encoded)", rescans)
+
+        stats = (await client.get("/cards/cache-stats")).json()["scan_results"]
+        print(f"scan result cache: {stats}")
+        # Every card was distinct, so each fresh scan must have missed
+        assert stats["misses"] == args.cards, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cards", type=int, default=6)
+    parser.add_argument("--near-distance", type=int, default=4)
+    args = parser.parse_args()
+
+    os.environ["SCAN_CACHE_NEAR_DISTANCE"] = str(args.near_distance)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
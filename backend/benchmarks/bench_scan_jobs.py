@@ -0,0 +1,96 @@
+"""Deferred scans: API latency of enqueueing vs scanning inline, and throughput per worker count.
+
+    python -m backend.benchmarks.bench_scan_jobs --jobs 24 --workers 1 2 4
+    python -m backend.benchmarks.bench_scan_jobs --jobs 12 --workers 2 --kill-one   # crash recovery
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import ThreadedServer, load_app, summarize, synthetic_photo
+from .stub_upstream import StubUpstream
+
+
+async def run(args):
+    import httpx
+
+    from ..app.scan_worker import start_workers, stop_workers
+
+    server = ThreadedServer(load_app()).start()
+    photo = synthetic_photo()
+    files = {"file": ("scan.jpg", photo, "image/jpeg")}
+
+    async with httpx.AsyncClient(base_url=server.base_url, timeout=None) as client:
+        inline = []
+        for _ in range(3):
+            start = time.perf_counter()
+            r = await client.post("/cards/scan", files=files)
+            inline.append(time.perf_counter() - start)
+            assert r.status_code == 200, r.text
+        summarize("POST /cards/scan (inline)", inline)
+
+        for count in args.workers:
+            workers = start_workers(count)
+            # Let the spawned interpreters import the app before timing
+            await asyncio.sleep(3)
+
+            try:
+                enqueue, job_ids = [], []
+                start = time.perf_counter()
+                for _ in range(args.jobs):
+                    t = time.perf_counter()
+                    r = await client.post("/cards/scan", params={"defer": True}, files=files)
+                    enqueue.append(time.perf_counter() - t)
+                    assert r.status_code == 202, r.text
+                    job_ids.append(r.json()["job_id"])
+
+                if args.kill_one:
+                    await asyncio.sleep(1)
+                    workers[0].kill()
+
+                async def wait(job_id):
+                    while True:
+                        job = (await client.get(f"/cards/jobs/{job_id}", params={"wait": 10})).json()
+                        if job["status"] in ("done", "failed"):
+                            return job
+
+                jobs = await asyncio.gather(*(wait(job_id) for job_id in job_ids))
+                elapsed = time.perf_counter() - start
+            finally:
+                # Non-daemonic workers would otherwise outlive a failed run
+                stop_workers(workers)
+
+            print(f"--- {count} worker process(es)")
+            summarize("  POST /cards/scan?defer", enqueue)
+            failed = sum(job["status"] == "failed" for job in jobs)
+            retried = sum(job["attempts"] > 1 for job in jobs)
+            print(f"  {args.jobs} jobs in {elapsed:.2f}s ({args.jobs / elapsed:.2f} jobs/s), "
+                  f"{failed} failed, {retried} retried")
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=24)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--kill-one", action="store_true", help="kill a worker mid-run; its job is retried")
+    args = parser.parse_args()
+
+    stub = StubUpstream(delay=0.05).start()
+    os.environ.update({
+        "YGOPRODECK_URL": f"{stub.base_url}/ygo",
+        "POKEMONTCG_URL": f"{stub.base_url}/pokemon",
+        # One CV thread per worker process: scaling comes from the process count
+        "CV_WORKERS": "1",
+    })
+    if args.kill_one:
+        os.environ["SCAN_JOB_LEASE_SECONDS"] = "5"
+    try:
+        asyncio.run(run(args))
+    finally:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Latency of cheap requests while concurrent scans are in flight.
+
+    python -m backend.benchmarks.bench_scan_load --executor inline   # old behaviour
+    python -m backend.benchmarks.bench_scan_load --executor thread --workers 2 --queue 4
+
+Reports p50/p99 for ``POST /cards/scan`` and ``GET /cards/`` plus how many
+scans were shed with 503 by the bounded CV pool.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import load_app, summarize, synthetic_photo
+
+
+async def run(args):
+    import httpx
+
+    app = load_app()
+    photo = synthetic_photo(resolution=tuple(args.resolution))
+    transport = httpx.ASGITransport(app=app)
+    scan_times, cheap_times, rejected = [], [], 0
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def scanner():
+            nonlocal rejected
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                r = await client.post("/cards/scan", files={"file": ("scan.jpg", photo, "image/jpeg")})
+                if r.status_code == 503:
+                    rejected += 1
+                else:
+                    scan_times.append(time.perf_counter() - start)
+
+        async def cheap():
+            while not stop.is_set():
+                start = time.perf_counter()
+                await client.get("/cards/")
+                cheap_times.append(time.perf_counter() - start)
+                await asyncio.sleep(0.005)
+
+        cheap_tasks = [asyncio.create_task(cheap()) for _ in range(args.cheap)]
+        await asyncio.gather(*(scanner() for _ in range(args.scans)))
+        stop.set()
+        await asyncio.gather(*cheap_tasks)
+
+    print(f"executor={os.environ['CV_EXECUTOR']} workers={os.environ['CV_WORKERS']} "
+          f"queue={os.environ['CV_QUEUE_SIZE']} concurrent_scans={args.scans}")
+    summarize("POST /cards/scan", scan_times)
+    summarize("GET /cards/ (during scans)", cheap_times)
+    print(f"{'scans rejected (503)':<28} {rejected}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--executor", default="thread", choices=["inline", "thread", "process"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=4)
+    parser.add_argument("--scans", type=int, default=8, help="concurrent scanning clients")
+    parser.add_argument("--rounds", type=int, default=5, help="scans per client")
+    parser.add_argument("--cheap", type=int, default=4, help="concurrent GET /cards/ clients")
+    parser.add_argument("--resolution", type=int, nargs=2, default=[3024, 4032])
+    args = parser.parse_args()
+
+    os.environ["CV_EXECUTOR"] = args.executor
+    os.environ["CV_WORKERS"] = str(args.workers)
+    os.environ["CV_QUEUE_SIZE"] = str(args.queue)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
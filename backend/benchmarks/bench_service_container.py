@@ -0,0 +1,92 @@
+"""Startup cost of the service container and per-request cost of getting a RecognitionService.
+
+    python -m backend.benchmarks.bench_service_container --references 20000 --requests 2000
+
+"per request (fresh)" builds the pipeline's objects the way each scan request used
+to: a new CVProcessor, ExternalCardAPI and S3 service with its own boto3 client.
+"per request (container)" binds the request's session to the shared objects.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from .common import summarize
+
+
+def seed(count):
+    from ..app.catalog_sync import upsert_references
+    from ..app.database import SessionLocal
+    from ..app.migrations import migrate
+
+    migrate()
+    db = SessionLocal()
+    try:
+        upsert_references(db, [
+            {"game": "Yu-Gi-Oh!", "set_code": f"S{i // 100:05d}", "card_number": f"EN{i % 100:03d}",
+             "name": f"Card {i}", "rarity": "Common"}
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run(args):
+    import boto3
+
+    start = time.perf_counter()
+    from ..app.main import app
+    imported = time.perf_counter() - start
+
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter() - start
+        services = app.state.services
+        print(f"import app: {imported * 1000:.0f}ms, lifespan startup: {started * 1000:.0f}ms")
+        for name, seconds in services.startup_seconds.items():
+            print(f"  {name:<16} {seconds * 1000:8.1f}ms")
+
+        from ..app.cv.processor import CVProcessor
+        from ..app.database import SessionLocal
+        from ..app.services.external_api import ExternalCardAPI
+        from ..app.services.recognition import RecognitionService
+        from ..app.services.s3_service import S3Service
+
+        db = SessionLocal()
+        try:
+            fresh = []
+            for _ in range(args.requests // 10):
+                t = time.perf_counter()
+                client = boto3.client("s3", region_name="us-east-1",
+                                      aws_access_key_id="bench", aws_secret_access_key="bench")
+                RecognitionService(db, cv=CVProcessor(), external_api=ExternalCardAPI(), s3=S3Service(client=client))
+                fresh.append(time.perf_counter() - t)
+            summarize("per request (fresh)", fresh)
+
+            shared = []
+            for _ in range(args.requests):
+                t = time.perf_counter()
+                services.recognition(db)
+                shared.append(time.perf_counter() - t)
+            summarize("per request (container)", shared)
+            print(f"mean: fresh {sum(fresh) / len(fresh) * 1e6:.0f}us, container {sum(shared) / len(shared) * 1e6:.1f}us")
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--references", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    os.environ["AWS_STORAGE_BUCKET_NAME"] = "bench-scans"
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "bench")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "bench")
+    seed(args.references)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Perceptual-hash index lookups against reference-set size.
+
+    python -m backend.benchmarks.bench_visual_index --sizes 10000 50000 200000
+
+Queries are stored hashes with a few random bits flipped (as a re-photographed
+card would be). Reports p50/p99 lookup time and recall, next to a bare popcount
+argmin over the same packed arrays as the floor for a lookup. Also checks that a
+synthetic photo of an indexed card matches end to end.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from .common import summarize, synthetic_card, synthetic_photo
+
+
+def random_hashes(rng, n):
+    return rng.integers(0, 2**63, size=n, dtype=np.int64).astype(np.uint64) * np.uint64(2) + \
+        rng.integers(0, 2, size=n, dtype=np.int64).astype(np.uint64)
+
+
+def flip_bits(rng, value, count):
+    for bit in rng.choice(64, size=count, replace=False):
+        value ^= 1 << int(bit)
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 200000])
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=int, default=6, help="bits flipped per query")
+    args = parser.parse_args()
+
+    from ..app.cv.hashing import dhash, phash
+    from ..app.cv.processor import CVProcessor
+    from ..app.cv.visual_index import VisualIndex
+
+    rng = np.random.default_rng(7)
+    for size in args.sizes:
+        phashes, dhashes = random_hashes(rng, size), random_hashes(rng, size)
+        start = time.perf_counter()
+        index = VisualIndex(np.arange(size), phashes, dhashes)
+        build = time.perf_counter() - start
+
+        targets = rng.integers(0, size, size=args.queries)
+        queries = [flip_bits(rng, int(phashes[t]), args.noise) for t in targets]
+        lookups, brute, hits = [], [], 0
+        for target, q in zip(targets, queries):
+            start = time.perf_counter()
+            hit = index.query(q)
+            lookups.append(time.perf_counter() - start)
+            hits += hit is not None and hit[0] == target
+
+            start = time.perf_counter()
+            int(np.argmin(np.bitwise_count(phashes ^ np.uint64(q))))
+            brute.append(time.perf_counter() - start)
+
+        print(f"--- {size} references (built in {build * 1000:.0f}ms, "
+              f"{index.phashes.nbytes + index.dhashes.nbytes} bytes of hashes)")
+        summarize("index lookup", lookups)
+        summarize("bare popcount argmin", brute)
+        print(f"{'recall':<28} {hits / len(queries):.3f}")
+
+    card = synthetic_card("Dark Magician", "LOB-EN005")
+    decoys = [synthetic_card(f"Decoy {i}", f"DCY-{i:03d}") for i in range(20)]
+    index = VisualIndex(
+        list(range(len(decoys) + 1)),
+        [phash(c) for c in [card, *decoys]],
+        [dhash(c) for c in [card, *decoys]],
+    )
+    warped = CVProcessor().detect_card(synthetic_photo(card=card))
+    print(f"end-to-end photo match: {index.query(phash(warped), dhash(warped))} (expected id 0)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Shared helpers for the benchmark scripts.
+
+Benchmarks are run from the repository root, e.g.::
+
+    poetry run python -m backend.benchmarks.bench_scan_load --help
+
+Each script points DATABASE_URL at a throwaway SQLite file unless one is
+already set, so they never touch ``sql_app.db``. Anything that configures the
+app through environment variables must be set before ``load_app()``.
+"""
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+_bench_dir = tempfile.mkdtemp(prefix="cardscope-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_bench_dir}/bench.db")
+
+BENCH_USER = SimpleNamespace(id=1, email="bench@example.com", is_active=1)
+
+
+def synthetic_card(name="Blue-Eyes White Dragon", code="LOB-EN001", size=(630, 880), art_seed=None):
+    """A flat, canonical-looking card with a name band, art box and set code.
+
+    ``art_seed`` paints distinct random shapes into the art box; otherwise it is flat.
+    """
+    w, h = size
+    card = np.full((h, w, 3), 235, np.uint8)
+    cv2.rectangle(card, (8, 8), (w - 9, h - 9), (40, 40, 40), 6)
+    x0, y0, x1, y1 = int(w * 0.12), int(h * 0.18), int(w * 0.88), int(h * 0.70)
+    cv2.rectangle(card, (x0, y0), (x1, y1), (90, 120, 160), -1)
+    if art_seed is not None:
+        rng = np.random.default_rng(art_seed)
+        for _ in range(6):
+            center = (int(rng.integers(x0, x1)), int(rng.integers(y0, y1)))
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            cv2.circle(card, center, int(rng.integers(20, (x1 - x0) // 3)), color, -1)
+    scale = w / 630
+    cv2.putText(card, name, (int(w * 0.07), int(h * 0.085)), cv2.FONT_HERSHEY_SIMPLEX,
+                1.0 * scale, (0, 0, 0), max(1, int(2 * scale)), cv2.LINE_AA)
+    cv2.putText(card, code, (int(w * 0.66), int(h * 0.745)), cv2.FONT_HERSHEY_SIMPLEX,
+                0.6 * scale, (0, 0, 0), max(1, int(2 * scale)), cv2.LINE_AA)
+    return card
+
+
+def synthetic_photo(resolution=(3024, 4032), card=None, quality=90):
+    """JPEG bytes of a card lying slightly skewed on a darker table, phone-camera sized."""
+    if card is None:
+        card = synthetic_card()
+    W, H = resolution
+    ch, cw = card.shape[:2]
+    photo = np.full((H, W, 3), 60, np.uint8)
+    cv2.randu(photo, 40, 80)
+
+    target_h = H * 0.7
+    target_w = target_h * cw / ch
+    cx, cy = W / 2, H / 2
+    skew = target_w * 0.04
+    dst = np.float32([
+        [cx - target_w / 2 + skew, cy - target_h / 2],
+        [cx + target_w / 2, cy - target_h / 2 + skew],
+        [cx + target_w / 2 - skew, cy + target_h / 2],
+        [cx - target_w / 2, cy + target_h / 2 - skew],
+    ])
+    src = np.float32([[0, 0], [cw - 1, 0], [cw - 1, ch - 1], [0, ch - 1]])
+    M = cv2.getPerspectiveTransform(src, dst)
+    cv2.warpPerspective(card, M, (W, H), dst=photo, borderMode=cv2.BORDER_TRANSPARENT)
+    ok, buf = cv2.imencode(".jpg", photo, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def synthetic_page(rows=3, cols=3, resolution=(3024, 4032), quality=90):
+    """JPEG bytes of a binder page: a grid of distinct cards on a dark sheet."""
+    W, H = resolution
+    page = np.full((H, W, 3), 30, np.uint8)
+    cv2.randu(page, 20, 45)
+    cw = int(W * 0.9 / cols)
+    ch = int(cw * 88 / 63)
+    gap_x, gap_y = (W - cols * cw) // (cols + 1), (H - rows * ch) // (rows + 1)
+    for r in range(rows):
+        for c in range(cols):
+            card = cv2.resize(synthetic_card(f"Card {r}{c}", f"LOB-0{r}{c}"), (cw, ch), interpolation=cv2.INTER_AREA)
+            y, x = gap_y + r * (ch + gap_y), gap_x + c * (cw + gap_x)
+            page[y:y + ch, x:x + cw] = card
+    return cv2.imencode(".jpg", page, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize(label, seconds):
+    ms = [s * 1000 for s in seconds]
+    print(f"{label:<28} n={len(ms):<6} p50={percentile(ms, 50):8.1f}ms  p99={percentile(ms, 99):8.1f}ms")
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+class ThreadedServer:
+    """Serve an ASGI app with uvicorn on a background thread and a free local port.
+
+    Unlike httpx's ASGITransport, responses really stream to the client.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.port = None
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        import socket
+        import threading
+
+        import uvicorn
+
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        config = uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        self._thread.join()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+
+def load_app():
+    """Import the FastAPI app with tables created and auth short-circuited to BENCH_USER."""
+    from ..app.main import app
+    from ..app.api.auth import get_current_user, get_websocket_user
+    from ..app.migrations import migrate
+    from ..app.services.container import ServiceContainer
+
+    migrate()
+
+    app.dependency_overrides[get_current_user] = lambda: BENCH_USER
+    app.dependency_overrides[get_websocket_user] = lambda: BENCH_USER
+    # httpx's ASGITransport skips the lifespan hook; a real server (ThreadedServer) replaces this
+    app.state.services = ServiceContainer()
+    return app
@@ -0,0 +1,45 @@
+"""Earlier OCR pipelines, kept only as baselines for the benchmarks.
+
+The app recognises cards through the cascade (``services/cascade.py``); these read
+more of the card up front, the way scans used to.
+"""
+import cv2
+
+
+def read_bands(processor, img, layouts=None):
+    """OCR the name and code bands of every layout: {game: {"name": str, "code": str}}."""
+    # Imported here so a benchmark can set OCR_BAND_THREADS first
+    from ..app.cv import processor as cv_processor
+    from ..app.cv.layouts import LAYOUTS
+
+    layouts = layouts or list(LAYOUTS.values())
+    jobs = []
+    for layout in layouts:
+        for band in layout.bands:
+            jobs.append((layout, band, processor._preprocess_band(band.crop(img))))
+
+    def ocr(job):
+        _, band, crop = job
+        return processor._ocr(crop, psm=band.psm)
+
+    if cv_processor.OCR_BAND_THREADS > 1:
+        texts = list(cv_processor._get_band_executor().map(ocr, jobs))
+    else:
+        texts = [ocr(job) for job in jobs]
+
+    result = {}
+    for (layout, band, _), text in zip(jobs, texts):
+        entry = result.setdefault(layout.game, {"name": "", "code": ""})
+        if band is layout.name_band:
+            entry["name"] = text.strip()
+        else:
+            entry["code"] = "\n".join(filter(None, [entry["code"], text.strip()]))
+    return result
+
+
+def extract_card_code(processor, img):
+    """OCR the bottom 20% of the card, where codes usually are, as one block of text."""
+    h, w = img.shape[:2]
+    gray = cv2.cvtColor(img[int(h * 0.80):h, 0:w], cv2.COLOR_BGR2GRAY)
+    thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    return processor._ocr(thresh, psm=6)
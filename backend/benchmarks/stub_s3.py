@@ -0,0 +1,60 @@
+"""Local stand-in for an S3-compatible bucket (path-style, as MinIO serves it).
+
+Supports the calls S3Service makes: PUT and HEAD of objects, plus GET for checking
+what was stored. ``delay`` simulates the upload round trip from the API host.
+"""
+import asyncio
+
+from fastapi import FastAPI, Request, Response
+
+from .common import ThreadedServer
+
+
+def _decode_aws_chunked(body):
+    # botocore may stream the body as aws-chunked with a trailing checksum
+    out, pos = bytearray(), 0
+    while True:
+        end = body.index(b"\r\n", pos)
+        size = int(body[pos:end].split(b";")[0], 16)
+        if size == 0:
+            return bytes(out)
+        out += body[end + 2:end + 2 + size]
+        pos = end + 2 + size + 2
+
+
+class StubS3(ThreadedServer):
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.objects = {}
+        self.requests = {"put": 0, "head": 0}
+        super().__init__(self._build_app())
+
+    def _build_app(self):
+        app = FastAPI()
+
+        @app.put("/{bucket}/{key:path}")
+        async def put(bucket: str, key: str, request: Request):
+            self.requests["put"] += 1
+            body = await request.body()
+            if "aws-chunked" in request.headers.get("content-encoding", ""):
+                body = _decode_aws_chunked(body)
+            await asyncio.sleep(self.delay)
+            self.objects[(bucket, key)] = body
+            return Response(headers={"ETag": '"stub"'})
+
+        @app.head("/{bucket}/{key:path}")
+        async def head(bucket: str, key: str):
+            self.requests["head"] += 1
+            body = self.objects.get((bucket, key))
+            if body is None:
+                return Response(status_code=404)
+            return Response(headers={"Content-Length": str(len(body)), "ETag": '"stub"'})
+
+        @app.get("/{bucket}/{key:path}")
+        async def get(bucket: str, key: str):
+            body = self.objects.get((bucket, key))
+            if body is None:
+                return Response(status_code=404)
+            return Response(body, media_type="image/jpeg")
+
+        return app
@@ -0,0 +1,103 @@
+"""Local stand-in for YGOPRODeck and pokemontcg.io, served by uvicorn on a background thread.
+
+Only codes listed in YGO_CARDS / POKEMON_CARDS (or the catalogs passed in) resolve;
+everything else gets the same "no card" answer the real APIs give. Batched lookups
+work as upstream: YGOPRODeck ``name=A|B`` and pokemontcg.io ``set.id:x (number:1 OR
+number:2)``. ``delay`` simulates upstream latency and ``rate`` answers 429 to
+requests over that many per second.
+"""
+import asyncio
+import re
+from collections import defaultdict
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from ..app.services.rate_limit import RateLimiter
+from .common import ThreadedServer
+
+YGO_CARDS = {
+    "LOB-001": {"name": "Blue-Eyes White Dragon", "price": "79.99", "rarity": "Ultra Rare"},
+    "LOB-005": {"name": "Dark Magician", "price": "24.50", "rarity": "Ultra Rare"},
+}
+POKEMON_CARDS = {
+    ("sv1", "025"): {"name": "Pikachu", "market": 1.25, "rarity": "Rare"},
+    ("sv1", "199"): {"name": "Charizard ex", "market": 89.0, "rarity": "Special Illustration Rare"},
+}
+
+
+class StubUpstream(ThreadedServer):
+    def __init__(self, delay=0.05, ygo_cards=None, pokemon_cards=None, rate=None):
+        self.delay = delay
+        self.ygo_cards = YGO_CARDS if ygo_cards is None else ygo_cards
+        self.pokemon_cards = POKEMON_CARDS if pokemon_cards is None else pokemon_cards
+        self.ygo_by_name = defaultdict(list)
+        for code, card in self.ygo_cards.items():
+            self.ygo_by_name[card["name"]].append(code)
+        self.limiter = RateLimiter(rate, max(1, int(rate))) if rate else None
+        self.requests = {"ygo": 0, "pokemon": 0, "throttled": 0}
+        super().__init__(self._build_app())
+
+    def _throttled(self, upstream):
+        if self.limiter and self.limiter.acquire(upstream):
+            self.requests["throttled"] += 1
+            return JSONResponse({"error": "Rate limit exceeded"}, 429, headers={"Retry-After": "1"})
+        return None
+
+    def _build_app(self):
+        app = FastAPI()
+
+        @app.get("/ygo")
+        async def ygo(request: Request):
+            if throttled := self._throttled("ygo"):
+                return throttled
+            self.requests["ygo"] += 1
+            await asyncio.sleep(self.delay)
+            if "name" in request.query_params:
+                names = request.query_params["name"].split("|")
+                if not all(name in self.ygo_by_name for name in names):
+                    # Upstream fails the whole query when any name is unknown
+                    names = []
+                groups = [(name, self.ygo_by_name[name]) for name in names]
+            else:
+                codes = request.query_params.get("cardset", "").upper().split(",")
+                groups = [(self.ygo_cards[code]["name"], [code]) for code in codes if code in self.ygo_cards]
+            data = []
+            for name, codes in groups:
+                data.append({
+                    "name": name,
+                    "desc": f"{name} (stub)",
+                    "card_sets": [{"set_code": code, "set_price": self.ygo_cards[code]["price"],
+                                   "set_rarity": self.ygo_cards[code]["rarity"]} for code in codes],
+                    "card_images": [{"image_url": f"https://images.example/{codes[0]}.jpg"}],
+                })
+            if not data:
+                return JSONResponse({"error": "No card matching your query was found in the database."}, 400)
+            return {"data": data}
+
+        @app.get("/pokemon")
+        async def pokemon(request: Request):
+            if throttled := self._throttled("pokemon"):
+                return throttled
+            self.requests["pokemon"] += 1
+            await asyncio.sleep(self.delay)
+            query = request.query_params.get("q", "")
+            set_id = re.search(r"set\.id:(\S+)", query)
+            numbers = re.findall(r"number:([^\s)]+)", query)
+            data = []
+            for number in numbers:
+                key = (set_id.group(1) if set_id else "", number)
+                card = self.pokemon_cards.get(key)
+                if not card:
+                    continue
+                data.append({
+                    "name": card["name"],
+                    "number": key[1],
+                    "set": {"id": key[0]},
+                    "rarity": card["rarity"],
+                    "images": {"large": f"https://images.example/{key[0]}-{key[1]}.png"},
+                    "tcgplayer": {"prices": {"holofoil": {"market": card["market"]}}},
+                })
+            return {"data": data}
+
+        return app
@@ -0,0 +1,34 @@
+import threading
+
+from backend.app.services.s3_service import BackgroundUploader
+
+
+class FlakyService:
+    """Stands in for S3Service: the first put raises a non-boto error, later ones succeed."""
+
+    def __init__(self):
+        self.stored = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def put(self, image_bytes, object_name, skip_existing=False):
+        with self._lock:
+            self.calls += 1
+            if self.calls == 1:
+                raise ValueError("cannot re-encode this image")
+            self.stored.append(object_name)
+
+
+def test_uploader_survives_unexpected_errors():
+    service = FlakyService()
+    uploader = BackgroundUploader(service, workers=1, queue_size=10, retries=0)
+
+    assert uploader.submit(b"broken", "scans/broken.jpg")
+    assert uploader.drain(timeout=5)
+    assert uploader.counters["failed"] == 1
+
+    # The same worker thread is still alive and uploads the next photo
+    assert uploader.submit(b"fine", "scans/fine.jpg")
+    assert uploader.drain(timeout=5)
+    assert service.stored == ["scans/fine.jpg"]
+    assert uploader.counters["uploaded"] == 1
@@ -12,6 +12,7 @@ function App() {
   const [scanning, setScanning] = useState(false);
   const [result, setResult] = useState<any>(null);
   const [library, setLibrary] = useState<any[]>([]);
+  const [libraryCursor, setLibraryCursor] = useState<string | null>(null);
   const [showLibrary, setShowLibrary] = useState(false);
   const videoRef = useRef<HTMLVideoElement>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
@@ -159,16 +160,18 @@ function App() {
     }
   };
 
-  const fetchLibrary = async () => {
+  const fetchLibrary = async (cursor: string | null = null) => {
     try {
-      const response = await fetch(`${getApiHost()}/cards/`, {
+      const query = cursor ? `?cursor=${encodeURIComponent(cursor)}` : '';
+      const response = await fetch(`${getApiHost()}/cards/${query}`, {
         headers: {
           'Authorization': `Bearer ${token}`
         }
       });
       if (response.status === 401) return handleLogout();
       const data = await response.json();
-      setLibrary(data);
+      setLibrary(cursor ? [...library, ...data] : data);
+      setLibraryCursor(response.headers.get('X-Next-Cursor'));
       setShowLibrary(true);
     } catch (err) {
       console.error("Fetch library failed:", err);
@@ -245,7 +248,7 @@ function App() {
               <Camera size={48} />
               <span>Start Scan</span>
             </div>
-            <div className="action-card" onClick={fetchLibrary}>
+            <div className="action-card" onClick={() => fetchLibrary()}>
               <Library size={48} />
               <span>My Library</span>
             </div>
@@ -288,6 +291,11 @@ function App() {
                 ))
               )}
             </div>
+            {libraryCursor && (
+              <button className="secondary-btn" onClick={() => fetchLibrary(libraryCursor)}>
+                Load more
+              </button>
+            )}
           </div>
         )}
 